@@ -0,0 +1,121 @@
+"""
+Human readable descriptions of a page of admin audit events.
+
+AdminAuditEvent.describe() leaves placeholders for the users ({user[id]}) and the documents
+({doc[id]}) it mentions. The resolver collects the ids of all the placeholders on the page, looks
+them up with one query per kind (cached for a short time), and substitutes them in one pass.
+"""
+import html
+import re
+from typing import Dict, Iterable, List, Optional
+
+from arxiv.db.models import Document, TapirNickname, TapirUser
+from sqlalchemy import LargeBinary, and_, cast, select
+from sqlalchemy.orm import Session
+
+from .audit_event import AdminAuditEvent
+from .bizmodels.user_model import chunked
+from .ttl_cache import TTLCache
+
+_PLACEHOLDER = re.compile(r"\{(user|doc)\[([^\]]*)\]\}")
+
+
+def _decode_name(value: bytes | str | None) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bytes):
+        try:
+            return value.decode("utf-8").strip()
+        except UnicodeDecodeError:
+            return value.decode("latin-1").strip()
+    return value.strip()
+
+
+class AuditDescriptionResolver:
+    """
+    :param ttl: seconds to remember a user's or a document's description
+    :param maxsize: number of users, and of documents, to remember
+    """
+
+    def __init__(self, ttl: float = 60.0, maxsize: int = 4096):
+        self._users: TTLCache[str] = TTLCache(maxsize=maxsize, default_ttl=ttl)
+        self._documents: TTLCache[str] = TTLCache(maxsize=maxsize, default_ttl=ttl)
+
+    def resolve_users(self, session: Session, user_ids: Iterable[str]) -> Dict[str, str]:
+        """user id -> "First Last (nickname)", HTML escaped as describe() makes HTML. Unknown users are absent."""
+        resolved, missing = self._from_cache(self._users, user_ids)
+        for chunk in chunked(missing):
+            rows = session.execute(
+                select(TapirUser.user_id,
+                       cast(TapirUser.first_name, LargeBinary).label("first_name"),
+                       cast(TapirUser.last_name, LargeBinary).label("last_name"),
+                       TapirNickname.nickname)
+                .outerjoin(TapirNickname, and_(TapirNickname.user_id == TapirUser.user_id,
+                                               TapirNickname.flag_primary == 1))
+                .where(TapirUser.user_id.in_(chunk))
+            ).all()
+            for row in rows:
+                name = f"{_decode_name(row.first_name)} {_decode_name(row.last_name)}".strip()
+                description = html.escape(f"{name} ({row.nickname})" if row.nickname else name)
+                resolved[str(row.user_id)] = description
+                self._users.put(str(row.user_id), description)
+        return resolved
+
+    def resolve_documents(self, session: Session, document_ids: Iterable[str]) -> Dict[str, str]:
+        """document id -> paper id. Unknown documents are absent."""
+        resolved, missing = self._from_cache(self._documents, document_ids)
+        for chunk in chunked(missing):
+            rows = session.execute(
+                select(Document.document_id, Document.paper_id).where(Document.document_id.in_(chunk))
+            ).all()
+            for row in rows:
+                resolved[str(row.document_id)] = row.paper_id
+                self._documents.put(str(row.document_id), row.paper_id)
+        return resolved
+
+    @staticmethod
+    def _from_cache(cache: TTLCache[str], ids: Iterable[str]) -> tuple[Dict[str, str], List[int]]:
+        resolved: Dict[str, str] = {}
+        missing: List[int] = []
+        for id in set(ids):
+            known = cache.get(id)
+            if known is not None:
+                resolved[id] = known
+            elif id.isdigit():
+                missing.append(int(id))
+        return resolved, missing
+
+    def describe_events(self, session: Session, events: List[AdminAuditEvent]) -> List[str]:
+        """
+        describe() of each event with the user and document placeholders filled in.
+        Unresolvable placeholders are left as they are.
+        """
+        descriptions = [event.describe(session) for event in events]
+
+        user_ids: set[str] = set()
+        document_ids: set[str] = set()
+        for description in descriptions:
+            for kind, id in _PLACEHOLDER.findall(description or ""):
+                (user_ids if kind == "user" else document_ids).add(id)
+
+        names = {
+            "user": self.resolve_users(session, user_ids) if user_ids else {},
+            "doc": self.resolve_documents(session, document_ids) if document_ids else {},
+        }
+
+        def substitute(match: re.Match) -> str:
+            return names[match.group(1)].get(match.group(2), match.group(0))
+
+        return [_PLACEHOLDER.sub(substitute, description) if description else description
+                for description in descriptions]
+
+
+_resolver: Optional[AuditDescriptionResolver] = None
+
+
+def describe_admin_audit_events(session: Session, events: List[AdminAuditEvent]) -> List[str]:
+    """AuditDescriptionResolver.describe_events with the shared resolver."""
+    global _resolver
+    if _resolver is None:
+        _resolver = AuditDescriptionResolver()
+    return _resolver.describe_events(session, events)
@@ -8,11 +8,11 @@ import re
 from abc import abstractmethod
 from datetime import datetime, timezone
 from enum import Enum
-from typing import Optional, Tuple, Dict, Type, Any, List
+from typing import Optional, Tuple, Dict, Type, Any, List, Iterator, Iterable, Callable
 
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from sqlalchemy import func, update, cast, LargeBinary
+from sqlalchemy.orm import Session, Query
+from sqlalchemy import func, cast, insert, select, Select, LargeBinary
 from arxiv.db.models import TapirAdminAudit
 
 from .user_status import UserVetoStatus, UserFlags
@@ -105,6 +105,15 @@ class AdminAuditEvent:
     tracking_cookie: Optional[str]
     _comment: Optional[str]
     _data: Optional[str]
+    # Set when the event is made from a tapir_admin_audit record
+    entry_id: Optional[int]
+
+    # Audit exports decode millions of events - no per-instance __dict__
+    __slots__ = ("admin_user", "affected_user", "session_id", "timestamp", "remote_ip", "remote_hostname",
+                 "tracking_cookie", "_comment", "_data", "entry_id", "_parsed_data")
+
+    # True when the constructor stores the record's data as is, so that decoding a record can skip __init__
+    _verbatim_data: bool = False
 
     def __init__(self,
                  admin_id: str | None,
@@ -139,6 +148,40 @@ class AdminAuditEvent:
         self.tracking_cookie = tracking_cookie if tracking_cookie else ''
         self._comment = comment if comment else ''
         self._data = data if data  else ""
+        self.entry_id = None
+        self._parsed_data = None
+
+    @classmethod
+    def from_record_values(cls, audit_record: TapirAdminAudit, comment: str | None, data: str | None) -> "AdminAuditEvent":
+        """Makes the event from the record without running __init__.
+
+        Only for the classes with _verbatim_data, and flag=value data already in the canonical form.
+
+        :param audit_record: The TapirAdminAudit database record
+        :param comment: decoded comment
+        :param data: decoded data
+        """
+        event = cls.__new__(cls)
+        event.admin_user = audit_record.admin_user
+        event.affected_user = audit_record.affected_user
+        event.session_id = audit_record.session_id
+        timestamp = audit_record.log_date
+        event.timestamp = int(datetime.now(tz=timezone.utc).timestamp()) if timestamp is None else timestamp
+        event.remote_ip = audit_record.ip_addr if audit_record.ip_addr else ''
+        event.remote_hostname = audit_record.remote_host if audit_record.remote_host else ''
+        event.tracking_cookie = audit_record.tracking_cookie if audit_record.tracking_cookie else ''
+        event._comment = comment if comment else ''
+        event._data = data if data else ""
+        event.entry_id = None
+        event._parsed_data = None
+        return event
+
+    def split_data(self, separator: str) -> List[str]:
+        """data split by the separator, parsed once per event. Do not modify the list."""
+        parsed = self._parsed_data
+        if parsed is None or parsed[0] != separator:
+            parsed = self._parsed_data = (separator, self._data.split(separator))
+        return parsed[1]
 
     @property
     def comment(self) -> str:
@@ -179,6 +222,9 @@ class AdminAuditEvent:
     def describe_user(self, _session: Session, id: str) -> str:
         return r"{"+f"user[{id}]"+r"}"
 
+    def describe_document(self, _session: Session, id: str) -> str:
+        return r"{"+f"doc[{id}]"+r"}"
+
     def describe_affected_user(self, session: Session) -> str:
         return self.describe_user(session, self.affected_user)
 
@@ -196,6 +242,8 @@ def doc_href(doc_id, paper_id):
 
 class AdminAudit_AddComment(AdminAuditEvent):
     """Audit event for commenting on a user."""
+    __slots__ = ()
+    _verbatim_data = True
     _action = AdminAuditActionEnum.ADD_COMMENT
     
     def __init__(self, 
@@ -236,6 +284,8 @@ class AdminAudit_PaperEvent(AdminAuditEvent):
 
     :ivar _data: The paper ID associated with this event
     """
+    __slots__ = ()
+    _verbatim_data = True
 
     def __init__(self, *args, **kwargs):
         """Initialize an AdminAudit_PaperEvent.
@@ -282,6 +332,7 @@ class AdminAudit_PaperEvent(AdminAuditEvent):
 
 class AdminAudit_AddPaperOwner(AdminAudit_PaperEvent):
     """Audit event for adding a paper owner to a submission."""
+    __slots__ = ()
     _action = AdminAuditActionEnum.ADD_PAPER_OWNER
 
     def __init__(self, 
@@ -312,11 +363,12 @@ class AdminAudit_AddPaperOwner(AdminAudit_PaperEvent):
 
 
     def describe(self, session: Session) -> str:
-        return f"{self.describe_admin_user(session)} made {self.describe_affected_user(session)} an owner of paper {doc_href(self.data, self.data)}"
+        return f"{self.describe_admin_user(session)} made {self.describe_affected_user(session)} an owner of paper {doc_href(self.data, self.describe_document(session, self.data))}"
 
 
 class AdminAudit_AddPaperOwner2(AdminAudit_PaperEvent):
     """Audit event for adding a paper owner."""
+    __slots__ = ()
     _action = AdminAuditActionEnum.ADD_PAPER_OWNER_2
 
     def __init__(self, 
@@ -346,11 +398,12 @@ class AdminAudit_AddPaperOwner2(AdminAudit_PaperEvent):
                         tracking_cookie=tracking_cookie, comment=comment, timestamp=timestamp)
 
     def describe(self, session: Session) -> str:    
-        return f"{self.describe_admin_user(session)} made {self.describe_affected_user(session)} an owner of paper {doc_href(self.data, self.data)} through the process-ownership screen"
+        return f"{self.describe_admin_user(session)} made {self.describe_affected_user(session)} an owner of paper {doc_href(self.data, self.describe_document(session, self.data))} through the process-ownership screen"
 
 
 class AdminAudit_ChangePaperPassword(AdminAudit_PaperEvent):
     """Audit event for changing a paper's password."""
+    __slots__ = ()
     _action = AdminAuditActionEnum.CHANGE_PAPER_PW
 
     def __init__(self, 
@@ -380,11 +433,12 @@ class AdminAudit_ChangePaperPassword(AdminAudit_PaperEvent):
                         tracking_cookie=tracking_cookie, comment=comment, timestamp=timestamp)
 
     def describe(self, session: Session) -> str:
-        return f"{self.describe_admin_user(session)} changed the paper password for {doc_href(self.data, self.data)} which was submitted by {self.describe_affected_user(session)}"
+        return f"{self.describe_admin_user(session)} changed the paper password for {doc_href(self.data, self.describe_document(session, self.data))} which was submitted by {self.describe_affected_user(session)}"
 
 
 class AdminAudit_AdminChangePaperPassword(AdminAudit_PaperEvent):
     """Audit event for admin-level changing of a paper's password."""
+    __slots__ = ()
     _action =  AdminAuditActionEnum.ARXIV_CHANGE_PAPER_PW
 
     def __init__(self, 
@@ -414,11 +468,12 @@ class AdminAudit_AdminChangePaperPassword(AdminAudit_PaperEvent):
                         tracking_cookie=tracking_cookie, comment=comment, timestamp=timestamp)
 
     def describe(self, session: Session) -> str:
-        return f"{self.describe_admin_user(session)} changed the paper password for {doc_href(self.data, self.data)} which was submitted by {self.describe_affected_user(session)}"
+        return f"{self.describe_admin_user(session)} changed the paper password for {doc_href(self.data, self.describe_document(session, self.data))} which was submitted by {self.describe_affected_user(session)}"
 
 
 class AdminAudit_AdminMakeAuthor(AdminAudit_PaperEvent):
     """Audit event for making a user an author of a paper."""
+    __slots__ = ()
     _action = AdminAuditActionEnum.ARXIV_MAKE_AUTHOR
 
     def __init__(self, 
@@ -448,11 +503,12 @@ class AdminAudit_AdminMakeAuthor(AdminAudit_PaperEvent):
                         tracking_cookie=tracking_cookie, comment=comment, timestamp=timestamp)
 
     def describe(self, session: Session) -> str:
-        return f"{self.describe_admin_user(session)} made {self.describe_affected_user(session)} an author of {doc_href(self.data, self.data)}"        
+        return f"{self.describe_admin_user(session)} made {self.describe_affected_user(session)} an author of {doc_href(self.data, self.describe_document(session, self.data))}"        
 
 
 class AdminAudit_AdminMakeNonauthor(AdminAudit_PaperEvent):
     """Audit event for removing a user's authorship of a paper."""
+    __slots__ = ()
     _action = AdminAuditActionEnum.ARXIV_MAKE_NONAUTHOR
 
     def __init__(self, 
@@ -482,11 +538,12 @@ class AdminAudit_AdminMakeNonauthor(AdminAudit_PaperEvent):
                         tracking_cookie=tracking_cookie, comment=comment, timestamp=timestamp)
     
     def describe(self, session: Session) -> str:
-        return f"{self.describe_admin_user(session)} made {self.describe_affected_user(session)} a nonauthor of {doc_href(self.data, self.data)}"
+        return f"{self.describe_admin_user(session)} made {self.describe_affected_user(session)} a nonauthor of {doc_href(self.data, self.describe_document(session, self.data))}"
 
 
 class AdminAudit_AdminRevokePaperOwner(AdminAudit_PaperEvent):
     """Audit event for revoking a user's paper ownership."""
+    __slots__ = ()
     _action = AdminAuditActionEnum.ARXIV_REVOKE_PAPER_OWNER
 
     def __init__(self, 
@@ -516,11 +573,12 @@ class AdminAudit_AdminRevokePaperOwner(AdminAudit_PaperEvent):
                         tracking_cookie=tracking_cookie, comment=comment, timestamp=timestamp)
 
     def describe(self, session: Session) -> str:
-        return f"{self.describe_admin_user(session)} revoked {self.describe_affected_user(session)} the ownership of {doc_href(self.data, self.data)}"
+        return f"{self.describe_admin_user(session)} revoked {self.describe_affected_user(session)} the ownership of {doc_href(self.data, self.describe_document(session, self.data))}"
 
 
 class AdminAudit_AdminUnrevokePaperOwner(AdminAudit_PaperEvent):
     """Audit event for restoring a user's paper ownership."""
+    __slots__ = ()
     _action = AdminAuditActionEnum.ARXIV_UNREVOKE_PAPER_OWNER
 
     def __init__(self, 
@@ -550,10 +608,11 @@ class AdminAudit_AdminUnrevokePaperOwner(AdminAudit_PaperEvent):
                         tracking_cookie=tracking_cookie, comment=comment, timestamp=timestamp)
 
     def describe(self, session: Session) -> str:
-        return f"{self.describe_admin_user(session)} restored {self.describe_affected_user(session)} the ownership of {doc_href(self.data, self.data)}"
+        return f"{self.describe_admin_user(session)} restored {self.describe_affected_user(session)} the ownership of {doc_href(self.data, self.describe_document(session, self.data))}"
 
 class AdminAudit_AdminNotArxivRevokePaperOwner(AdminAudit_PaperEvent):
     """Audit event for revoking a user's paper ownership (non-arXiv specific)."""
+    __slots__ = ()
     _action = AdminAuditActionEnum.REVOKE_PAPER_OWNER
 
     def __init__(self, 
@@ -583,7 +642,7 @@ class AdminAudit_AdminNotArxivRevokePaperOwner(AdminAudit_PaperEvent):
                         tracking_cookie=tracking_cookie, comment=comment, timestamp=timestamp)
 
     def describe(self, session: Session) -> str:
-        return f"{self.describe_admin_user(session)} revoked {self.describe_affected_user(session)} the ownership of {doc_href(self.data, self.data)}"
+        return f"{self.describe_admin_user(session)} revoked {self.describe_affected_user(session)} the ownership of {doc_href(self.data, self.describe_document(session, self.data))}"
 
 
 
@@ -594,6 +653,7 @@ class AdminAudit_BecomeUser(AdminAuditEvent):
     functionality to impersonate another user for support purposes.
     The new session ID is stored as data.
     """
+    __slots__ = ()
     _action = AdminAuditActionEnum.BECOME_USER
 
     def __init__(self, *argc, **kwargs):
@@ -649,6 +709,7 @@ class AdminAudit_ChangeEmail(AdminAuditEvent):
     This event is logged when an administrator changes a user's email address.
     The new email address is validated and stored as data.
     """
+    __slots__ = ()
     _action = AdminAuditActionEnum.CHANGE_EMAIL
 
     @classmethod
@@ -709,6 +770,8 @@ class AdminAudit_ChangePassword(AdminAuditEvent):
     This event is logged when an administrator changes a user's password.
     No additional data or comment is stored for security reasons.
     """
+    __slots__ = ()
+    _verbatim_data = True
     _action = AdminAuditActionEnum.CHANGE_PASSWORD
 
     def __init__(self, 
@@ -756,6 +819,7 @@ class AuditAction(BaseModel):
 
 class AdminAudit_GenericPayload(AdminAuditEvent):
     """Audit event for generic payloads."""
+    __slots__ = ()
 
     @classmethod
     @property
@@ -819,6 +883,7 @@ class AdminAudit_ChangeDemographic(AdminAudit_GenericPayload):
     This event is logged when an administrator changes a user's demographic data.
     The new demographic data is stored as a JSON string.
     """
+    __slots__ = ()
     _action = AdminAuditActionEnum.CHANGE_DEMOGRAPHIC
 
     def __init__(self, *argc, **kwargs):
@@ -852,6 +917,7 @@ class AdminAudit_ChangeDemographic(AdminAudit_GenericPayload):
 
 class AdminAudit_ArxivAdmin(AdminAudit_GenericPayload):
     """arXiv admin audit event."""
+    __slots__ = ()
 
     def __init__(self,  admin_id: int, session_id: int, **kwargs):
         """Change category audit event..
@@ -890,6 +956,7 @@ class AdminAudit_ArxivAdmin(AdminAudit_GenericPayload):
 
 class AdminAudit_Category(AdminAudit_ArxivAdmin):
     """arXiv category audit event."""
+    __slots__ = ()
     _action = AdminAuditActionEnum.ARXIV_CATEGORY
 
     def __init__(self,  *args, **kwargs):
@@ -929,6 +996,7 @@ class AdminAudit_Category(AdminAudit_ArxivAdmin):
 
 class AdminAudit_EndorsementDomains(AdminAudit_ArxivAdmin):
     """arXiv endorsement domain audit event."""
+    __slots__ = ()
     _action = AdminAuditActionEnum.ARXIV_ENDORSEMENT_DOMAINS
 
     def __init__(self, *args, **kwargs):
@@ -968,6 +1036,7 @@ class AdminAudit_EndorsementDomains(AdminAudit_ArxivAdmin):
 
 class AdminAudit_EmailPatterns(AdminAudit_ArxivAdmin):
     """arXiv email pattern audit event."""
+    __slots__ = ()
     _action = AdminAuditActionEnum.ARXIV_EMAIL_PATTERNS
 
     def __init__(self,  *args, **kwargs):
@@ -1010,6 +1079,7 @@ class AdminAudit_EndorseEvent(AdminAuditEvent):
     This class handles audit events that involve endorsement actions,
     storing the endorser ID, endorsee ID, and category as data.
     """
+    __slots__ = ()
     def __init__(self, *argc, **kwargs):
         """Initialize an AdminAudit_EndorseEvent.
 
@@ -1074,7 +1144,7 @@ class AdminAudit_EndorseEvent(AdminAuditEvent):
         }
 
     def describe(self, session: Session) -> str:
-        data = self.data.split(" ")
+        data = self.split_data(" ")
         if len(data) == 3:
             endorser = data[0]
             category = data[1]
@@ -1085,6 +1155,7 @@ class AdminAudit_EndorseEvent(AdminAuditEvent):
 
 class AdminAudit_EndorsedBySuspect(AdminAudit_EndorseEvent):
     """Audit event for when a user is endorsed by a suspect user."""
+    __slots__ = ()
     _action = AdminAuditActionEnum.ENDORSED_BY_SUSPECT
 
     def __init__(self, 
@@ -1119,7 +1190,7 @@ class AdminAudit_EndorsedBySuspect(AdminAudit_EndorseEvent):
                         comment=comment, timestamp=timestamp)
 
     def describe(self, session: Session) -> str:
-        data = self.data.split(" ")
+        data = self.split_data(" ")
         if len(data) == 3:
             endorser = data[0]
             category = data[1]
@@ -1130,6 +1201,7 @@ class AdminAudit_EndorsedBySuspect(AdminAudit_EndorseEvent):
 
 class AdminAudit_GotNegativeEndorsement(AdminAudit_EndorseEvent):
     """Audit event for when a user receives a negative endorsement."""
+    __slots__ = ()
     _action = AdminAuditActionEnum.GOT_NEGATIVE_ENDORSEMENT
 
     def __init__(self, 
@@ -1164,7 +1236,7 @@ class AdminAudit_GotNegativeEndorsement(AdminAudit_EndorseEvent):
                         comment=comment, timestamp=timestamp)
 
     def describe(self, session: Session) -> str:
-        data = self.data.split(" ")
+        data = self.split_data(" ")
         if len(data) == 3:
             endorser = data[0]
             category = data[1]
@@ -1179,6 +1251,8 @@ class AdminAudit_MakeModerator(AdminAuditEvent):
     This event is logged when an administrator grants moderator privileges
     to a user for a specific category. The category is stored as data.
     """
+    __slots__ = ()
+    _verbatim_data = True
     _action = AdminAuditActionEnum.MAKE_MODERATOR
 
     @classmethod
@@ -1232,6 +1306,8 @@ class AdminAudit_UnmakeModerator(AdminAuditEvent):
     This event is logged when an administrator revokes moderator privileges
     from a user for a specific category. The category is stored as data.
     """
+    __slots__ = ()
+    _verbatim_data = True
     _action = AdminAuditActionEnum.UNMAKE_MODERATOR
 
     @classmethod
@@ -1286,6 +1362,7 @@ class AdminAudit_SuspendUser(AdminAuditEvent):
     The banned flag is automatically set to 1 and a comment is required
     to explain the reason for suspension.
     """
+    __slots__ = ()
     _action = AdminAuditActionEnum.SUSPEND_USER
 
     def __init__(self, *argc, **kwargs):
@@ -1331,6 +1408,7 @@ class AdminAudit_UnuspendUser(AdminAuditEvent):
     The banned flag is automatically set to 0 and a comment is required
     to explain the reason for unsuspension.
     """
+    __slots__ = ()
     _action = AdminAuditActionEnum.UNSUSPEND_USER
 
     def __init__(self, *argc, **kwargs):
@@ -1376,6 +1454,7 @@ class AdminAudit_ChangeStatus(AdminAuditEvent):
     The before and after status values are stored as data in the format
     'before_status -> after_status'.
     """
+    __slots__ = ()
     _action = AdminAuditActionEnum.ARXIV_CHANGE_STATUS
 
     def __init__(self, *argc, **kwargs):
@@ -1440,6 +1519,7 @@ class AdminAudit_SetFlag(AdminAuditEvent):
               AdminAudit_SetProxy, etc. The flag_param placeholder represents the
               actual parameter name specific to each subclass.
     """
+    __slots__ = ()
     _action = AdminAuditActionEnum.FLIP_FLAG
     _flag: UserFlags
     _value_name: str
@@ -1476,7 +1556,12 @@ class AdminAudit_SetFlag(AdminAuditEvent):
             boolean_value = 1 if normalized else 0
             data = f"{self._flag.value}={boolean_value}"
         elif self._value_type is int:
-            data = f"{self._flag.value}={kwargs.pop(self._value_name)}"
+            value = kwargs.pop(self._value_name)
+            try:
+                int_value = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid value for flag {self._flag.value}: {value!r}") from None
+            data = f"{self._flag.value}={int_value}"
         elif self._value_type is str:
             data = f"{self._flag.value}={kwargs.pop(self._value_name)}"
         else:
@@ -1522,7 +1607,7 @@ class AdminAudit_SetFlag(AdminAuditEvent):
         }
 
     def describe(self, session: Session) -> str:
-        elements = self.data.split("=")
+        elements = self.split_data("=")
         if len(elements) == 2:
             value1 = elements[1]
             if self._value_type is bool:
@@ -1536,6 +1621,7 @@ class AdminAudit_SetFlag(AdminAuditEvent):
 
 class AdminAudit_SetGroupTest(AdminAudit_SetFlag):
     """Audit event for setting/unsetting the group test flag."""
+    __slots__ = ()
     _flag = UserFlags.ARXIV_FLAG_GROUP_TEST
     _value_name = "group_test"
     _value_type = bool
@@ -1568,6 +1654,7 @@ class AdminAudit_SetGroupTest(AdminAudit_SetFlag):
 
 class AdminAudit_SetProxy(AdminAudit_SetFlag):
     """Audit event for setting/unsetting the proxy flag."""
+    __slots__ = ()
     _flag = UserFlags.ARXIV_FLAG_PROXY
     _value_name = "proxy"
     _value_type = bool
@@ -1600,6 +1687,7 @@ class AdminAudit_SetProxy(AdminAudit_SetFlag):
 
 class AdminAudit_SetSuspect(AdminAudit_SetFlag):
     """Audit event for setting/unsetting the suspect flag."""
+    __slots__ = ()
     _flag = UserFlags.ARXIV_FLAG_SUSPECT
     _value_name = "suspect"
     _value_type = bool
@@ -1632,6 +1720,7 @@ class AdminAudit_SetSuspect(AdminAudit_SetFlag):
 
 class AdminAudit_SetXml(AdminAudit_SetFlag):
     """Audit event for setting/unsetting the XML flag."""
+    __slots__ = ()
     _flag = UserFlags.ARXIV_FLAG_XML
     _value_name = "xml"
     _value_type = bool
@@ -1664,6 +1753,7 @@ class AdminAudit_SetXml(AdminAudit_SetFlag):
 
 class AdminAudit_SetEndorsementValid(AdminAudit_SetFlag):
     """Audit event for setting/unsetting the endorsement valid flag."""
+    __slots__ = ()
     _flag = UserFlags.ARXIV_ENDORSEMENT_FLAG_VALID
     _value_name = "endorsement_valid"
     _value_type = bool
@@ -1696,6 +1786,7 @@ class AdminAudit_SetEndorsementValid(AdminAudit_SetFlag):
 
 class AdminAudit_SetPointValue(AdminAudit_SetFlag):
     """Audit event for setting the endorsement point value."""
+    __slots__ = ()
     _flag = UserFlags.ARXIV_ENDORSEMENT_POINT_VALUE
     _value_name = "point_value"
     _value_type = int
@@ -1728,6 +1819,7 @@ class AdminAudit_SetPointValue(AdminAudit_SetFlag):
 
 class AdminAudit_SetEndorsementRequestsValid(AdminAudit_SetFlag):
     """Audit event for setting/unsetting the endorsement requests valid flag."""
+    __slots__ = ()
     _flag = UserFlags.ARXIV_ENDORSEMENT_REQUEST_FLAG_VALID
     _value_name = "endorsement_requests_valid"
     _value_type = bool
@@ -1760,6 +1852,7 @@ class AdminAudit_SetEndorsementRequestsValid(AdminAudit_SetFlag):
 
 class AdminAudit_SetEmailBouncing(AdminAudit_SetFlag):
     """Audit event for setting/unsetting the email bouncing flag."""
+    __slots__ = ()
     _flag = UserFlags.TAPIR_EMAIL_BOUNCING
     _value_name = "email_bouncing"
     _value_type = bool
@@ -1792,6 +1885,7 @@ class AdminAudit_SetEmailBouncing(AdminAudit_SetFlag):
 
 class AdminAudit_SetBanned(AdminAudit_SetFlag):
     """Audit event for setting/unsetting the banned flag."""
+    __slots__ = ()
     _flag = UserFlags.TAPIR_FLAG_BANNED
     _value_name = "banned"
     _value_type = bool
@@ -1823,7 +1917,7 @@ class AdminAudit_SetBanned(AdminAudit_SetFlag):
                         tracking_cookie=tracking_cookie, comment=comment, timestamp=timestamp)
 
     def describe(self, session: Session) -> str:
-        elements = self.data.split("=")
+        elements = self.split_data("=")
         if len(elements) == 2:
             value1 = elements[1]
             if int(value1):
@@ -1836,6 +1930,7 @@ class AdminAudit_SetBanned(AdminAudit_SetFlag):
 
 class AdminAudit_SetEditSystem(AdminAudit_SetFlag):
     """Audit event for setting/unsetting the edit system flag (sysad privileges)."""
+    __slots__ = ()
     _flag = UserFlags.TAPIR_FLAG_EDIT_SYSTEM
     _value_name = "edit_system"
     _value_type = bool
@@ -1867,7 +1962,7 @@ class AdminAudit_SetEditSystem(AdminAudit_SetFlag):
                         tracking_cookie=tracking_cookie, comment=comment, timestamp=timestamp)
 
     def describe(self, session: Session) -> str:
-        elements = self.data.split("=")
+        elements = self.split_data("=")
         if len(elements) == 2:
             value1 = elements[1]
             if int(value1):
@@ -1880,6 +1975,7 @@ class AdminAudit_SetEditSystem(AdminAudit_SetFlag):
 
 class AdminAudit_SetEditUsers(AdminAudit_SetFlag):
     """Audit event for setting/unsetting the edit users flag (admin privileges)."""
+    __slots__ = ()
     _flag = UserFlags.TAPIR_FLAG_EDIT_USERS
     _value_name = "edit_users"
     _value_type = bool
@@ -1911,7 +2007,7 @@ class AdminAudit_SetEditUsers(AdminAudit_SetFlag):
                         tracking_cookie=tracking_cookie, comment=comment, timestamp=timestamp)
 
     def describe(self, session: Session) -> str:
-        elements = self.data.split("=")
+        elements = self.split_data("=")
         if len(elements) == 2:
             value1 = elements[1]
             if int(value1):
@@ -1923,6 +2019,7 @@ class AdminAudit_SetEditUsers(AdminAudit_SetFlag):
 
 class AdminAudit_SetEmailVerified(AdminAudit_SetFlag):
     """Audit event for setting/unsetting the email verified flag."""
+    __slots__ = ()
     _flag = UserFlags.TAPIR_FLAG_EMAIL_VERIFIED
     _value_name = "verified"
     _value_type = bool
@@ -1954,7 +2051,7 @@ class AdminAudit_SetEmailVerified(AdminAudit_SetFlag):
                         tracking_cookie=tracking_cookie, comment=comment, timestamp=timestamp)
 
     def describe(self, session: Session) -> str:
-        elements = self.data.split("=")
+        elements = self.split_data("=")
         if len(elements) == 2:
             value1 = elements[1]
             if int(value1):
@@ -1967,6 +2064,7 @@ class AdminAudit_SetEmailVerified(AdminAudit_SetFlag):
 
 class AdminAudit_SetCanLock(AdminAudit_SetFlag):
     """Audit event for setting/unsetting the can_lock flag."""
+    __slots__ = ()
     _flag = UserFlags.TAPIR_FLAG_CAN_LOCK
     _value_name = "can_lock"
     _value_type = bool
@@ -1998,7 +2096,7 @@ class AdminAudit_SetCanLock(AdminAudit_SetFlag):
                         tracking_cookie=tracking_cookie, comment=comment, timestamp=timestamp)
 
     def describe(self, session: Session) -> str:
-        elements = self.data.split("=")
+        elements = self.split_data("=")
         if len(elements) == 2:
             value1 = elements[1]
             if int(value1):
@@ -2028,41 +2126,63 @@ def admin_audit(session: Session, event: AdminAuditEvent) -> TapirAdminAudit:
         - timestamp: Optional timestamp; if None, current UTC time is used
     """
 
-    timestamp = event.timestamp if event.timestamp else int(time.time())
-    
-    # Create entry without comment first
-    entry = TapirAdminAudit(
-        log_date=timestamp,
-        session_id=event.session_id,
-        ip_addr=event.remote_ip if event.remote_ip else '',
-        remote_host=event.remote_hostname if event.remote_hostname else '',
-        admin_user=int(event.admin_user) if event.admin_user else None,
-        affected_user=int(event.affected_user) if event.affected_user else 0,
-        tracking_cookie=event.tracking_cookie if event.tracking_cookie else '',
-        action=event.action,
-        data='',     # Temporary empty string
-        comment='',  # Temporary empty string
-    )
-    session.add(entry)
-    session.flush()  # Get the entry_id
-    
-    # Update data and comment - use binary encoding if column is latin1
-    if is_column_latin1(session, 'tapir_admin_audit', 'data'):
-        comment_utf8 = (event.comment if event.comment else '').encode('utf-8')
-        data_utf8 = (event.data if event.data else '').encode('utf-8')
-        session.execute(
-            update(TapirAdminAudit.__table__)
-            .where(TapirAdminAudit.entry_id == entry.entry_id)
-            .values(data=func.binary(data_utf8), comment=func.binary(comment_utf8)))
-    else:
-        session.execute(
-            update(TapirAdminAudit.__table__)
-            .where(TapirAdminAudit.entry_id == entry.entry_id)
-            .values(data=event.data, comment=event.comment))
-
+    values = _encode_admin_audit_row(admin_audit_row(event), is_column_latin1(session, 'tapir_admin_audit', 'data'))
+    # One INSERT with the payload in it. The ORM-enabled insert autoflushes the pending changes first.
+    result = session.execute(insert(TapirAdminAudit).values(**values))
+    entry = TapirAdminAudit(**dict(values, data=event.data, comment=event.comment))
+    entry.entry_id = result.inserted_primary_key[0]
     return entry
 
 
+def admin_audit_events(session: Session, events: Iterable[AdminAuditEvent]) -> int:
+    """Audit function for an admin action that produces several events.
+
+    Writes all the events with one multi-row INSERT.
+
+    :param session: SQLAlchemy database session for persisting the audit records
+    :param events: The AdminAuditEvents, see admin_audit
+    :return: number of audit records written
+    """
+    return insert_admin_audit_rows(session, [admin_audit_row(event) for event in events])
+
+
+def admin_audit_row(event: AdminAuditEvent) -> Dict[str, Any]:
+    """Column values of the audit record of the event, as plain (JSON serializable) values."""
+    return {
+        "log_date": event.timestamp if event.timestamp else int(time.time()),
+        "session_id": event.session_id,
+        "ip_addr": event.remote_ip if event.remote_ip else '',
+        "remote_host": event.remote_hostname if event.remote_hostname else '',
+        "admin_user": int(event.admin_user) if event.admin_user else None,
+        "affected_user": int(event.affected_user) if event.affected_user else 0,
+        "tracking_cookie": event.tracking_cookie if event.tracking_cookie else '',
+        "action": event.action.value,
+        "data": event.data if event.data else '',
+        "comment": event.comment if event.comment else '',
+    }
+
+
+def insert_admin_audit_rows(session: Session, rows: List[Dict[str, Any]]) -> int:
+    """Writes admin_audit_row values with one multi-row INSERT.
+
+    :return: number of audit records written
+    """
+    if not rows:
+        return 0
+    latin1 = is_column_latin1(session, 'tapir_admin_audit', 'data')
+    session.execute(insert(TapirAdminAudit).values([_encode_admin_audit_row(row, latin1) for row in rows]))
+    return len(rows)
+
+
+def _encode_admin_audit_row(row: Dict[str, Any], latin1: bool) -> Dict[str, Any]:
+    """When the column is latin1, data and comment go in as binary UTF-8 so that MySQL does not transcode them."""
+    if not latin1:
+        return row
+    return dict(row,
+                data=func.binary(row["data"].encode('utf-8')),
+                comment=func.binary(row["comment"].encode('utf-8')))
+
+
 # noinspection PyTypeChecker
 flag_setter_classes: Dict[str, Type[AdminAudit_SetFlag]] = {
     cls._flag.value : cls for cls in [
@@ -2126,6 +2246,97 @@ event_classes: Dict[str, AdminAuditEvent] = {
 }
 
 
+def _decode_binary_column(binary: bytes | None, fallback: str | None) -> str:
+    """UTF-8 decode of a BLOB-cast column. Falls back to the column value as read when it is not UTF-8."""
+    if not binary:
+        return ""
+    try:
+        return binary.decode('utf-8')
+    except UnicodeDecodeError:
+        return fallback
+
+
+AdminAuditDecoder = Callable[[TapirAdminAudit, Optional[bytes], Optional[bytes], bool], AdminAuditEvent]
+
+
+def _constructor_decoder(event_class: Type[AdminAuditEvent]) -> AdminAuditDecoder:
+    """Decoder going through get_init_params and the constructor, which validate the data."""
+    get_init_params = event_class.get_init_params
+
+    def decode(audit_record: TapirAdminAudit, comment_binary: bytes | None, data_binary: bytes | None,
+               use_binary: bool) -> AdminAuditEvent:
+        args, kwargs = get_init_params(audit_record)
+        if use_binary:
+            if "comment" in kwargs:
+                kwargs["comment"] = _decode_binary_column(comment_binary, audit_record.comment)
+            if "data" in kwargs:
+                kwargs["data"] = _decode_binary_column(data_binary, audit_record.data)
+        return event_class(*args, **kwargs)
+    return decode
+
+
+def _verbatim_decoder(event_class: Type[AdminAuditEvent]) -> AdminAuditDecoder:
+    """Decoder for the classes whose constructor stores the data as is."""
+    from_record_values = event_class.from_record_values
+
+    def decode(audit_record: TapirAdminAudit, comment_binary: bytes | None, data_binary: bytes | None,
+               use_binary: bool) -> AdminAuditEvent:
+        if use_binary:
+            return from_record_values(audit_record,
+                                      _decode_binary_column(comment_binary, audit_record.comment),
+                                      _decode_binary_column(data_binary, audit_record.data))
+        return from_record_values(audit_record, audit_record.comment, audit_record.data)
+    return decode
+
+
+def _is_canonical_flag_value(event_class: Type[AdminAuditEvent], value: str) -> bool:
+    """The value as the constructor writes it - 0/1 for a bool flag, digits for an int flag."""
+    if event_class._value_type is bool:
+        return value in ("0", "1")
+    if event_class._value_type is int:
+        return value.lstrip("-").isdigit()
+    return False
+
+
+def _flip_flag_decoder(audit_record: TapirAdminAudit, comment_binary: bytes | None, data_binary: bytes | None,
+                       use_binary: bool) -> AdminAuditEvent:
+    """flip-flag records are the bulk of the audit log. Canonical flag=value data skips the constructor."""
+    elements = audit_record.data.split("=")
+    event_class = flag_setter_classes.get(elements[0]) if len(elements) == 2 else None
+    if event_class is None or not _is_canonical_flag_value(event_class, elements[1]):
+        # Not canonical, or not valid - the instantiator normalizes or raises
+        event = admin_audit_flip_flag_instantiator(audit_record)
+        if use_binary:
+            event._comment = _decode_binary_column(comment_binary, audit_record.comment)
+        return event
+
+    comment = _decode_binary_column(comment_binary, audit_record.comment) if use_binary else audit_record.comment
+    event = event_class.from_record_values(audit_record, comment, audit_record.data)
+    event._parsed_data = ("=", elements)
+    return event
+
+
+# action -> decoder, compiled once
+admin_audit_decoders: Dict[str, AdminAuditDecoder] = {
+    action: _verbatim_decoder(event_class) if event_class._verbatim_data else _constructor_decoder(event_class)
+    for action, event_class in event_classes.items() if not isfunction(event_class)
+} | {
+    AdminAuditActionEnum.FLIP_FLAG.value: _flip_flag_decoder
+}
+
+
+def _instantiate_admin_audit_event(audit_record: TapirAdminAudit,
+                                   comment_binary: bytes | None = None,
+                                   data_binary: bytes | None = None,
+                                   use_binary: bool = False) -> AdminAuditEvent:
+    decoder = admin_audit_decoders.get(audit_record.action)
+    if decoder is None:
+        raise ValueError(f"{audit_record.action} is not a valid admin action")
+    event = decoder(audit_record, comment_binary, data_binary, use_binary)
+    event.entry_id = audit_record.entry_id
+    return event
+
+
 def create_admin_audit_event(audit_record: TapirAdminAudit, session: Session = None) -> AdminAuditEvent:
     """Create an AdminAuditEvent instance from a TapirAdminAudit database record.
 
@@ -2137,44 +2348,57 @@ def create_admin_audit_event(audit_record: TapirAdminAudit, session: Session = N
     :return: An instance of the appropriate AdminAuditEvent subclass
     :rtype: AdminAuditEvent
     """
+    if session is None:
+        return _instantiate_admin_audit_event(audit_record)
+
+    # Fetch comment and data as binary so that they can be decoded as UTF-8
+    binaries = session.execute(
+        select(cast(TapirAdminAudit.comment, LargeBinary), cast(TapirAdminAudit.data, LargeBinary))
+        .where(TapirAdminAudit.entry_id == audit_record.entry_id)
+    ).one_or_none()
+    comment_binary, data_binary = binaries if binaries else (None, None)
+    return _instantiate_admin_audit_event(audit_record, comment_binary, data_binary, use_binary=True)
+
+
+def create_admin_audit_events(session: Session, query: Query | Select,
+                              yield_per: int = 500) -> Iterator[AdminAuditEvent]:
+    """Bulk create_admin_audit_event.
+
+    The comment and data columns are selected as BLOB in the same statement, so rendering
+    N records is one query instead of 2N + 1. The rows are streamed and the events are
+    yielded as they are decoded - consume the iterator while the session is open.
+
+    :param session: SQLAlchemy session
+    :param query: Query or select of TapirAdminAudit, with the filters, order and limit applied.
+        TapirAdminAudit must be the only entity selected.
+    :param yield_per: number of rows fetched per round trip
+    :return: AdminAuditEvent per record, in the order of the query
+    """
+    for audit_record, comment_binary, data_binary in admin_audit_records(session, query, yield_per=yield_per):
+        yield decode_admin_audit_record(audit_record, comment_binary, data_binary)
 
-    # Find the appropriate event class or use this base class as fallback
-    event_class: Optional[Type[AdminAuditEvent]] = event_classes.get(audit_record.action)
-    if not event_class:
-        raise ValueError(f"{audit_record.action} is not a valid admin action")
 
-    if isfunction(event_class):
-        return event_class(audit_record)
+def admin_audit_records(session: Session, query: Query | Select,
+                        yield_per: int = 500) -> Iterator[Tuple[TapirAdminAudit, bytes | None, bytes | None]]:
+    """The records create_admin_audit_events decodes, not decoded yet - for the callers that deal with
+    an undecodable record themselves.
 
-    args, kwargs = event_class.get_init_params(audit_record)
-    
-    # Fetch comment as binary and decode as UTF-8 if session is provided
-    if session and "comment" in kwargs:
-        comment_binary = session.execute(
-            session.query(cast(TapirAdminAudit.comment, LargeBinary))
-            .filter(TapirAdminAudit.entry_id == audit_record.entry_id)
-        ).scalar()
-        if comment_binary:
-            try:
-                kwargs["comment"] = comment_binary.decode('utf-8')
-            except UnicodeDecodeError:
-                # Fallback to original comment if decode fails
-                kwargs["comment"] = audit_record.comment
-        else:
-            kwargs["comment"] = ""
-    
-    if session and "data" in kwargs:
-        data_binary = session.execute(
-            session.query(cast(TapirAdminAudit.data, LargeBinary))
-            .filter(TapirAdminAudit.entry_id == audit_record.entry_id)
-        ).scalar()
-        if data_binary:
-            try:
-                kwargs["data"] = data_binary.decode('utf-8')
-            except UnicodeDecodeError:
-                # Fallback to original comment if decode fails
-                kwargs["data"] = audit_record.data
-        else:
-            kwargs["data"] = ""
+    :return: (record, comment as BLOB, data as BLOB) per record, in the order of the query
+    """
+    statement = query.statement if isinstance(query, Query) else query
+    statement = statement.add_columns(
+        cast(TapirAdminAudit.comment, LargeBinary).label("comment_binary"),
+        cast(TapirAdminAudit.data, LargeBinary).label("data_binary"),
+    )
+    for audit_record, comment_binary, data_binary in session.execute(
+            statement, execution_options={"yield_per": yield_per}):
+        yield audit_record, comment_binary, data_binary
 
-    return event_class(*args, **kwargs)
+
+def decode_admin_audit_record(audit_record: TapirAdminAudit, comment_binary: bytes | None,
+                              data_binary: bytes | None) -> AdminAuditEvent:
+    """Decodes a record of admin_audit_records.
+
+    :raises ValueError: unknown action, or data the action's event does not take
+    """
+    return _instantiate_admin_audit_event(audit_record, comment_binary, data_binary, use_binary=True)
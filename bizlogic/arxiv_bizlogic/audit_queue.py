@@ -0,0 +1,257 @@
+"""
+Write-behind queue for admin audit records.
+
+In the default strict mode, the audit record is written in the request's own transaction, as
+admin_audit always did - the admin change and its audit record commit or roll back together.
+
+In the write-behind mode, the record waits in the request's session until the session commits, and
+is then put on a bounded in-process queue - a request that rolls back leaves no audit record. A
+background thread writes the queued records in batches with one multi-row INSERT each. When the
+database is not available, the records are appended to a local spool file (one JSON object per
+line) and the spool is replayed once the database is back. When the queue is full, the record goes
+straight to the spool, so the request never waits on the audit table.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from logging import getLogger
+from typing import Any, Callable, ContextManager, Dict, Iterable, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, SessionTransaction
+
+from .audit_event import AdminAuditEvent, admin_audit_events, admin_audit_row, insert_admin_audit_rows
+
+ADMIN_AUDIT_QUEUE = 'ADMIN_AUDIT_QUEUE'
+
+AUDIT_MODE_STRICT = "strict"
+AUDIT_MODE_WRITE_BEHIND = "write-behind"
+
+logger = getLogger(__name__)
+
+# session.info keys - the rows waiting for the commit, and the queue the session's listeners push to
+_PENDING_ROWS = "admin_audit_pending_rows"
+_PENDING_QUEUE = "admin_audit_pending_queue"
+
+
+class AdminAuditQueue:
+    """
+    :param session_factory: context manager factory giving a session (DatabaseSession)
+    :param mode: AUDIT_MODE_STRICT or AUDIT_MODE_WRITE_BEHIND
+    :param spool_path: append-only file for the records the database did not take. Without it, such
+        records are logged and dropped.
+    :param max_queue: number of records held in memory
+    :param batch_size: maximum number of records per INSERT
+    :param flush_interval: seconds the flusher waits for more records before writing a batch
+    :param retry_interval: seconds between replay attempts while the database is down
+    """
+
+    def __init__(self,
+                 session_factory: Callable[[], ContextManager[Session]],
+                 mode: str = AUDIT_MODE_STRICT,
+                 spool_path: Optional[str] = None,
+                 max_queue: int = 10000,
+                 batch_size: int = 200,
+                 flush_interval: float = 0.5,
+                 retry_interval: float = 10.0):
+        if mode not in (AUDIT_MODE_STRICT, AUDIT_MODE_WRITE_BEHIND):
+            raise ValueError(f"Unknown audit mode {mode}")
+        self.session_factory = session_factory
+        self.mode = mode
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue)
+        self._spool_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._next_replay = 0.0
+        self.written = 0
+        self.spooled = 0
+        self.replayed = 0
+        self.dropped = 0
+
+    @property
+    def strict(self) -> bool:
+        return self.mode == AUDIT_MODE_STRICT
+
+    def start(self) -> None:
+        """Starts the flusher thread. Nothing to do in the strict mode."""
+        if self.strict or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="admin-audit-flusher", daemon=True)
+        self._thread.start()
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """Stops the flusher and writes (or spools) whatever is still queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._flush(self._drain(None))
+
+    def write(self, session: Session, events: Iterable[AdminAuditEvent]) -> None:
+        """
+        Records the audit events of an admin action.
+
+        :param session: the request's session. In the write-behind mode, the records are queued when
+            it commits, and dropped when it rolls back.
+        """
+        if self.strict:
+            admin_audit_events(session, events)
+            return
+        rows = [admin_audit_row(audit_event) for audit_event in events]
+        if _PENDING_QUEUE not in session.info:
+            session.info[_PENDING_QUEUE] = self
+            event.listen(session, "after_commit", _enqueue_pending_rows)
+            event.listen(session, "after_rollback", _drop_pending_rows)
+            event.listen(session, "after_transaction_end", _drop_unfinished_rows)
+        if not session.in_transaction():
+            # So that closing the session without a commit ends a transaction, and drops the rows
+            session.begin()
+        session.info.setdefault(_PENDING_ROWS, []).extend(rows)
+
+    def enqueue(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """Puts the rows of committed audit events on the queue, or in the spool when it is full."""
+        for row in rows:
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                self._spool([row])
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            batch = self._drain(self.batch_size)
+            if batch:
+                self._flush(batch)
+            elif self.spool_path and time.monotonic() >= self._next_replay:
+                self.replay_spool()
+
+    def _drain(self, limit: Optional[int]) -> List[Dict[str, Any]]:
+        batch: List[Dict[str, Any]] = []
+        try:
+            if limit is not None:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+            while limit is None or len(batch) < limit:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _insert(self, rows: List[Dict[str, Any]]) -> bool:
+        try:
+            with self.session_factory() as session:
+                insert_admin_audit_rows(session, rows)
+                # A Core insert leaves the session clean, so the factory would not commit it
+                session.commit()
+            return True
+        except Exception as exc:
+            logger.warning("Writing %d admin audit records failed: %s", len(rows), exc)
+            self._next_replay = time.monotonic() + self.retry_interval
+            return False
+
+    def _flush(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        if self._insert(rows):
+            self.written += len(rows)
+        else:
+            self._spool(rows)
+
+    def _spool(self, rows: List[Dict[str, Any]]) -> None:
+        if not self.spool_path:
+            self.dropped += len(rows)
+            for row in rows:
+                logger.error("Admin audit record dropped: %s", json.dumps(row, ensure_ascii=False))
+            return
+        with self._spool_lock:
+            with open(self.spool_path, "a", encoding="utf-8") as spool:
+                for row in rows:
+                    spool.write(json.dumps(row, ensure_ascii=False) + "\n")
+                spool.flush()
+                os.fsync(spool.fileno())
+            self.spooled += len(rows)
+
+    def replay_spool(self) -> int:
+        """
+        Writes the spooled records to the database, and empties the spool.
+        When the database still refuses, the spool is kept for the next attempt.
+
+        :return: number of records written
+        """
+        if not self.spool_path:
+            return 0
+        # Take the spool away so that new records go to a fresh file while this one is replayed
+        replaying = self.spool_path + ".replaying"
+        with self._spool_lock:
+            if not os.path.exists(replaying):
+                if not os.path.exists(self.spool_path):
+                    return 0
+                os.replace(self.spool_path, replaying)
+
+        with open(replaying, encoding="utf-8") as spool:
+            rows = [json.loads(line) for line in spool if line.strip()]
+        written = 0
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            if not self._insert(batch):
+                # Put the rest back in front of anything spooled meanwhile
+                self._restore_spool(rows[start:], replaying)
+                self.replayed += written
+                return written
+            written += len(batch)
+        os.remove(replaying)
+        self.replayed += written
+        return written
+
+    def _restore_spool(self, rows: List[Dict[str, Any]], replaying: str) -> None:
+        with self._spool_lock:
+            with open(replaying, "w", encoding="utf-8") as spool:
+                for row in rows:
+                    spool.write(json.dumps(row, ensure_ascii=False) + "\n")
+                if os.path.exists(self.spool_path):
+                    with open(self.spool_path, encoding="utf-8") as newer:
+                        spool.write(newer.read())
+                spool.flush()
+                os.fsync(spool.fileno())
+            os.replace(replaying, self.spool_path)
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "spooled": self.spooled,
+            "replayed": self.replayed,
+            "dropped": self.dropped,
+        }
+
+
+def _enqueue_pending_rows(session: Session) -> None:
+    rows = session.info.pop(_PENDING_ROWS, None)
+    if rows:
+        session.info[_PENDING_QUEUE].enqueue(rows)
+
+
+def _drop_pending_rows(session: Session) -> None:
+    session.info.pop(_PENDING_ROWS, None)
+
+
+def _drop_unfinished_rows(session: Session, transaction: SessionTransaction) -> None:
+    # The session closed without a commit - no rollback event when nothing reached the database
+    if transaction.parent is None:
+        _drop_pending_rows(session)
+
+
+def write_admin_audit(session: Session, events: Iterable[AdminAuditEvent],
+                      audit_queue: Optional[AdminAuditQueue] = None) -> None:
+    """
+    Records the audit events, through the queue when one is configured, or in the session otherwise.
+    """
+    if audit_queue is None:
+        admin_audit_events(session, events)
+    else:
+        audit_queue.write(session, events)
@@ -0,0 +1,178 @@
+"""
+Search over tapir_admin_audit.
+
+Results are ordered by (log_date, entry_id) and paged with a keyset cursor - the next page
+starts after the last (log_date, entry_id) seen, so every page costs the same however deep it is.
+The comment and data columns are decoded in the same statement (create_admin_audit_events).
+
+The queries rely on these composite indexes. InnoDB secondary indexes carry the primary key,
+entry_id, so each of them serves the (log_date, entry_id) order within its filter:
+
+    CREATE INDEX ix_admin_audit_affected_user_log_date ON tapir_admin_audit (affected_user, log_date);
+    CREATE INDEX ix_admin_audit_admin_user_log_date ON tapir_admin_audit (admin_user, log_date);
+    CREATE INDEX ix_admin_audit_session_id_log_date ON tapir_admin_audit (session_id, log_date);
+    CREATE INDEX ix_admin_audit_action_log_date ON tapir_admin_audit (action, log_date);
+    CREATE INDEX ix_admin_audit_log_date ON tapir_admin_audit (log_date);
+
+check_admin_audit_indexes() warns about the ones that are missing.
+"""
+from dataclasses import dataclass, field
+from logging import getLogger
+from typing import Iterator, List, Optional, Tuple
+
+from arxiv.db.models import TapirAdminAudit
+from pydantic import BaseModel
+from sqlalchemy import and_, inspect, or_, select, Select
+from sqlalchemy.orm import Session
+
+from .audit_event import AdminAuditEvent, create_admin_audit_events
+
+logger = getLogger(__name__)
+
+# Leading columns of the indexes the search relies on
+ADMIN_AUDIT_INDEXES: List[Tuple[str, ...]] = [
+    ("affected_user", "log_date"),
+    ("admin_user", "log_date"),
+    ("session_id", "log_date"),
+    ("action", "log_date"),
+    ("log_date",),
+]
+
+
+class AdminAuditFilter(BaseModel):
+    """
+    Search conditions. Unset ones do not filter.
+
+    :param since: log_date lower bound, inclusive (epoch seconds)
+    :param until: log_date upper bound, exclusive (epoch seconds)
+    """
+    affected_user: Optional[int] = None
+    admin_user: Optional[int] = None
+    actions: Optional[List[str]] = None
+    session_id: Optional[int] = None
+    since: Optional[int] = None
+    until: Optional[int] = None
+
+
+@dataclass
+class AdminAuditPage:
+    events: List[AdminAuditEvent] = field(default_factory=list)
+    # Pass to search_admin_audit for the following page. None at the end.
+    next_cursor: Optional[str] = None
+
+
+def encode_audit_cursor(log_date: int, entry_id: int) -> str:
+    return f"{log_date}-{entry_id}"
+
+
+def decode_audit_cursor(cursor: str) -> Tuple[int, int]:
+    """:raises ValueError: when the cursor is not one made by encode_audit_cursor"""
+    log_date, entry_id = cursor.split("-")
+    return int(log_date), int(entry_id)
+
+
+def apply_admin_audit_filter(statement: Select, filters: AdminAuditFilter) -> Select:
+    """Adds the search conditions to a select of TapirAdminAudit."""
+    if filters.affected_user is not None:
+        statement = statement.where(TapirAdminAudit.affected_user == filters.affected_user)
+    if filters.admin_user is not None:
+        statement = statement.where(TapirAdminAudit.admin_user == filters.admin_user)
+    if filters.actions:
+        statement = statement.where(TapirAdminAudit.action.in_(filters.actions))
+    if filters.session_id is not None:
+        statement = statement.where(TapirAdminAudit.session_id == filters.session_id)
+    if filters.since is not None:
+        statement = statement.where(TapirAdminAudit.log_date >= filters.since)
+    if filters.until is not None:
+        statement = statement.where(TapirAdminAudit.log_date < filters.until)
+
+    return statement
+
+
+def admin_audit_select(filters: AdminAuditFilter, cursor: Optional[str] = None,
+                       descending: bool = True) -> Select:
+    """
+    The filtered, keyset-ordered select of TapirAdminAudit.
+
+    :param filters: search conditions
+    :param cursor: start after this position
+    :param descending: newest first
+    """
+    statement = apply_admin_audit_filter(select(TapirAdminAudit), filters)
+
+    if cursor:
+        log_date, entry_id = decode_audit_cursor(cursor)
+        # Spelled out rather than a row-value comparison so that MySQL can range-scan the index
+        if descending:
+            statement = statement.where(or_(
+                TapirAdminAudit.log_date < log_date,
+                and_(TapirAdminAudit.log_date == log_date, TapirAdminAudit.entry_id < entry_id)))
+        else:
+            statement = statement.where(or_(
+                TapirAdminAudit.log_date > log_date,
+                and_(TapirAdminAudit.log_date == log_date, TapirAdminAudit.entry_id > entry_id)))
+
+    if descending:
+        return statement.order_by(TapirAdminAudit.log_date.desc(), TapirAdminAudit.entry_id.desc())
+    return statement.order_by(TapirAdminAudit.log_date.asc(), TapirAdminAudit.entry_id.asc())
+
+
+def admin_audit_export_select(filters: AdminAuditFilter, after_entry_id: Optional[int] = None) -> Select:
+    """
+    The filtered select in entry_id order, for exports. An interrupted export resumes after the last
+    entry_id it received. The primary key range scan needs no extra index.
+    """
+    statement = apply_admin_audit_filter(select(TapirAdminAudit), filters)
+    if after_entry_id is not None:
+        statement = statement.where(TapirAdminAudit.entry_id > after_entry_id)
+    return statement.order_by(TapirAdminAudit.entry_id.asc())
+
+
+def search_admin_audit(session: Session, filters: AdminAuditFilter, cursor: Optional[str] = None,
+                       limit: int = 100, descending: bool = True) -> AdminAuditPage:
+    """
+    One page of audit events.
+
+    :param session: SQLAlchemy session
+    :param filters: search conditions
+    :param cursor: next_cursor of the previous page
+    :param limit: page size
+    :param descending: newest first
+    :return: the page
+    """
+    # One more row than asked tells whether there is a next page
+    statement = admin_audit_select(filters, cursor=cursor, descending=descending).limit(limit + 1)
+    page = AdminAuditPage(events=list(create_admin_audit_events(session, statement, yield_per=limit + 1)))
+    if len(page.events) > limit:
+        page.events = page.events[:limit]
+        last = page.events[-1]
+        page.next_cursor = encode_audit_cursor(last.timestamp, last.entry_id)
+    return page
+
+
+def iter_admin_audit(session: Session, filters: AdminAuditFilter, cursor: Optional[str] = None,
+                     page_size: int = 500, descending: bool = True) -> Iterator[AdminAuditEvent]:
+    """
+    Streams all the matching events, a page at a time.
+    """
+    while True:
+        page = search_admin_audit(session, filters, cursor=cursor, limit=page_size, descending=descending)
+        yield from page.events
+        if page.next_cursor is None:
+            return
+        cursor = page.next_cursor
+
+
+def check_admin_audit_indexes(session: Session) -> List[Tuple[str, ...]]:
+    """
+    Warns about the indexes in ADMIN_AUDIT_INDEXES that tapir_admin_audit does not have.
+
+    :return: leading columns of the missing indexes
+    """
+    existing = [tuple(index["column_names"]) for index in inspect(session.bind).get_indexes("tapir_admin_audit")]
+    missing = [wanted for wanted in ADMIN_AUDIT_INDEXES
+               if not any(index[:len(wanted)] == wanted for index in existing)]
+    for wanted in missing:
+        logger.warning("tapir_admin_audit has no index on (%s). Audit search filtering on %s scans the table.",
+                       ", ".join(wanted), wanted[0])
+    return missing
@@ -1,6 +1,6 @@
 import logging
 import os
-from typing import Tuple, List, Dict
+from typing import Tuple, List, Dict, Any
 
 from arxiv.auth.legacy.exceptions import PasswordAuthenticationFailed
 from arxiv.auth.legacy.passwords import check_password
@@ -116,8 +116,11 @@ class AuthResponse(BaseModel):
 class PasswordData(BaseModel):
     password: str
 
-def user_model_to_auth_response(um: UserModel, tapir_user: TapirUser) -> AuthResponse:
-    """Turns the tapir user to the user migration record"""
+def user_flags_to_roles(um: Any) -> List[str]:
+    """
+    Keycloak realm roles from the tapir user / demographic flags.
+    um is UserModel, or anything with the same flag attributes (ie. TapirClaimsSource)
+    """
     # Keycloak's realm "arxiv" should have the roles beforehand.
     # Internal
     # AllowTexProduced
@@ -163,6 +166,12 @@ def user_model_to_auth_response(um: UserModel, tapir_user: TapirUser) -> AuthRes
 
     if um.flag_allow_tex_produced:
         roles.append("AllowTexProduced")
+    return roles
+
+
+def user_model_to_auth_response(um: UserModel, tapir_user: TapirUser) -> AuthResponse:
+    """Turns the tapir user to the user migration record"""
+    roles = user_flags_to_roles(um)
 
     attributes = {}
 
@@ -1,15 +1,155 @@
-from typing import  Optional
+import os
+import time
+from dataclasses import dataclass
+from typing import  Optional, Tuple, List
 from logging import getLogger
 from arxiv.auth.legacy.cookies import unpack
 from arxiv.auth.legacy.exceptions import SessionExpired, InvalidCookie
 from arxiv.auth.user_claims import ArxivUserClaims, ArxivUserClaimsModel
+from sqlalchemy import select, cast, LargeBinary, exists, and_
 from sqlalchemy.orm import Session as DBSession
-from arxiv.db.models import TapirUser, TapirSession
-from .user_model import UserModel
-from .tapir_to_kc_mapping import user_model_to_auth_response, AuthResponse
+from arxiv.db.models import TapirUser, TapirSession, TapirNickname, TapirPolicyClass, Demographic, t_arXiv_moderators
+from .tapir_to_kc_mapping import user_flags_to_roles
 from ..fastapi_helpers import datetime_to_epoch
+from ..ttl_cache import TTLCache
 from datetime import datetime, UTC
 
+# Session claims keyed by tapir session id. The value keeps the cookie it was built from so a
+# different cookie with the same session id never gets someone else's claims.
+# An entry lives until the cookie expires, capped at TAPIR_SESSION_CLAIMS_MAX_TTL seconds so that a
+# session ended elsewhere (legacy logout, admin action) is picked up soon enough.
+TAPIR_SESSION_CLAIMS_MAX_TTL = 300.0
+TAPIR_SESSION_CLAIMS_CACHE: TTLCache[Tuple[str, ArxivUserClaims]] = TTLCache(maxsize=8192, default_ttl=TAPIR_SESSION_CLAIMS_MAX_TTL)
+
+
+@dataclass(frozen=True)
+class TapirClaimsSource:
+    """
+    Everything needed to make the user claims of a tapir session. Loaded with one statement.
+    The flag names are the same as UserModel so that user_flags_to_roles works on this.
+    """
+    user_id: int
+    session_id: int
+    start_time: int
+    end_time: int
+    email: str
+    first_name: str
+    last_name: str
+    username: str
+    flag_internal: bool
+    flag_edit_users: bool
+    flag_edit_system: bool
+    flag_email_verified: bool
+    flag_approved: bool
+    flag_deleted: bool
+    flag_banned: bool
+    flag_allow_tex_produced: bool
+    flag_can_lock: bool
+    flag_proxy: bool
+    flag_xml: bool
+    flag_suspect: bool
+    flag_is_mod: bool
+    policy_class_id: Optional[int]
+    policy_class_name: Optional[str]
+
+    @property
+    def roles(self) -> List[str]:
+        roles = user_flags_to_roles(self)
+        if self.policy_class_id:
+            roles.append(self.policy_class_name)
+        return roles
+
+    @property
+    def normalized_username(self) -> str:
+        if os.environ.get("NORMALIZE_USERNAME", "true") == "true":
+            return self.username.lower()
+        return self.username
+
+
+def _decode_utf8(value: bytes | str | None) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return value
+
+
+def load_tapir_claims_source(session: DBSession, user_id: int | str, session_id: int | str) -> Optional[TapirClaimsSource]:
+    """
+    Loads the user, nickname, tapir session, policy class and moderator flag in one statement.
+
+    :param session: DB session
+    :param user_id: tapir user id
+    :param session_id: tapir session id
+    :return: TapirClaimsSource, or None if the user or the session of the user does not exist
+    """
+    nick_subquery = select(TapirNickname.nickname).where(TapirUser.user_id == TapirNickname.user_id).correlate(
+        TapirUser).limit(1).scalar_subquery()
+    is_mod_subquery = exists().where(t_arXiv_moderators.c.user_id == TapirUser.user_id).correlate(TapirUser)
+
+    stmt = (
+        select(
+            TapirUser.user_id,
+            TapirSession.session_id,
+            TapirSession.start_time,
+            TapirSession.end_time,
+            cast(TapirUser.email, LargeBinary).label("email"),
+            cast(TapirUser.first_name, LargeBinary).label("first_name"),
+            cast(TapirUser.last_name, LargeBinary).label("last_name"),
+            nick_subquery.label("username"),
+            TapirUser.flag_internal,
+            TapirUser.flag_edit_users,
+            TapirUser.flag_edit_system,
+            TapirUser.flag_email_verified,
+            TapirUser.flag_approved,
+            TapirUser.flag_deleted,
+            TapirUser.flag_banned,
+            TapirUser.flag_allow_tex_produced,
+            TapirUser.flag_can_lock,
+            Demographic.flag_proxy,
+            Demographic.flag_xml,
+            Demographic.flag_suspect,
+            is_mod_subquery.label("flag_is_mod"),
+            TapirPolicyClass.class_id.label("policy_class_id"),
+            TapirPolicyClass.name.label("policy_class_name"),
+        )
+        .select_from(TapirUser)
+        .join(TapirSession, and_(TapirSession.user_id == TapirUser.user_id,
+                                 TapirSession.session_id == int(session_id)))
+        .outerjoin(Demographic, Demographic.user_id == TapirUser.user_id)
+        .outerjoin(TapirPolicyClass, TapirPolicyClass.class_id == TapirUser.policy_class)
+        .where(TapirUser.user_id == int(user_id))
+    )
+    row = session.execute(stmt).one_or_none()
+    if row is None:
+        return None
+
+    return TapirClaimsSource(
+        user_id=row.user_id,
+        session_id=row.session_id,
+        start_time=int(row.start_time),
+        end_time=int(row.end_time or 0),
+        email=_decode_utf8(row.email),
+        first_name=_decode_utf8(row.first_name).strip(),
+        last_name=_decode_utf8(row.last_name).strip(),
+        username=(row.username or "").strip(),
+        flag_internal=bool(row.flag_internal),
+        flag_edit_users=bool(row.flag_edit_users),
+        flag_edit_system=bool(row.flag_edit_system),
+        flag_email_verified=bool(row.flag_email_verified),
+        flag_approved=bool(row.flag_approved),
+        flag_deleted=bool(row.flag_deleted),
+        flag_banned=bool(row.flag_banned),
+        flag_allow_tex_produced=bool(row.flag_allow_tex_produced),
+        flag_can_lock=bool(row.flag_can_lock),
+        flag_proxy=bool(row.flag_proxy),
+        flag_xml=bool(row.flag_xml),
+        flag_suspect=bool(row.flag_suspect),
+        flag_is_mod=bool(row.flag_is_mod),
+        policy_class_id=row.policy_class_id,
+        policy_class_name=row.policy_class_name,
+    )
+
 
 def create_user_claims_from_tapir_cookie(session: DBSession,
                                          tapir_cookie: str,
@@ -40,14 +180,10 @@ def create_user_claims_from_tapir_cookie(session: DBSession,
         raise SessionExpired(f'Session {session_id} has expired in cookie')
 
     try:
-        tapir_user: TapirUser | None = session.query(TapirUser).filter(TapirUser.user_id == user_id).one_or_none()
-        tapir_session: TapirSession | None = session.query(TapirSession).filter(TapirSession.session_id == session_id).one_or_none()
-        if not tapir_user or not tapir_session:
+        source = load_tapir_claims_source(session, user_id, session_id)
+        if source is None:
             return None
 
-        user = UserModel.one_user(session, str(user_id))
-        auth_response: AuthResponse = user_model_to_auth_response(user, tapir_user)
-
     except Exception as exc:
         logger.error("create_user_claims_from_tapir_cookie[2]", exc_info=exc)
         return None
@@ -56,13 +192,13 @@ def create_user_claims_from_tapir_cookie(session: DBSession,
         data = ArxivUserClaimsModel(
             sub=str(user_id),
             exp=datetime_to_epoch(None, expires_at),
-            iat=int(tapir_session.start_time),
-            roles=auth_response.roles,
-            email_verified=auth_response.emailVerified,
-            email=str(auth_response.email),
-            first_name=auth_response.firstName,
-            last_name=auth_response.lastName,
-            username=auth_response.username,
+            iat=source.start_time,
+            roles=source.roles,
+            email_verified=source.flag_email_verified,
+            email=source.email,
+            first_name=source.first_name,
+            last_name=source.last_name,
+            username=source.normalized_username,
             ts_id=int(session_id),
             sid="keycloak-session-id-is-not-available"
         )
@@ -71,3 +207,46 @@ def create_user_claims_from_tapir_cookie(session: DBSession,
     except Exception as exc:
         logger.error("create_user_claims_from_tapir_cookie[3]", exc_info=exc)
         return None
+
+
+def get_cached_user_claims_from_tapir_cookie(tapir_cookie: str) -> Optional[ArxivUserClaims]:
+    """
+    Returns the user claims cached for the tapir cookie's session, or None on a miss.
+
+    Raises SessionExpired if the cookie has expired, same as create_user_claims_from_tapir_cookie.
+    """
+    try:
+        session_id, _user_id, _ip, _issued_at, expires_at, _capabilities = unpack(tapir_cookie)
+    except Exception:
+        return None
+
+    if expires_at <= datetime.now(tz=UTC):
+        TAPIR_SESSION_CLAIMS_CACHE.invalidate(str(session_id))
+        raise SessionExpired(f'Session {session_id} has expired in cookie')
+
+    entry = TAPIR_SESSION_CLAIMS_CACHE.get(str(session_id))
+    if entry is None:
+        return None
+    cached_cookie, claims = entry
+    if cached_cookie != tapir_cookie:
+        return None
+    return claims
+
+
+def cache_user_claims_from_tapir_cookie(tapir_cookie: str, claims: ArxivUserClaims) -> None:
+    """Remembers the claims built from the tapir cookie until the cookie expires."""
+    try:
+        session_id, _user_id, _ip, _issued_at, expires_at, _capabilities = unpack(tapir_cookie)
+    except Exception:
+        return
+    expires = min(expires_at.timestamp(), time.time() + TAPIR_SESSION_CLAIMS_MAX_TTL)
+    TAPIR_SESSION_CLAIMS_CACHE.put(str(session_id), (tapir_cookie, claims), expires_at=expires)
+
+
+def invalidate_tapir_session_claims(tapir_cookie: str) -> None:
+    """Drops the cached claims of the tapir cookie's session. Call this when the session ends."""
+    try:
+        session_id, _user_id, _ip, _issued_at, _expires_at, _capabilities = unpack(tapir_cookie)
+    except Exception:
+        return
+    TAPIR_SESSION_CLAIMS_CACHE.invalidate(str(session_id))
@@ -5,7 +5,7 @@ This is more abstract than using raw SQLAlchemy table based models
 from __future__ import annotations
 
 from enum import Enum
-from typing import Optional, List
+from typing import Optional, List, Literal, Dict, overload
 
 from arxiv_bizlogic.database import is_column_latin1
 from arxiv_bizlogic.fastapi_helpers import datetime_to_epoch
@@ -45,6 +45,36 @@ class VetoStatusEnum(str, Enum):
     no_replace = 'no-replace'
 
 
+# Upper bound of the IN-list size for the batched loaders
+USER_ID_CHUNK_SIZE = 500
+
+
+def chunked(items: list, chunk_size: int = USER_ID_CHUNK_SIZE):
+    """Yields chunk_size slices of items"""
+    for start in range(0, len(items), chunk_size):
+        yield items[start:start + chunk_size]
+
+
+def list_mod_cats_n_arcs_many(session: Session, user_ids: List[int]) -> Dict[int, tuple[list[str], list[str]]]:
+    """
+    Batched list_mod_cats_n_arcs.
+    :return: user id -> (moderated categories, moderated archives). Users without any are absent.
+    """
+    result: Dict[int, tuple[list[str], list[str]]] = {}
+    for chunk in chunked(user_ids):
+        list_mod = (
+            select(t_arXiv_moderators.c.user_id, t_arXiv_moderators.c.archive, t_arXiv_moderators.c.subject_class)
+            .where(t_arXiv_moderators.c.user_id.in_(chunk))
+        )
+        for mod in session.execute(list_mod).fetchall():
+            mod_cats, mod_archives = result.setdefault(int(mod.user_id), ([], []))
+            if mod.archive and mod.subject_class:
+                mod_cats.append(f"{mod.archive}.{mod.subject_class}")
+            elif mod.archive:
+                mod_archives.append(mod.archive)
+    return result
+
+
 def list_mod_cats_n_arcs(session: Session, user_id: int) -> tuple[list[str], list[str]]:
     list_mod = (
         select(t_arXiv_moderators.c.archive, t_arXiv_moderators.c.subject_class)
@@ -57,6 +87,93 @@ def list_mod_cats_n_arcs(session: Session, user_id: int) -> tuple[list[str], lis
     return mod_cats, mod_archives
 
 
+class UserProjection(str, Enum):
+    """
+    How much of the user to load with UserModel.one_user.
+
+    identity: user id, email, names and username. Tapir user and nickname only.
+    auth_flags: identity plus the account flags and policy class.
+    full_profile: everything in UserModel (base_select), with demographic, ORCID and moderator data.
+    """
+    identity = 'identity'
+    auth_flags = 'auth-flags'
+    full_profile = 'full-profile'
+
+
+class UserIdentityModel(BaseModel):
+    """UserProjection.identity"""
+    id: int
+    email: str
+    first_name: str
+    last_name: str
+    suffix_name: Optional[str] = None
+    username: str
+
+    @field_validator('first_name', 'last_name', 'suffix_name', 'username')
+    @classmethod
+    def strip_field_value(cls, value: str | None) -> str | None:
+        return value.strip() if value else value
+
+
+class UserAuthFlagsModel(UserIdentityModel):
+    """UserProjection.auth_flags"""
+    policy_class: int
+    email_bouncing: bool = False
+    flag_internal: bool = False
+    flag_edit_users: bool = False
+    flag_edit_system: bool = False
+    flag_email_verified: bool = False
+    flag_approved: bool = True
+    flag_deleted: bool = False
+    flag_banned: bool = False
+    flag_allow_tex_produced: Optional[bool] = None
+    flag_can_lock: Optional[bool] = None
+
+    @property
+    def is_admin(self) -> bool:
+        return self.flag_edit_users or self.flag_edit_system
+
+    @property
+    def is_valid_account(self) -> bool:
+        return not (self.flag_banned or self.flag_deleted)
+
+
+def _identity_columns() -> list:
+    nick_subquery = select(TapirNickname.nickname).where(TapirUser.user_id == TapirNickname.user_id).correlate(
+        TapirUser).limit(1).scalar_subquery()
+    return [
+        TapirUser.user_id.label("id"),
+        cast(TapirUser.email, LargeBinary).label("email"),
+        cast(TapirUser.first_name, LargeBinary).label("first_name"),
+        cast(TapirUser.last_name, LargeBinary).label("last_name"),
+        cast(TapirUser.suffix_name, LargeBinary).label("suffix_name"),
+        nick_subquery.label("username"),
+    ]
+
+
+def _auth_flags_columns() -> list:
+    return _identity_columns() + [
+        TapirUser.policy_class,
+        TapirUser.email_bouncing,
+        TapirUser.flag_internal,
+        TapirUser.flag_edit_users,
+        TapirUser.flag_edit_system,
+        TapirUser.flag_email_verified,
+        TapirUser.flag_approved,
+        TapirUser.flag_deleted,
+        TapirUser.flag_banned,
+        TapirUser.flag_allow_tex_produced,
+        TapirUser.flag_can_lock,
+    ]
+
+
+def _decode_blob_fields(row: dict) -> dict:
+    for field in _tapir_user_utf8_fields_:
+        if isinstance(row.get(field), bytes):
+            row[field] = row[field].decode("utf-8")
+    return row
+
+
 class UserModel(BaseModel):
     class Config:
         from_attributes = True
@@ -309,19 +426,76 @@ class UserModel(BaseModel):
             result.moderated_categories, result.moderated_archives = list_mod_cats_n_arcs(session, result.id)
         return result
 
+    @overload
+    @staticmethod
+    def one_user(session: Session, user_id: str | int) -> UserModel | None: ...
+
+    @overload
     @staticmethod
-    def one_user(session: Session, user_id: str) -> UserModel | None:
+    def one_user(session: Session, user_id: str | int,
+                 projection: Literal[UserProjection.full_profile]) -> UserModel | None: ...
+
+    @overload
+    @staticmethod
+    def one_user(session: Session, user_id: str | int,
+                 projection: Literal[UserProjection.identity]) -> UserIdentityModel | None: ...
+
+    @overload
+    @staticmethod
+    def one_user(session: Session, user_id: str | int,
+                 projection: Literal[UserProjection.auth_flags]) -> UserAuthFlagsModel | None: ...
+
+    @staticmethod
+    def one_user(session: Session, user_id: str | int,
+                 projection: UserProjection = UserProjection.full_profile
+                 ) -> UserModel | UserIdentityModel | UserAuthFlagsModel | None:
         """
         Get one user model data from user id (aka int primary key)
         :param session: DB session
         :param user_id:
-        :return:
+        :param projection: UserProjection. The full profile is expensive - if you only need the names or
+           the flags, ask for less.
+        :return: UserModel for full_profile, UserIdentityModel or UserAuthFlagsModel for the others
         """
+        if projection == UserProjection.identity:
+            return UserModel._one_projected_user(session, user_id, _identity_columns(), UserIdentityModel)
+        if projection == UserProjection.auth_flags:
+            return UserModel._one_projected_user(session, user_id, _auth_flags_columns(), UserAuthFlagsModel)
+
         user = UserModel.base_select(session).filter(TapirUser.user_id == user_id).one_or_none()
         if user is None:
             return None
         return UserModel.to_model(user, session=session)
 
+    @staticmethod
+    def many_users(session: Session, user_ids: List[str | int]) -> List[UserModel | None]:
+        """
+        Batched one_user. The ids are fetched with chunked IN-lists, and the moderator lists
+        with one query per chunk instead of one per user.
+
+        :param session: DB session
+        :param user_ids: user ids
+        :return: UserModel in the same order as user_ids. None where the user does not exist.
+        """
+        unique_ids = list(dict.fromkeys(int(user_id) for user_id in user_ids))
+        found: Dict[int, UserModel] = {}
+        for chunk in chunked(unique_ids):
+            for row in UserModel.base_select(session).filter(TapirUser.user_id.in_(chunk)).all():
+                user = UserModel.to_model(row)
+                found[int(user.id)] = user
+
+        mods = list_mod_cats_n_arcs_many(session, list(found.keys()))
+        for user_id, user in found.items():
+            user.moderated_categories, user.moderated_archives = mods.get(user_id, ([], []))
+        return [found.get(int(user_id)) for user_id in user_ids]
+
+    @staticmethod
+    def _one_projected_user(session: Session, user_id: str | int, columns: list, model_class):
+        row = session.execute(select(*columns).where(TapirUser.user_id == user_id)).one_or_none()
+        if row is None:
+            return None
+        return model_class.model_validate(_decode_blob_fields(row._asdict()))
+
     @staticmethod
     def one_user_from_username(session: Session, username: str) -> UserModel | None:
         """
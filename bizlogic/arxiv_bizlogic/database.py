@@ -1,10 +1,12 @@
+import threading
 from logging import getLogger
 
 from arxiv.config import Settings
 from fastapi import HTTPException
-from sqlalchemy import create_engine, inspect
+from sqlalchemy import bindparam, create_engine, inspect, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, Session
-from typing import Optional, Dict, Tuple
+from typing import Optional, Dict, Tuple, Iterable, Set
 
 
 class Database:
@@ -84,15 +86,122 @@ class DatabaseSession:
 
 
 
-# Cache for column charset lookups: (engine_url, table_name, column_name) -> charset
-_column_charset_cache: Dict[Tuple[str, str, str], Optional[str]] = {}
+# Tables the app writes to, whose latin1 columns need the binary() treatment.
+# preload_column_charsets() reads these at startup so no request pays for the reflection.
+CHARSET_PRELOAD_TABLES: Tuple[str, ...] = (
+    "tapir_admin_audit",
+    "tapir_users",
+    "tapir_nicknames",
+    "tapir_users_password",
+    "tapir_email_change_tokens",
+    "arXiv_demographics",
+    "arXiv_orcid_ids",
+    "arXiv_author_ids",
+)
+
+
+class ColumnCharsetRegistry:
+    """
+    Column charsets: (engine_url, table_name, column_name) -> charset
+
+    preload() fills it for whole tables with one information_schema query. A column of a table that
+    was not preloaded is looked up by reflection on first use, as before.
+    Lookups are lock free. The lock only guards filling it in.
+    """
+
+    def __init__(self):
+        self._charsets: Dict[Tuple[str, str, str], Optional[str]] = {}
+        # (engine_url, table_name) whose columns are all in _charsets
+        self._loaded_tables: Set[Tuple[str, str]] = set()
+        self._lock = threading.Lock()
+
+    def preload(self, engine: Engine, table_names: Iterable[str] = CHARSET_PRELOAD_TABLES) -> int:
+        """
+        Reads the charsets of every column of the tables in one information_schema.COLUMNS query.
+
+        :param engine: MySQL engine. Nothing to do for the others.
+        :param table_names: tables to load
+        :return: number of columns loaded
+        """
+        if engine.dialect.name != 'mysql':
+            return 0
+        table_names = list(table_names)
+        if not table_names:
+            return 0
+        statement = text(
+            "SELECT TABLE_NAME, COLUMN_NAME, CHARACTER_SET_NAME FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN :table_names"
+        ).bindparams(bindparam("table_names", expanding=True))
+        with engine.connect() as connection:
+            rows = connection.execute(statement, {"table_names": table_names}).all()
+
+        engine_url = str(engine.url)
+        with self._lock:
+            for table_name, column_name, charset in rows:
+                self._charsets[(engine_url, table_name, column_name)] = charset
+            # Tables that do not exist are marked loaded too - their columns are not latin1
+            self._loaded_tables.update((engine_url, table_name) for table_name in table_names)
+        return len(rows)
+
+    def charset(self, session: Session, table_name: str, column_name: str) -> Optional[str]:
+        engine_url = str(session.bind.url)
+        key = (engine_url, table_name, column_name)
+        try:
+            return self._charsets[key]
+        except KeyError:
+            pass
+        if (engine_url, table_name) in self._loaded_tables:
+            return None
+
+        with self._lock:
+            if key not in self._charsets:
+                self._charsets[key] = self._reflect(session, table_name, column_name)
+            return self._charsets[key]
+
+    @staticmethod
+    def _reflect(session: Session, table_name: str, column_name: str) -> Optional[str]:
+        try:
+            for col in inspect(session.bind).get_columns(table_name):
+                if col['name'] == column_name:
+                    return getattr(col.get('type'), 'charset', None)
+        except Exception:
+            pass
+        return None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._charsets.clear()
+            self._loaded_tables.clear()
+
+
+_column_charsets = ColumnCharsetRegistry()
+
+
+def get_column_charset_registry() -> ColumnCharsetRegistry:
+    """The registry is_column_latin1 uses. For tests."""
+    return _column_charsets
+
+
+def preload_column_charsets(engine: Engine, table_names: Iterable[str] = CHARSET_PRELOAD_TABLES) -> int:
+    """
+    Loads the column charsets of the tables the app writes to. Call at startup.
+    A failure is logged, not raised - the lookups fall back to reflection.
+    """
+    try:
+        count = _column_charsets.preload(engine, table_names)
+    except Exception:
+        getLogger(__name__).warning("Preloading the column charsets failed", exc_info=True)
+        return 0
+    getLogger(__name__).info("Preloaded the charsets of %d columns", count)
+    return count
 
 
 def is_column_latin1(session: Session, table_name: str, column_name: str) -> bool:
-    """Check if a column uses latin1 charset via SQLAlchemy reflection.
+    """Check if a column uses latin1 charset.
 
     For non-MySQL databases, always returns False.
-    Results are cached per (engine_url, table_name, column_name).
+    Answered from the charsets preloaded at startup (preload_column_charsets), falling back to
+    SQLAlchemy reflection for the tables that were not preloaded.
 
     Args:
         session: SQLAlchemy session
@@ -104,27 +213,4 @@ def is_column_latin1(session: Session, table_name: str, column_name: str) -> boo
     """
     if session.bind.dialect.name != 'mysql':
         return False
-
-    # Use engine URL as cache key
-    cache_key = (str(session.bind.url), table_name, column_name)
-
-    # Check if we have a cached result
-    if cache_key in _column_charset_cache:
-        return _column_charset_cache[cache_key] == 'latin1'
-
-    # Perform reflection
-    inspector = inspect(session.bind)
-    try:
-        columns = inspector.get_columns(table_name)
-        for col in columns:
-            if col['name'] == column_name:
-                col_type = col.get('type')
-                charset = getattr(col_type, 'charset', None)
-                _column_charset_cache[cache_key] = charset
-                return charset == 'latin1'
-    except Exception:
-        pass
-
-    _column_charset_cache[cache_key] = None
-    return False
-
+    return _column_charsets.charset(session, table_name, column_name) == 'latin1'
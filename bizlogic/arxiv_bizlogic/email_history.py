@@ -0,0 +1,346 @@
+"""
+Materialized email change history.
+
+A user's email history is the union of the consumed email change tokens, the used-token records and
+the change-email admin audit records. The admin audit part scans the user's whole audit trail, which
+is slow for long-lived accounts, so the union is kept per user as one compact record in
+arXiv_email_history:
+
+    CREATE TABLE `arXiv_email_history` (
+      `user_id` int unsigned NOT NULL,
+      `changes` mediumtext NOT NULL,
+      `updated` int unsigned NOT NULL,
+      PRIMARY KEY (`user_id`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+`changes` is a JSON list of EmailChangeRow, ordered by used_when. The writers append to it
+(append_email_change) and readers take it as is. The reads never write: a user without the record is
+served from the union query until backfill_email_history() (tools/backfill_email_history.py) builds it.
+
+The backfill and the appends take turns on the user's tapir_users row (lock_users). An append that
+finds no record leaves the change to the backfill, so the backfill must not read the union before
+such a change commits, nor store it after such a change committed.
+"""
+import json
+import time
+from logging import getLogger
+from typing import Dict, List, Optional, Tuple
+
+from arxiv.db.models import TapirEmailChangeToken, TapirUser, t_tapir_email_change_tokens_used, TapirAdminAudit
+from sqlalchemy import Column, Integer, MetaData, String, Table, Text, Boolean, select, union, union_all, \
+    literal, or_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func, Select
+
+from .bizmodels.user_model import chunked
+
+logger = getLogger(__name__)
+
+email_history_metadata = MetaData()
+
+t_arxiv_email_history = Table(
+    "arXiv_email_history",
+    email_history_metadata,
+    Column("user_id", Integer, primary_key=True, autoincrement=False),
+    Column("changes", Text, nullable=False),
+    Column("updated", Integer, nullable=False),
+    mysql_charset="utf8mb4",
+)
+
+# (used_when, old_email, new_email, admin_id, issued_when, used, secret)
+# admin_id is 0 for the user's own changes. secret is "" for the admin changes.
+EmailChangeRow = Tuple[int, str, str, int, int, bool, str]
+
+USED_WHEN = 0
+SECRET = 6
+
+
+# False when ensure_email_history_table could not make the table - the record is then neither read nor written
+_email_history_enabled = True
+
+
+def create_email_history_table(engine: Engine) -> None:
+    """Creates arXiv_email_history when it does not exist."""
+    email_history_metadata.create_all(engine, checkfirst=True)
+
+
+def ensure_email_history_table(engine: Engine) -> bool:
+    """
+    create_email_history_table for the app startup. A failure (no CREATE privilege, database down) is
+    logged, not raised, and the process goes on with the union query only.
+
+    :return: whether the materialized history is used
+    """
+    global _email_history_enabled
+    try:
+        create_email_history_table(engine)
+        _email_history_enabled = True
+    except Exception:
+        logger.warning("arXiv_email_history is not available - the email history is read from the union query",
+                       exc_info=True)
+        _email_history_enabled = False
+    return _email_history_enabled
+
+
+def email_change_union(user_ids: List[int]) -> Select:
+    """
+    The email changes of the users, from the token tables and the admin audit.
+    The rows are (user_id, EmailChangeRow...), in used_when order.
+    """
+    # Consumed tokens
+    consumed = (
+        select(
+            TapirEmailChangeToken.user_id.label('user_id'),
+            TapirEmailChangeToken.consumed_when.label('used_when'),
+            TapirEmailChangeToken.old_email,
+            TapirEmailChangeToken.new_email,
+            func.cast(0, Integer).label('admin_id'),
+            TapirEmailChangeToken.issued_when,
+            TapirEmailChangeToken.used,
+            TapirEmailChangeToken.secret,
+        )
+        .where(
+            TapirEmailChangeToken.user_id.in_(user_ids),
+            TapirEmailChangeToken.used == 1,
+            TapirEmailChangeToken.consumed_when.isnot(None)
+        )
+    )
+
+    # Tapir email changes, from the used tokens table
+    tapir_used = (
+        select(
+            t_tapir_email_change_tokens_used.c.user_id.label('user_id'),
+            t_tapir_email_change_tokens_used.c.used_when,
+            TapirEmailChangeToken.old_email,
+            TapirEmailChangeToken.new_email,
+            func.cast(0, Integer).label('admin_id'),
+            TapirEmailChangeToken.issued_when,
+            TapirEmailChangeToken.used,
+            TapirEmailChangeToken.secret,
+        )
+        .select_from(
+            t_tapir_email_change_tokens_used.join(
+                TapirEmailChangeToken,
+                t_tapir_email_change_tokens_used.c.secret == TapirEmailChangeToken.secret
+            )
+        )
+        .where(
+            t_tapir_email_change_tokens_used.c.user_id.in_(user_ids),
+            TapirEmailChangeToken.consumed_when.is_(None)
+        )
+    )
+
+    # Admin email changes
+    admin_changes = (
+        select(
+            TapirAdminAudit.affected_user.label('user_id'),
+            TapirAdminAudit.log_date.label('used_when'),
+            func.cast('', String).label('old_email'),
+            TapirAdminAudit.data.label('new_email'),
+            TapirAdminAudit.admin_user.label('admin_id'),
+            TapirAdminAudit.log_date.label('issued_when'),
+            func.cast(True, Boolean).label('used'),
+            literal('').label('secret'),
+        )
+        .where(
+            TapirAdminAudit.affected_user.in_(user_ids),
+            TapirAdminAudit.action == 'change-email'
+        )
+    )
+
+    return union_all(consumed, tapir_used, admin_changes).order_by('user_id', 'used_when')
+
+
+def _change_row(row) -> EmailChangeRow:
+    return (int(row.used_when), row.old_email or "", row.new_email or "", int(row.admin_id or 0),
+            int(row.issued_when or 0), bool(row.used), row.secret or "")
+
+
+def query_email_changes_many(session: Session, user_ids: List[int]) -> Dict[int, List[EmailChangeRow]]:
+    """
+    Runs the union query for the users, one statement per chunk of users.
+
+    :return: user id -> the user's changes. Every user id is present.
+    """
+    changes: Dict[int, List[EmailChangeRow]] = {int(user_id): [] for user_id in user_ids}
+    for chunk in chunked(list(changes)):
+        for row in session.execute(email_change_union(chunk)).all():
+            changes[int(row.user_id)].append(_change_row(row))
+    return changes
+
+
+def query_email_changes(session: Session, user_id: int) -> List[EmailChangeRow]:
+    """The union query for one user."""
+    return query_email_changes_many(session, [int(user_id)])[int(user_id)]
+
+
+def load_email_changes(session: Session, user_id: int, for_update: bool = False) -> Optional[List[EmailChangeRow]]:
+    """
+    The materialized changes of the user. None when the user has no record yet.
+    """
+    if not _email_history_enabled:
+        return None
+    statement = select(t_arxiv_email_history.c.changes).where(t_arxiv_email_history.c.user_id == int(user_id))
+    if for_update:
+        statement = statement.with_for_update()
+    changes = session.execute(statement).scalar_one_or_none()
+    if changes is None:
+        return None
+    return [tuple(change) for change in json.loads(changes)]
+
+
+def load_email_changes_many(session: Session, user_ids: List[int]) -> Dict[int, List[EmailChangeRow]]:
+    """
+    Batched load_email_changes.
+
+    :return: user id -> the user's changes. Users without the record are absent.
+    """
+    changes: Dict[int, List[EmailChangeRow]] = {}
+    if not _email_history_enabled:
+        return changes
+    for chunk in chunked([int(user_id) for user_id in user_ids]):
+        for user_id, user_changes in session.execute(
+                select(t_arxiv_email_history.c.user_id, t_arxiv_email_history.c.changes)
+                .where(t_arxiv_email_history.c.user_id.in_(chunk))).all():
+            changes[int(user_id)] = [tuple(change) for change in json.loads(user_changes)]
+    return changes
+
+
+def email_holder_user_ids(session: Session, email: str) -> List[int]:
+    """
+    The users who have ever held the email address - now, or on either side of any change that
+    email_change_union sees. The data of a change-email admin audit record is the new email, or
+    "old new" in the legacy records (build_user_email_history splits them).
+
+    :return: user ids, in order
+    """
+    holders = union(
+        select(TapirUser.user_id.label('user_id')).where(TapirUser.email == email),
+        select(TapirEmailChangeToken.user_id.label('user_id'))
+        .where(
+            or_(TapirEmailChangeToken.old_email == email, TapirEmailChangeToken.new_email == email),
+            TapirEmailChangeToken.used == 1,
+            TapirEmailChangeToken.consumed_when.isnot(None)
+        ),
+        select(t_tapir_email_change_tokens_used.c.user_id.label('user_id'))
+        .select_from(
+            t_tapir_email_change_tokens_used.join(
+                TapirEmailChangeToken,
+                t_tapir_email_change_tokens_used.c.secret == TapirEmailChangeToken.secret
+            )
+        )
+        .where(
+            or_(TapirEmailChangeToken.old_email == email, TapirEmailChangeToken.new_email == email),
+            TapirEmailChangeToken.consumed_when.is_(None)
+        ),
+        select(TapirAdminAudit.affected_user.label('user_id'))
+        .where(
+            TapirAdminAudit.action == 'change-email',
+            or_(TapirAdminAudit.data == email,
+                TapirAdminAudit.data.startswith(email + " ", autoescape=True),
+                TapirAdminAudit.data.endswith(" " + email, autoescape=True))
+        ),
+    ).order_by('user_id')
+    return [int(user_id) for user_id in session.execute(holders).scalars()]
+
+
+def lock_users(session: Session, user_ids: List[int]) -> List[int]:
+    """
+    Locks the users' tapir_users rows (SELECT ... FOR UPDATE) until the transaction ends.
+
+    :return: the user ids found, in order
+    """
+    locked: List[int] = []
+    for chunk in chunked(sorted(int(user_id) for user_id in user_ids)):
+        locked.extend(session.execute(
+            select(TapirUser.user_id).where(TapirUser.user_id.in_(chunk))
+            .order_by(TapirUser.user_id).with_for_update()).scalars())
+    return locked
+
+
+def store_email_changes(session: Session, user_id: int, changes: List[EmailChangeRow]) -> None:
+    """
+    Writes the user's record, replacing the existing one. One upsert, so that two writers of a new
+    record do not collide on the primary key. Core statement - the caller commits.
+    """
+    statement = mysql_insert(t_arxiv_email_history).values(
+        user_id=int(user_id),
+        changes=json.dumps(sorted(changes, key=lambda change: change[USED_WHEN]),
+                           ensure_ascii=False, separators=(",", ":")),
+        updated=int(time.time()),
+    )
+    session.execute(statement.on_duplicate_key_update(changes=statement.inserted.changes,
+                                                      updated=statement.inserted.updated))
+
+
+def rebuild_email_history(session: Session, user_id: int) -> List[EmailChangeRow]:
+    """Materializes the user's changes from the union query. The caller commits."""
+    changes = query_email_changes(session, user_id)
+    store_email_changes(session, user_id, changes)
+    return changes
+
+
+def append_email_change(session: Session, user_id: int, change: EmailChangeRow) -> bool:
+    """
+    Adds a change to the user's record. A token change replaces the row of the same token.
+    A user without a record is left alone - the reads use the union query, which includes this
+    change, until the backfill builds the record.
+
+    :return: whether the record was updated
+    """
+    if not _email_history_enabled:
+        return False
+    # Waits for a backfill of the user to commit, or makes it wait for this transaction
+    lock_users(session, [user_id])
+    changes = load_email_changes(session, user_id, for_update=True)
+    if changes is None:
+        return False
+    if change[SECRET]:
+        changes = [existing for existing in changes if existing[SECRET] != change[SECRET]]
+    changes.append(change)
+    store_email_changes(session, user_id, changes)
+    return True
+
+
+def backfill_email_history(session: Session, after_user_id: int = 0, batch_size: int = 500,
+                           max_users: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Materializes the email history of every user, in user id order, committing per batch.
+    Interrupted backfill resumes with the returned last user id as after_user_id.
+
+    The batch's users are locked before their union is read, and stay locked until the record is stored -
+    a change committed meanwhile by a writer that found no record would be in neither.
+
+    :param session: SQLAlchemy session
+    :param after_user_id: start after this user
+    :param batch_size: users per union query and per commit
+    :param max_users: stop after this many users
+    :return: (users done, last user id)
+    """
+    done = 0
+    last_user_id = after_user_id
+    # Each batch in a fresh transaction that starts with the lock - a REPEATABLE READ snapshot taken
+    # before it would hide the changes committed while the batch waited for the lock
+    session.commit()
+    while max_users is None or done < max_users:
+        limit = batch_size if max_users is None else min(batch_size, max_users - done)
+        user_ids = list(session.execute(
+            select(TapirUser.user_id)
+            .where(TapirUser.user_id > last_user_id)
+            .order_by(TapirUser.user_id)
+            .limit(limit)
+            .with_for_update()).scalars())
+        if not user_ids:
+            break
+        for user_id, changes in query_email_changes_many(session, user_ids).items():
+            store_email_changes(session, user_id, changes)
+        session.commit()
+        done += len(user_ids)
+        last_user_id = user_ids[-1]
+        logger.info("Email history backfilled for %d users, up to user %d", done, last_user_id)
+    # The last locking read may have found no user
+    session.commit()
+    return done, last_user_id
+
@@ -1,9 +1,7 @@
 """Contains route information."""
-import asyncio
 import base64
 import datetime
 import hashlib
-import socket
 from dataclasses import dataclass
 from logging import getLogger
 from typing import Optional, Dict
@@ -19,6 +17,8 @@ from starlette.types import ASGIApp, Receive, Scope, Send
 from arxiv.auth.legacy.exceptions import SessionExpired
 
 from .database import Database
+from .ttl_cache import TTLCache
+from .reverse_dns import get_reverse_dns_resolver
 
 
 DECODED_USER_CLAIMS_NAME = "DECODED_USER_CLAIMS"
@@ -51,7 +51,30 @@ COOKIE_ENV_NAMES = COOKIE_ENV_NAMES_TYPE(
 )
 
 
+# Verified user claims, keyed by the digest of secret + token. Decoding the same session cookie
+# over and over is pure CPU, and most of the traffic carries a small set of cookies.
+# Entries live until the token's own "exp", so a cache hit never outlives the token.
+VERIFIED_CLAIMS_CACHE: TTLCache[ArxivUserClaims] = TTLCache(maxsize=8192, default_ttl=300.0)
+
+
+def _claims_cache_key(token: str, jwt_secret: str) -> bytes:
+    return hashlib.sha256(jwt_secret.encode() + b"\0" + token.encode()).digest()
+
+
+def _claims_expiration(claims: ArxivUserClaims) -> Optional[float]:
+    try:
+        return float(claims._claims.exp)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def get_verified_claims_cache_stats() -> dict:
+    """Hit/miss counters of the verified claims cache."""
+    return VERIFIED_CLAIMS_CACHE.stats()
+
+
 def decode_user_claims(token: str, jwt_secret: str) -> ArxivUserClaims | None:
+    """Decodes and verifies the user claims JWT. Verified claims are cached until the token expires."""
     logger = getLogger(__name__)
     if not token:
         logger.error(f"There is no cookie")
@@ -60,6 +83,11 @@ def decode_user_claims(token: str, jwt_secret: str) -> ArxivUserClaims | None:
         logger.error("The app is misconfigured or no JWT secret has been set")
         return None
 
+    cache_key = _claims_cache_key(token, jwt_secret)
+    claims = VERIFIED_CLAIMS_CACHE.get(cache_key)
+    if claims is not None:
+        return claims
+
     kc_tokens = {}
     jwt_payload = token
 
@@ -93,6 +121,7 @@ def decode_user_claims(token: str, jwt_secret: str) -> ArxivUserClaims | None:
     if not claims:
         logger.info(f"unpacking token {token} failed")
         return None
+    VERIFIED_CLAIMS_CACHE.put(cache_key, claims, expires_at=_claims_expiration(claims))
     return claims
 
 
@@ -144,14 +173,11 @@ def get_client_host(request: Request) -> Optional[str]:
 
 
 async def get_hostname(ip_address: str, timeout: float = 1.0) -> str:
-    try:
-        host_name = await asyncio.wait_for(
-            asyncio.to_thread(socket.gethostbyaddr, ip_address),
-            timeout=timeout
-        )
-        return host_name[0]
-    except (asyncio.TimeoutError, socket.herror):
+    """Reverse DNS lookup through the shared resolver (cached, coalesced)."""
+    host_name = await get_reverse_dns_resolver().resolve(ip_address, timeout=timeout)
+    if host_name is None:
         return "Hostname could not be resolved"
+    return host_name
 
 
 async def get_client_host_name(request: Request) -> Optional[str]:
@@ -347,32 +373,38 @@ class TapirCookieToUserClaimsMiddleware:
             if tapir_cookie:
                 try:
                     # Import here to avoid circular imports
-                    from .bizmodels.tapir_to_user_claims import create_user_claims_from_tapir_cookie
+                    from .bizmodels.tapir_to_user_claims import create_user_claims_from_tapir_cookie, \
+                        get_cached_user_claims_from_tapir_cookie, cache_user_claims_from_tapir_cookie
                     from .database import Database
-                    
-                    # Get database session
-                    db = Database.get_from_global()
-                    session_gen = db.get_session()
-                    session = next(session_gen)
-                    
-                    try:
-                        # Create ArxivUserClaims from tapir cookie
-                        user_claims: ArxivUserClaims = create_user_claims_from_tapir_cookie(session, tapir_cookie)
-
-                        if user_claims:
-                            # Create JWT token from user claims
-                            token = user_claims.encode_jwt_token(jwt_secret)
-
-                            # Add Authorization header to the request
-                            headers[b"authorization"] = f"Bearer {token}".encode()
-                            scope["headers"] = list(headers.items())
-
-                            # Attach it to the state
-                            scope["state"][DECODED_USER_CLAIMS_NAME] = user_claims
-
-                    finally:
-                        session.close()
-                        
+
+                    # The claims of a tapir session do not change often. Skip the DB when we have seen it.
+                    user_claims: ArxivUserClaims | None = get_cached_user_claims_from_tapir_cookie(tapir_cookie)
+
+                    if user_claims is None:
+                        # Get database session
+                        db = Database.get_from_global()
+                        session_gen = db.get_session()
+                        session = next(session_gen)
+
+                        try:
+                            # Create ArxivUserClaims from tapir cookie
+                            user_claims = create_user_claims_from_tapir_cookie(session, tapir_cookie)
+                            if user_claims:
+                                cache_user_claims_from_tapir_cookie(tapir_cookie, user_claims)
+                        finally:
+                            session.close()
+
+                    if user_claims:
+                        # Create JWT token from user claims
+                        token = user_claims.encode_jwt_token(jwt_secret)
+
+                        # Add Authorization header to the request
+                        headers[b"authorization"] = f"Bearer {token}".encode()
+                        scope["headers"] = list(headers.items())
+
+                        # Attach it to the state
+                        scope["state"][DECODED_USER_CLAIMS_NAME] = user_claims
+
                 except SessionExpired:
                     logger = getLogger(__name__)
                     logger.debug("Tapir cookie expired. (normal)")
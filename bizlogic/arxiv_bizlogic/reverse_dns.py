@@ -0,0 +1,110 @@
+"""
+Reverse DNS lookup of client IP addresses, for tapir sessions and admin audit records.
+
+socket.gethostbyaddr blocks, and an unresolvable address can take seconds. The resolver runs
+the lookups on a small thread pool, caches the answers (negative ones too, for a shorter time)
+and lets concurrent requests for the same address share one lookup.
+"""
+import asyncio
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from logging import getLogger
+from typing import Dict, Optional
+
+from .ttl_cache import TTLCache
+
+# The cache stores "" for an address that does not resolve
+_UNRESOLVED = ""
+
+
+class ReverseDNSResolver:
+    """
+    :param maxsize: number of addresses to remember
+    :param ttl: seconds to keep a resolved host name
+    :param negative_ttl: seconds to keep the fact that an address does not resolve
+    :param timeout: default seconds to wait for a lookup
+    :param max_workers: number of lookup threads
+    """
+
+    def __init__(self, maxsize: int = 8192, ttl: float = 3600.0, negative_ttl: float = 300.0,
+                 timeout: float = 1.0, max_workers: int = 4):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self._cache: TTLCache[str] = TTLCache(maxsize=maxsize, default_ttl=ttl)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="reverse-dns")
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.coalesced = 0
+
+    def _lookup(self, ip_address: str) -> Optional[str]:
+        with self._lock:
+            self.lookups += 1
+        try:
+            host_name = socket.gethostbyaddr(ip_address)[0]
+        except (OSError, UnicodeError, ValueError):
+            getLogger(__name__).debug("reverse lookup failed for %s", ip_address)
+            self._cache.put(ip_address, _UNRESOLVED, ttl=self.negative_ttl)
+            return None
+        self._cache.put(ip_address, host_name)
+        return host_name
+
+    def _forget_in_flight(self, ip_address: str, future: asyncio.Future) -> None:
+        if self._in_flight.get(ip_address) is future:
+            del self._in_flight[ip_address]
+
+    def cached(self, ip_address: str) -> Optional[str]:
+        """Returns the cached answer: host name, "" for unresolvable, or None when not known."""
+        return self._cache.get(ip_address)
+
+    async def resolve(self, ip_address: str, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Returns the host name of the address, or None if it does not resolve in time.
+        Concurrent calls for the same address wait on the same lookup.
+        """
+        if not ip_address:
+            return None
+        known = self._cache.get(ip_address)
+        if known is not None:
+            return known if known != _UNRESOLVED else None
+
+        loop = asyncio.get_running_loop()
+        future = self._in_flight.get(ip_address)
+        if future is None or future.get_loop() is not loop:
+            future = loop.run_in_executor(self._pool, self._lookup, ip_address)
+            self._in_flight[ip_address] = future
+            future.add_done_callback(lambda done: self._forget_in_flight(ip_address, done))
+        else:
+            self.coalesced += 1
+
+        try:
+            # shield - a caller giving up must not cancel the lookup the others are waiting for
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            # The lookup keeps going and fills the cache when it finishes.
+            return None
+
+    def resolve_blocking(self, ip_address: str, timeout: Optional[float] = None) -> Optional[str]:
+        """Same as resolve() for sync code, without the coalescing."""
+        if not ip_address:
+            return None
+        known = self._cache.get(ip_address)
+        if known is not None:
+            return known if known != _UNRESOLVED else None
+        try:
+            return self._pool.submit(self._lookup, ip_address).result(self.timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            return None
+
+    def stats(self) -> dict:
+        return dict(self._cache.stats(), lookups=self.lookups, coalesced=self.coalesced,
+                    in_flight=len(self._in_flight))
+
+
+_resolver = ReverseDNSResolver()
+
+
+def get_reverse_dns_resolver() -> ReverseDNSResolver:
+    return _resolver
@@ -0,0 +1,92 @@
+"""
+Small, thread-safe LRU cache with per-entry expiration.
+
+The request hot path runs in both the event loop and the threadpool FastAPI uses for
+sync dependencies, so every operation takes the lock.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """
+    Bounded LRU cache where each entry carries its own expiry (epoch seconds).
+
+    :param maxsize: maximum number of entries. Least recently used entries are evicted first.
+    :param default_ttl: seconds to keep an entry when `put` is not given an explicit expiry.
+    :param clock: time source, for tests.
+    """
+
+    def __init__(self, maxsize: int = 4096, default_ttl: float = 300.0,
+                 clock: Callable[[], float] = time.time):
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """Returns the cached value, or None when absent or expired."""
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: V, expires_at: Optional[float] = None, ttl: Optional[float] = None) -> None:
+        """
+        Stores the value.
+
+        :param expires_at: absolute expiry in epoch seconds.
+        :param ttl: seconds to keep the value, when expires_at is not given. Defaults to default_ttl.
+        """
+        now = self._clock()
+        if expires_at is None:
+            expires_at = now + (self.default_ttl if ttl is None else ttl)
+        if expires_at <= now or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        """Drops the entry. Returns True if there was one."""
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for the status endpoints and tests."""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
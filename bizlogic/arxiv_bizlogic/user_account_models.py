@@ -15,7 +15,7 @@ from arxiv.db.models import TapirNickname, TapirUsersPassword, TapirUser, Demogr
 from arxiv.auth.legacy.exceptions import RegistrationFailed  # type: ignore
 from arxiv.auth.legacy import passwords
 from pydantic import BaseModel, field_validator
-from sqlalchemy import and_
+from sqlalchemy import and_, tuple_
 from sqlalchemy.exc import IntegrityError
 
 from sqlalchemy.orm import Session
@@ -23,7 +23,7 @@ from sqlalchemy.orm import Session
 # datetime_to_epoch
 # from ..account import AccountRegistrationModel, AccountRegistrationError, AccountInfoModel
 
-from arxiv_bizlogic.bizmodels.user_model import UserModel, USER_MODEL_DEFAULTS, VetoStatusEnum
+from arxiv_bizlogic.bizmodels.user_model import UserModel, USER_MODEL_DEFAULTS, VetoStatusEnum, UserProjection, chunked
 from arxiv_bizlogic.fastapi_helpers import datetime_to_epoch
 
 logger = logging.getLogger(__name__)
@@ -258,65 +258,132 @@ def um_to_group_name(group_flag: Tuple[str, str], um: UserModel) -> Optional[str
     return group_name if hasattr(um, flag_name) and getattr(um, flag_name) else None
 
 
-def get_account_info(session: Session, user_id: str, include_invalid_user: bool=True) -> Optional[AccountInfoModel]:
-    um = UserModel.one_user(session, user_id)
-    if um:
-        if (not include_invalid_user) and (um.flag_deleted or um.flag_banned):
-            return None
+def _account_info_from_user_model(um: UserModel, category_model: Optional[CategoryIdModel],
+                                  orcid: Optional[str], orcid_authenticated: bool,
+                                  author_id: Optional[str]) -> AccountInfoModel:
+    groups = [um_to_group_name(group_flag, um) for group_flag in Demographic.GROUP_FLAGS]
+
+    scopes = None
+    for flag, value in [
+        ("admin", um.flag_edit_users),
+        ("root", um.flag_edit_system),
+        ("mod", um.flag_is_mod),
+        ("tex", um.flag_allow_tex_produced),
+        ("can-lock", um.flag_can_lock),
+        ]:
+        if value:
+            if scopes is None:
+                scopes = [flag]
+            else:
+                scopes.append(flag)
+
+    return AccountInfoModel(
+        id = str(um.id),
+        username = um.username,
+        email = um.email,
+        oidc_id=None,
+        email_verified = True if um.flag_email_verified else False,
+        scopes = scopes,
+        first_name = um.first_name,
+        last_name = um.last_name,
+        suffix_name = um.suffix_name,
+        country = um.country,
+        affiliation = um.affiliation,
+        url = um.url,
+        default_category = category_model,
+        groups = [CategoryGroup(group) for group in groups if group is not None],
+        joined_date = datetime_to_epoch(None, um.joined_date),
+        career_status = get_career_status(um.type),
+        tracking_cookie=um.tracking_cookie,
+        veto_status=um.veto_status,
+        orcid_id = orcid,
+        orcid_authenticated = orcid_authenticated,
+        author_id = author_id,
+    )
 
-        groups = [um_to_group_name(group_flag, um) for group_flag in Demographic.GROUP_FLAGS]
 
-        category: Optional[Category] = session.query(Category).filter(
-            and_(
-                Category.archive == um.archive,
-                Category.subject_class == um.subject_class
-            )
-        ).one_or_none()
-
-        category_model = CategoryIdModel.model_validate(category) if category else None
-
-        scopes = None
-        for flag, value in [
-            ("admin", um.flag_edit_users),
-            ("root", um.flag_edit_system),
-            ("mod", um.flag_is_mod),
-            ("tex", um.flag_allow_tex_produced),
-            ("can-lock", um.flag_can_lock),
-            ]:
-            if value:
-                if scopes is None:
-                    scopes = [flag]
-                else:
-                    scopes.append(flag)
-
-        orcid_id: OrcidIds | None = session.query(OrcidIds).filter(OrcidIds.user_id == um.id).one_or_none()
-        arxiv_author_id: AuthorIds | None = session.query(AuthorIds).filter(AuthorIds.user_id == um.id).one_or_none()
-
-        account = AccountInfoModel(
-            id = str(um.id),
-            username = um.username,
-            email = um.email,
-            oidc_id=None,
-            email_verified = True if um.flag_email_verified else False,
-            scopes = scopes,
-            first_name = um.first_name,
-            last_name = um.last_name,
-            suffix_name = um.suffix_name,
-            country = um.country,
-            affiliation = um.affiliation,
-            url = um.url,
-            default_category = category_model,
-            groups = [CategoryGroup(group) for group in groups if group is not None],
-            joined_date = datetime_to_epoch(None, um.joined_date),
-            career_status = get_career_status(um.type),
-            tracking_cookie=um.tracking_cookie,
-            veto_status=um.veto_status,
-            orcid_id = orcid_id.orcid if orcid_id else None,
-            orcid_authenticated = True if orcid_id and orcid_id.authenticated else False,
-            author_id = arxiv_author_id.author_id if arxiv_author_id else None,
+def get_account_info(session: Session, user_id: str, include_invalid_user: bool=True) -> Optional[AccountInfoModel]:
+    """
+    Account info of the user, in one statement. The user columns, the default category,
+    the ORCID id and the arXiv author id are outer-joined onto UserModel.base_select.
+    AccountInfoModel does not carry the moderator lists, so they are not loaded.
+    """
+    row = (
+        UserModel.base_select(session)
+        .add_columns(
+            Category.archive.label("category_archive"),
+            Category.subject_class.label("category_subject_class"),
+            OrcidIds.authenticated.label("orcid_authenticated"),
+            AuthorIds.author_id.label("author_id"),
         )
-        return account
-    return None
+        .outerjoin(Category, and_(
+            Category.archive == Demographic.archive,
+            Category.subject_class == Demographic.subject_class
+        ))
+        .outerjoin(AuthorIds, AuthorIds.user_id == TapirUser.user_id)
+        .filter(TapirUser.user_id == user_id)
+        .one_or_none()
+    )
+    if row is None:
+        return None
+
+    um = UserModel.to_model(row)
+    if (not include_invalid_user) and (um.flag_deleted or um.flag_banned):
+        return None
+
+    category_model = CategoryIdModel(archive=row.category_archive, subject_class=row.category_subject_class) \
+        if row.category_archive is not None else None
+    return _account_info_from_user_model(um, category_model, row.orcid, bool(row.orcid and row.orcid_authenticated),
+                                         row.author_id)
+
+
+def get_account_info_many(session: Session, user_ids: List[str], include_invalid_user: bool=True) -> List[Optional[AccountInfoModel]]:
+    """
+    Batched get_account_info. Instead of 4+ queries per user, runs a fixed number of
+    queries per chunk of ids (users, moderators, categories, ORCID ids, author ids).
+
+    :param session: DB session
+    :param user_ids: user ids
+    :param include_invalid_user: when False, deleted or banned users come back as None
+    :return: account info in the same order as user_ids. None where there is none.
+    """
+    users = UserModel.many_users(session, user_ids)
+    valid: Dict[int, UserModel] = {}
+    for um in users:
+        if um is None:
+            continue
+        if (not include_invalid_user) and (um.flag_deleted or um.flag_banned):
+            continue
+        valid[int(um.id)] = um
+
+    categories: Dict[Tuple[str, str], Category] = {}
+    orcid_ids: Dict[int, OrcidIds] = {}
+    author_ids: Dict[int, AuthorIds] = {}
+    valid_ids = list(valid.keys())
+    for chunk in chunked(valid_ids):
+        pairs = list({(valid[uid].archive, valid[uid].subject_class) for uid in chunk
+                      if valid[uid].archive is not None and valid[uid].subject_class is not None})
+        if pairs:
+            for category in session.query(Category).filter(
+                    tuple_(Category.archive, Category.subject_class).in_(pairs)).all():
+                categories[(category.archive, category.subject_class)] = category
+        for orcid_id in session.query(OrcidIds).filter(OrcidIds.user_id.in_(chunk)).all():
+            orcid_ids[int(orcid_id.user_id)] = orcid_id
+        for arxiv_author_id in session.query(AuthorIds).filter(AuthorIds.user_id.in_(chunk)).all():
+            author_ids[int(arxiv_author_id.user_id)] = arxiv_author_id
+
+    accounts: Dict[int, AccountInfoModel] = {}
+    for uid, um in valid.items():
+        category = categories.get((um.archive, um.subject_class))
+        orcid_id = orcid_ids.get(uid)
+        arxiv_author_id = author_ids.get(uid)
+        accounts[uid] = _account_info_from_user_model(
+            um,
+            CategoryIdModel.model_validate(category) if category else None,
+            orcid_id.orcid if orcid_id else None,
+            True if orcid_id and orcid_id.authenticated else False,
+            arxiv_author_id.author_id if arxiv_author_id else None)
+    return [accounts.get(int(user_id)) for user_id in user_ids]
 
 
 
@@ -421,7 +488,7 @@ def is_user_account_valid(session: Session, user_id: str) -> bool:
     :return: A boolean indicating whether the user account is valid.
     :rtype: bool
     """
-    tu: TapirUser | None = session.query(TapirUser).filter(TapirUser.user_id == user_id).one_or_none()
-    if tu:
-        return not (tu.flag_banned == 1 or tu.flag_deleted == 1)
+    flags = UserModel.one_user(session, user_id, UserProjection.auth_flags)
+    if flags:
+        return flags.is_valid_account
     return True
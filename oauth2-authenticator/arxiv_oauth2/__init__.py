@@ -1,16 +1,21 @@
 """Contains route information."""
 from typing import Optional, Literal
+from http.cookies import SimpleCookie
 import dataclasses
+import functools
 
 from keycloak import KeycloakAdmin
 from arxiv_bizlogic.fastapi_helpers import (
     decode_user_claims, get_current_user, get_db, get_current_user_or_none, get_hostname, get_client_host_name,
     get_client_host, get_current_user_access_token, sha256_base64_encode, datetime_to_epoch, COOKIE_ENV_NAMES
     )
-from fastapi import Depends, Request, HTTPException, status
+from fastapi import Depends, Request, HTTPException, status, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from arxiv.auth.user_claims import ArxivUserClaims
+from arxiv_bizlogic.audit_queue import AdminAuditQueue, ADMIN_AUDIT_QUEUE
+
+from .keycloak_admin_async import AsyncKeycloakAdminProtocol, KEYCLOAK_ASYNC_ADMIN
 
 ALGORITHM = "HS256"
 KEYCLOAK_ADMIN = 'KEYCLOAK_ADMIN'
@@ -18,6 +23,10 @@ KEYCLOAK_ADMIN = 'KEYCLOAK_ADMIN'
 def get_keycloak_admin(request: Request) -> KeycloakAdmin:
     return request.app.extra[KEYCLOAK_ADMIN]
 
+
+def get_async_keycloak_admin(request: Request) -> AsyncKeycloakAdminProtocol:
+    return request.app.extra[KEYCLOAK_ASYNC_ADMIN]
+
 class ApiToken(BaseModel):
     token: str
 
@@ -94,7 +103,12 @@ def get_authn_or_none(
     return None
 
 
-@dataclasses.dataclass
+COOKIE_PARAMS = 'COOKIE_PARAMS'
+
+_EXPIRED_COOKIE_DATE = "Thu, 01 Jan 1970 00:00:00 GMT"
+
+
+@dataclasses.dataclass(frozen=True)
 class CookieParams:
     auth_session_cookie_name: str    # ArxivUserClaims (deprecated)
     classic_cookie_name: str         # classic cookie name
@@ -107,9 +121,46 @@ class CookieParams:
     jwt_secret: str                  # JWT secret
     max_age: int
 
+    @functools.cached_property
+    def _common_attributes(self) -> str:
+        attributes = ""
+        if self.domain:
+            attributes += f"; Domain={self.domain}"
+        return attributes
 
-def cookie_params(request: Request) -> CookieParams:
+    @functools.cached_property
+    def _set_cookie_attributes(self) -> str:
+        """Attributes of a live cookie. Same as response.set_cookie(..., path="/", httponly=True)"""
+        attributes = f"{self._common_attributes}; HttpOnly; Max-Age={self.max_age}; Path=/; SameSite={self.samesite}"
+        if self.secure:
+            attributes += "; Secure"
+        return attributes
+
+    @functools.cached_property
+    def _delete_cookie_attributes(self) -> str:
+        """Attributes of a cookie being removed."""
+        attributes = f"{self._common_attributes}; expires={_EXPIRED_COOKIE_DATE}; Max-Age=0; Path=/; SameSite={self.samesite}"
+        if self.secure:
+            attributes += "; Secure"
+        return attributes
+
+    def set_cookie(self, response: Response, key: str, value: str) -> None:
+        """Adds the Set-Cookie header with the prebuilt attributes. Only the value is encoded per call."""
+        coded_value = _cookie_quoter.value_encode(value)[1]
+        response.raw_headers.append((b"set-cookie", f"{key}={coded_value}{self._set_cookie_attributes}".encode("latin-1")))
+
+    def delete_cookie(self, response: Response, key: str) -> None:
+        """Adds the Set-Cookie header that removes the cookie."""
+        response.raw_headers.append((b"set-cookie", f'{key}=""{self._delete_cookie_attributes}'.encode("latin-1")))
+
+
+_cookie_quoter = SimpleCookie()
+
+
+def build_cookie_params(extra: dict) -> CookieParams:
     """
+    Builds the cookie parameters from the app config. create_app does this once and keeps it in app.extra.
+
         AUTH_SESSION_COOKIE_NAME=AUTH_SESSION_COOKIE_NAME,
         KEYCLOAK_ACCESS_COOKIE_NAME=KEYCLOAK_ACCESS_TOKEN_NAME,
         KEYCLOAK_REFRESH_TOKEN_NAME=KEYCLOAK_ACCESS_TOKEN_NAME,
@@ -117,17 +168,30 @@ def cookie_params(request: Request) -> CookieParams:
         ARXIVNG_COOKIE_NAME=ARXIVNG_COOKIE_NAME,
 
     """
-
     return CookieParams(
-        auth_session_cookie_name=request.app.extra[COOKIE_ENV_NAMES.auth_session_cookie_env],
-        classic_cookie_name=request.app.extra[COOKIE_ENV_NAMES.classic_cookie_env],
-        keycloak_access_token_name=request.app.extra[COOKIE_ENV_NAMES.keycloak_access_token_env],
-        keycloak_refresh_token_name=request.app.extra[COOKIE_ENV_NAMES.keycloak_refresh_token_env],
-        ng_cookie_name=request.app.extra[COOKIE_ENV_NAMES.ng_cookie_env],
-        domain=request.app.extra.get('DOMAIN'),
-        secure=request.app.extra.get('SECURE', True),
-        samesite=request.app.extra.get('SAMESITE', "lax"),
-        jwt_secret=request.app.extra.get('JWT_SECRET', "jwt secret is not set"),
-        max_age=int(request.app.extra['COOKIE_MAX_AGE']),
+        auth_session_cookie_name=extra[COOKIE_ENV_NAMES.auth_session_cookie_env],
+        classic_cookie_name=extra[COOKIE_ENV_NAMES.classic_cookie_env],
+        keycloak_access_token_name=extra[COOKIE_ENV_NAMES.keycloak_access_token_env],
+        keycloak_refresh_token_name=extra[COOKIE_ENV_NAMES.keycloak_refresh_token_env],
+        ng_cookie_name=extra[COOKIE_ENV_NAMES.ng_cookie_env],
+        domain=extra.get('DOMAIN'),
+        secure=extra.get('SECURE', True),
+        samesite=extra.get('SAMESITE', "lax"),
+        jwt_secret=extra.get('JWT_SECRET', "jwt secret is not set"),
+        max_age=int(extra['COOKIE_MAX_AGE']),
     )
 
+
+def cookie_params(request: Request) -> CookieParams:
+    """Returns the cookie parameters frozen at app start up."""
+    cparams = request.app.extra.get(COOKIE_PARAMS)
+    if cparams is None:
+        # App not made by create_app
+        cparams = build_cookie_params(request.app.extra)
+        request.app.extra[COOKIE_PARAMS] = cparams
+    return cparams
+
+
+def get_admin_audit_queue(request: Request) -> AdminAuditQueue | None:
+    """Returns the admin audit queue. None when the app is not made by create_app - audit in the session."""
+    return request.app.extra.get(ADMIN_AUDIT_QUEUE)
@@ -6,7 +6,7 @@ import json
 import re
 from datetime import datetime, timezone
 import random
-from typing import Optional, List
+from typing import Optional, List, Tuple
 
 import keycloak
 from arxiv.auth.openid.oidc_idp import ArxivOidcIdpClient
@@ -18,7 +18,8 @@ from arxiv_bizlogic.fastapi_helpers import get_current_user_access_token, get_cl
 from arxiv_bizlogic.audit_event import admin_audit, AdminAudit_ChangeEmail, AdminAudit_ChangePassword, \
     AdminAudit_SetEmailVerified, AdminAudit_SuspendUser, AdminAudit_UnuspendUser, AdminAudit_SetEditUsers, \
     AdminAudit_SetEditSystem, AdminAudit_MakeModerator, AdminAudit_UnmakeModerator, AdminAudit_SetCanLock, \
-    AdminAudit_ChangeDemographic
+    AdminAudit_ChangeDemographic, AdminAuditEvent
+from arxiv_bizlogic.audit_queue import write_admin_audit
 from fastapi import APIRouter, Depends, status, HTTPException, Request, Response, Query
 
 from sqlalchemy.orm import Session
@@ -33,22 +34,28 @@ from arxiv.db.models import TapirUser, TapirNickname, TapirUsersPassword, OrcidI
 from arxiv.auth.legacy import passwords
 from sqlalchemy.sql.functions import current_user
 
-from . import (get_current_user_or_none, get_db, get_keycloak_admin, stateless_captcha,
+from . import (get_current_user_or_none, get_db, get_keycloak_admin, get_async_keycloak_admin, stateless_captcha,
                get_client_host, sha256_base64_encode,
                verify_bearer_token, ApiToken, is_super_user, describe_super_user, check_authnz,
-               is_authorized, get_authn_or_none, get_arxiv_user_claims)  # , get_client_host
+               is_authorized, get_authn_or_none, get_arxiv_user_claims, get_admin_audit_queue)  # , get_client_host
 from .biz.account_biz import (AccountInfoModel, get_account_info,
                               AccountRegistrationError, AccountRegistrationModel,
                               migrate_to_keycloak,
-                              kc_validate_access_token, kc_send_verify_email, register_arxiv_account,
+                              kc_verify_access_token, kc_send_verify_email, register_arxiv_account,
                               update_tapir_account, AccountIdentifierModel, kc_login_with_client_credential,
                               AccountUserNameBaseModel)
 from .biz.cold_migration import cold_migrate
-from .biz.email_history_biz import EmailHistoryBiz, EmailChangeEntry, EmailChangeRequest
+from .biz.profile_sync import kc_profile, known_kc_profile, sync_kc_profile
+from .biz.email_history_biz import EmailHistoryBiz, EmailChangeEntry, EmailChangeRequest, UserEmailHistory, \
+    get_user_email_history_many, get_email_holders_history
 from arxiv_bizlogic.validation.password_validator import validate_password_strength, MIN_PASSWORD_LENGTH, \
     check_hashed_password
 # from . import stateless_captcha
 from .captcha import CaptchaTokenReplyModel, get_captcha_token
+from .blocking_executor import run_blocking
+from .keycloak_admin_async import AsyncKeycloakAdminProtocol
+from .keycloak_user_cache import KEYCLOAK_USER_CACHE, KeycloakUserCache
+from .keycloak_token_validator import KEYCLOAK_TOKEN_VALIDATOR
 from .stateless_captcha import InvalidCaptchaToken, InvalidCaptchaValue
 
 logger = logging.getLogger(__name__)
@@ -95,17 +102,47 @@ async def get_user_profile(user_id: str,
 # about refactor these two.
 @router.put('/{user_id:str}/profile', description="Update the user account profile for both Keycloak and user in db")
 async def update_account_profile(
+        request: Request,
         user_id: str,
         data: AccountInfoModel,
         authn: Optional[ArxivUserClaims | ApiToken] = Depends(get_authn_or_none),
         session: Session = Depends(get_db),
-        kc_admin: KeycloakAdmin = Depends(get_keycloak_admin),
+        kc_admin: AsyncKeycloakAdminProtocol = Depends(get_async_keycloak_admin),
         remote_ip: Optional[str] = Depends(get_client_host),
         remote_hostname: Optional[str] = Depends(get_client_host_name),
 ) -> AccountInfoModel:
     """
     Update the profile name of a user.
     """
+    tapir_user_id, kc_update = await run_blocking(request, _update_account_profile, user_id, data, authn, session,
+                                                  remote_ip, remote_hostname,
+                                                  request.app.extra.get(KEYCLOAK_USER_CACHE))
+    if kc_update is not None:
+        # Nothing is committed yet - a failed Keycloak update rolls back the Tapir one
+        profile, known = kc_update
+        try:
+            await sync_kc_profile(kc_admin, tapir_user_id, profile, known)
+        except KeycloakPutError as kc_exc:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                detail=f"Failed to update user profile on Keycloak: {kc_exc}") from kc_exc
+    return await run_blocking(request, _commit_account_profile, session, tapir_user_id)
+
+
+def _update_account_profile(
+        user_id: str,
+        data: AccountInfoModel,
+        authn: Optional[ArxivUserClaims | ApiToken],
+        session: Session,
+        remote_ip: Optional[str],
+        remote_hostname: Optional[str],
+        user_cache: Optional[KeycloakUserCache] = None,
+) -> Tuple[str, Optional[Tuple[dict, dict]]]:
+    """
+    DB part of update_account_profile, up to the commit. Runs on the blocking executor.
+
+    :return: the user id, and the kc_profile and known_kc_profile to sync to Keycloak - None when the name
+        did not change.
+    """
     assert user_id == data.id
     check_authnz(authn, None, user_id)
 
@@ -172,16 +209,11 @@ async def update_account_profile(
             update_name = True
             break
 
+    kc_update = None
     if update_name:
-        changes = {"firstName": new_data["first_name"],
-                   "lastName": new_data["last_name"]}
-        try:
-            kc_admin.update_user(user_id=str(tapir_user.user_id), payload=changes)
-        except KeycloakPutError as kc_exc:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                                detail=f"Failed to update user profile on Keycloak: {kc_exc}") from kc_exc
+        # Only what Keycloak does not have yet - the suffix alone is Tapir only
+        kc_update = kc_profile(um), known_kc_profile(user_cache, str(tapir_user.user_id), existing_user)
 
-        changes['suffix_name'] = new_data['suffix_name']
         if isinstance(authn, ArxivUserClaims):
             current_user:ArxivUserClaims = authn
             if current_user.is_admin:
@@ -209,8 +241,13 @@ async def update_account_profile(
                     )
                 )
 
+    return str(tapir_user.user_id), kc_update
+
+
+def _commit_account_profile(session: Session, user_id: str) -> AccountInfoModel:
+    """Commit of update_account_profile. Runs on the blocking executor."""
     session.commit()
-    return reply_account_info(session, str(tapir_user.user_id))
+    return reply_account_info(session, user_id)
 
 
 class AccountUserNameUpdateModel(AccountUserNameBaseModel):
@@ -776,28 +813,24 @@ def change_email(
         if claims:
             tapir_session_id = claims.tapir_session_id
 
-        # add audit record
-        admin_audit(
-            session,
-            AdminAudit_ChangeEmail(
-                authn_user.user_id,
-                user_id,
-                tapir_session_id,
-                email=body.new_email,
-                remote_ip=remote_ip,
-                remote_hostname=remote_hostname,
-                tracking_cookie=tracking_cookie,
-                comment='' if body.comment is None else body.comment,
-            ))
-        logger.info("User %s email set by admin %s from %s to %s", user_id, authn_user.user_id, old_email, body.new_email)
-
         # Audit the email verified
         if not authn_user.user_id:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                                 detail="Authorized user has no user ID. ")
 
-        admin_audit(
-            session,
+        # add audit records - the email change and the email verified
+        change_email_event = AdminAudit_ChangeEmail(
+            authn_user.user_id,
+            user_id,
+            tapir_session_id,
+            email=body.new_email,
+            remote_ip=remote_ip,
+            remote_hostname=remote_hostname,
+            tracking_cookie=tracking_cookie,
+            comment='' if body.comment is None else body.comment,
+        )
+        write_admin_audit(session, [
+            change_email_event,
             AdminAudit_SetEmailVerified(
                 authn_user.user_id,
                 user_id,
@@ -807,7 +840,9 @@ def change_email(
                 remote_hostname=remote_hostname,
                 tracking_cookie=tracking_cookie,
                 comment='' if body.comment is None else body.comment,
-            ))
+            )], get_admin_audit_queue(request))
+        biz.admin_email_changed(change_email_event)
+        logger.info("User %s email set by admin %s from %s to %s", user_id, authn_user.user_id, old_email, body.new_email)
         logger.info("User %s email verified set by admin %s to %s", user_id, authn_user.user_id, repr(email_verified))
 
         if not email_verified and kc_user:
@@ -885,6 +920,48 @@ def get_email_history(
     return history.change_history[_start:_end]
 
 
+# Upper bound of the user ids in one batch lookup
+EMAIL_HISTORY_BATCH_MAX = 1000
+
+
+class EmailHistoryLookupModel(BaseModel):
+    user_ids: List[str]
+
+
+def _check_admin(authn: Optional[ArxivUserClaims|ApiToken]) -> None:
+    if authn is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not logged in")
+    if not is_super_user(authn):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
+
+
+@router.post("/email/history", description="Get the email histories of many users. Admin only.")
+def get_email_history_many(
+        body: EmailHistoryLookupModel,
+        authn: Optional[ArxivUserClaims|ApiToken] = Depends(get_authn_or_none),
+        session: Session = Depends(get_db),
+) -> List[UserEmailHistory]:
+    _check_admin(authn)
+    if len(body.user_ids) > EMAIL_HISTORY_BATCH_MAX:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"At most {EMAIL_HISTORY_BATCH_MAX} users at a time")
+    try:
+        return get_user_email_history_many(session, body.user_ids)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid user id")
+
+
+@router.get("/email/holders", description="Get the email histories of every user who has ever held the email. Admin only.")
+def get_email_holders(
+        email: str = Query(..., description="Email address"),
+        authn: Optional[ArxivUserClaims|ApiToken] = Depends(get_authn_or_none),
+        session: Session = Depends(get_db),
+) -> List[UserEmailHistory]:
+    _check_admin(authn)
+    logger.info("Email holder lookup by %s", describe_super_user(authn))
+    return get_email_holders_history(session, email)
+
+
 class PasswordUpdateModel(BaseModel):
     old_password: str
     new_password: str
@@ -902,6 +979,7 @@ async def change_user_password(
         tracking_cookie: Optional[str] = Depends(get_tapir_tracking_cookie),
         session: Session = Depends(get_db),
         kc_admin: KeycloakAdmin = Depends(get_keycloak_admin),
+        kc_async_admin: AsyncKeycloakAdminProtocol = Depends(get_async_keycloak_admin),
 ):
     """
     Change user password
@@ -919,6 +997,41 @@ async def change_user_password(
     if not ok_password:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"New password is invalid. {reason}")
 
+    pwd = await run_blocking(request, _get_tapir_password_for_change, session, user_id, data.old_password)
+
+    idp = request.app.extra["idp"]
+
+    # if not kc_check_old_password(kc_admin, idp, nick.nickname, data.old_password, idp._ssl_cert_verify):
+    if kc_access_token is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail="Stale access. Please log out/login again.")
+
+    validator = request.app.extra.get(KEYCLOAK_TOKEN_VALIDATOR)
+    if not await kc_verify_access_token(validator, kc_admin, idp, kc_access_token):
+        if authn_user.user_id == user_id:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                                detail="Stale access. Please log out/login again.")
+        if not authn_user.is_admin:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="Stale access. Please log out/login again.")
+
+    client_secret = request.app.extra['ARXIV_USER_SECRET']
+    kc_user = await _get_kc_user_or_none(kc_async_admin, user_id)
+    await run_blocking(request, _change_user_password, user_id, data, authn_user, kc_user, remote_ip,
+                       remote_hostname, client_secret, session, kc_admin)
+    if kc_user:
+        try:
+            await kc_async_admin.set_user_password(kc_user["id"], data.new_password, temporary=False)
+        except Exception as _exc:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Changing password failed")
+        await run_blocking(request, _store_tapir_password, session, pwd, data.new_password)
+
+    logger.info("User password changed successfully. Old password %s, new password %s",
+                sha256_base64_encode(data.old_password), sha256_base64_encode(data.new_password))
+
+
+def _get_tapir_password_for_change(session: Session, user_id: str, old_password: str) -> TapirUsersPassword:
+    """Check the user exists, and returns the tapir password record. Runs on the blocking executor."""
     user: TapirUser | None = session.query(TapirUser).filter(TapirUser.user_id == user_id).one_or_none()
     if not user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid user id")
@@ -934,7 +1047,7 @@ async def change_user_password(
         pwd = TapirUsersPassword(
             user_id=user_id,
             password_storage=2,
-            password_enc=passwords.hash_password(data.old_password),
+            password_enc=passwords.hash_password(old_password),
         )
         pass
 
@@ -943,28 +1056,31 @@ async def change_user_password(
     #     domain_user, domain_auth = authenticate.authenticate(user.email, data.old_password)
     # except AuthenticationFailed:
     #     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Incorrect password")
+    return pwd
 
-    idp = request.app.extra["idp"]
 
-    # if not kc_check_old_password(kc_admin, idp, nick.nickname, data.old_password, idp._ssl_cert_verify):
-    if kc_access_token is None:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
-                            detail="Stale access. Please log out/login again.")
-
-    if not await kc_validate_access_token(kc_admin, idp, kc_access_token):
-        if authn_user.user_id == user_id:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
-                                detail="Stale access. Please log out/login again.")
-        if not authn_user.is_admin:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                                detail="Stale access. Please log out/login again.")
-
-    kc_user = None
+async def _get_kc_user_or_none(kc_admin: AsyncKeycloakAdminProtocol, user_id: str) -> Optional[dict]:
+    """The Keycloak user. None when Keycloak does not have the user - not migrated yet."""
     try:
-        kc_user = kc_admin.get_user(user_id)
+        return await kc_admin.get_user(str(user_id))
     except KeycloakGetError:
-        pass
-
+        return None
+
+
+def _change_user_password(user_id: str,
+                          data: PasswordUpdateModel,
+                          authn_user: ArxivUserClaims,
+                          kc_user: Optional[dict],
+                          remote_ip: str,
+                          remote_hostname: str,
+                          client_secret: str,
+                          session: Session,
+                          kc_admin: KeycloakAdmin) -> None:
+    """
+    DB part of change_user_password, and the check of the old password. Runs on the blocking executor.
+    A user Keycloak does not have yet is migrated with the new password here. Otherwise, the caller sets
+    the Keycloak password, then _store_tapir_password.
+    """
     tapir_password: TapirUsersPassword | None = session.query(TapirUsersPassword).filter(
         TapirUsersPassword.user_id == user_id).one_or_none()
     if not tapir_password:
@@ -992,8 +1108,6 @@ async def change_user_password(
             ), # obv. no payload
         )
 
-    client_secret = request.app.extra['ARXIV_USER_SECRET']
-
     if not kc_user:
         try:
             passwords.check_password(data.old_password, tapir_password.password_enc.encode("ascii"))
@@ -1021,16 +1135,11 @@ async def change_user_password(
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                                 detail="Incorrect password")
 
-        try:
-            kc_admin.set_user_password(kc_user["id"], data.new_password, temporary=False)
-        except Exception as _exc:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Changing password failed")
-
-        pwd.password_enc = passwords.hash_password(data.new_password)
-        session.commit()
 
-    logger.info("User password changed successfully. Old password %s, new password %s",
-                sha256_base64_encode(data.old_password), sha256_base64_encode(data.new_password))
+def _store_tapir_password(session: Session, pwd: TapirUsersPassword, new_password: str) -> None:
+    """Tapir copy of the password, once Keycloak has it. Runs on the blocking executor."""
+    pwd.password_enc = passwords.hash_password(new_password)
+    session.commit()
 
 
 class PasswordResetRequest(BaseModel):
@@ -1045,6 +1154,7 @@ async def reset_user_password(
         current_user: Optional[ArxivUserClaims] = Depends(get_current_user_or_none),
         session: Session = Depends(get_db),
         kc_admin: KeycloakAdmin = Depends(get_keycloak_admin),
+        kc_async_admin: AsyncKeycloakAdminProtocol = Depends(get_async_keycloak_admin),
 ):
     """
     Make KC to send a password reset request.
@@ -1054,55 +1164,23 @@ async def reset_user_password(
     logger.debug("User password reset request. Current %s",
                  current_user.user_id if current_user else "No User")
 
-    tapir_user: TapirUser | None = None
-    nickname: TapirNickname | None = None
-
-    if '@' in body.username_or_email:
-        tapir_user = session.query(TapirUser).filter(TapirUser.email == body.username_or_email).one_or_none()
-    else:
-        nickname = session.query(TapirNickname).filter(TapirNickname.nickname == body.username_or_email).one_or_none()
-
-    if nickname:
-        tapir_user = session.query(TapirUser).filter(TapirUser.user_id == nickname.user_id).one_or_none()
-    elif tapir_user:
-        nickname = session.query(TapirNickname).filter(TapirNickname.user_id == tapir_user.user_id).one_or_none()
-
-    if tapir_user is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User does not exist")
-
-    if nickname is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User does not exist")
-
-    user_id = tapir_user.user_id
-    email = tapir_user.email
-    username = nickname.nickname
-
-    kc_user = None
-    try:
-        kc_user = kc_admin.get_user(str(user_id))
-    except KeycloakGetError as exc:
-        pass
+    client_secret = request.app.extra['ARXIV_USER_SECRET']
+    account = await run_blocking(request, _password_reset_account, body, session)
+    user_id = account.id
 
+    kc_user = await _get_kc_user_or_none(kc_async_admin, user_id)
     if not kc_user:
-        client_secret = request.app.extra['ARXIV_USER_SECRET']
-        account = AccountInfoModel(
-            id=str(user_id),
-            username=username,
-            email=email,
-            first_name=tapir_user.first_name if tapir_user.first_name else "",
-            last_name=tapir_user.last_name if tapir_user.last_name else "",
-        )
         password = base64.b85encode(random.randbytes(32)).decode('ascii')
-        migrate_to_keycloak(kc_admin, account, password, client_secret)
-        kc_user = kc_admin.get_user(str(user_id))
+        await run_blocking(request, migrate_to_keycloak, kc_admin, account, password, client_secret)
+        kc_user = await _get_kc_user_or_none(kc_async_admin, user_id)
 
     if not kc_user:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail="Failed to migrate a user account")
 
     try:
-        kc_admin.send_update_account(user_id=str(user_id), payload={"requiredActions": ["UPDATE_PASSWORD"]})
-    except KeycloakGetError as kce:
+        await kc_async_admin.send_update_account(user_id=user_id, payload={"requiredActions": ["UPDATE_PASSWORD"]})
+    except (KeycloakGetError, KeycloakPutError) as kce:
         detail = "Password reset request did not succeed due to arXiv server problem. " + str(kce)
         ex_body: str = kce.response_body.decode('utf-8') if kce.response_body and isinstance(kce.response_body, bytes) else (
             str(kce.response_body))
@@ -1116,6 +1194,36 @@ async def reset_user_password(
     return
 
 
+def _password_reset_account(body: PasswordResetRequest, session: Session) -> AccountInfoModel:
+    """The account to reset the password of. Runs on the blocking executor."""
+    tapir_user: TapirUser | None = None
+    nickname: TapirNickname | None = None
+
+    if '@' in body.username_or_email:
+        tapir_user = session.query(TapirUser).filter(TapirUser.email == body.username_or_email).one_or_none()
+    else:
+        nickname = session.query(TapirNickname).filter(TapirNickname.nickname == body.username_or_email).one_or_none()
+
+    if nickname:
+        tapir_user = session.query(TapirUser).filter(TapirUser.user_id == nickname.user_id).one_or_none()
+    elif tapir_user:
+        nickname = session.query(TapirNickname).filter(TapirNickname.user_id == tapir_user.user_id).one_or_none()
+
+    if tapir_user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User does not exist")
+
+    if nickname is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User does not exist")
+
+    return AccountInfoModel(
+        id=str(tapir_user.user_id),
+        username=nickname.nickname,
+        email=tapir_user.email,
+        first_name=tapir_user.first_name if tapir_user.first_name else "",
+        last_name=tapir_user.last_name if tapir_user.last_name else "",
+    )
+
+
 @router.get('/identifier')
 async def get_user_profile_with_query(
         user_id: Optional[str] = Query(None, description="User ID"),
@@ -1536,6 +1644,8 @@ def update_user_authorization(
     # demographic: Demographic | None = session.query(Demographic).filter(Demographic.user_id == user_id).one_or_none()
 
     valid_request = False
+    # Written together with one INSERT at the end
+    audits: List[AdminAuditEvent] = []
     if body.deleted is not None:
         valid_request = True
         deleted = 1 if body.deleted else 0
@@ -1560,7 +1670,7 @@ def update_user_authorization(
                 tracking_cookie=tracking_cookie,
                 comment=f"Undeleted user. {body.comment if body.comment else ''}"
             )
-            admin_audit(session, audit)
+            audits.append(audit)
 
 
     if body.suspend is not None:
@@ -1584,7 +1694,7 @@ def update_user_authorization(
                 remote_hostname=remote_hostname,
                 tracking_cookie=tracking_cookie,
                 comment=body.comment if body.comment else '')
-            admin_audit(session, audit)
+            audits.append(audit)
 
 
     if body.administrator is not None:
@@ -1603,7 +1713,7 @@ def update_user_authorization(
                 tracking_cookie=tracking_cookie,
                 comment=f"{'Granted' if body.administrator else 'Revoked'} administrator role. {body.comment if body.comment else ''}"
             )
-            admin_audit(session, audit)
+            audits.append(audit)
 
 
     if body.owner is not None:
@@ -1622,7 +1732,7 @@ def update_user_authorization(
                 tracking_cookie=tracking_cookie,
                 comment=f"{'Granted' if body.owner else 'Revoked'} owner role. {body.comment if body.comment else ''}"
             )
-            admin_audit(session, audit)
+            audits.append(audit)
 
 
     if body.can_lock is not None:
@@ -1641,7 +1751,7 @@ def update_user_authorization(
                 tracking_cookie=tracking_cookie,
                 comment=f"{'Granted' if body.can_lock else 'Revoked'} can_lock privilege. {body.comment if body.comment else ''}"
             )
-            admin_audit(session, audit)
+            audits.append(audit)
 
 
     if body.approved is not None:
@@ -1679,8 +1789,10 @@ def update_user_authorization(
                     tracking_cookie=tracking_cookie,
                     comment=f"Revoked moderator role. {body.comment if body.comment else ''}"
                 )
-                admin_audit(session, audit)
+                audits.append(audit)
+
 
+    write_admin_audit(session, audits, get_admin_audit_queue(request))
 
     if session.is_modified(tapir_user):
         user_enabled = not (tapir_user.flag_banned or tapir_user.flag_deleted)
@@ -0,0 +1,144 @@
+"""
+Admin audit trail export
+"""
+import csv
+import io
+import json
+from typing import Optional, List, Literal, Iterator
+
+from arxiv.auth.user_claims import ArxivUserClaims
+from arxiv.base import logging
+from arxiv.db.models import TapirAdminAudit
+from arxiv_bizlogic.audit_event import AdminAuditEvent, admin_audit_records, decode_admin_audit_record
+from arxiv_bizlogic.audit_search import AdminAuditFilter, admin_audit_export_select
+from arxiv_bizlogic.database import DatabaseSession
+from fastapi import APIRouter, Depends, status, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from . import get_authn_or_none, is_super_user, ApiToken, describe_super_user
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/audit", tags=["audit"])
+
+# error is set on the records that could not be decoded only
+EXPORT_FIELDS = ["entry_id", "log_date", "action", "admin_user", "affected_user", "session_id",
+                 "remote_ip", "remote_hostname", "tracking_cookie", "data", "comment", "error"]
+
+# Rows fetched per round trip of the server side cursor, and rows per chunk of the response
+EXPORT_BATCH_SIZE = 1000
+
+
+def export_row(event: AdminAuditEvent) -> dict:
+    return {
+        "entry_id": event.entry_id,
+        "log_date": event.timestamp,
+        "action": event.action.value,
+        "admin_user": event.admin_user,
+        "affected_user": event.affected_user,
+        "session_id": event.session_id,
+        "remote_ip": event.remote_ip,
+        "remote_hostname": event.remote_hostname,
+        "tracking_cookie": event.tracking_cookie,
+        "data": event.data,
+        "comment": event.comment,
+    }
+
+
+def _text(value: Optional[bytes], fallback: Optional[str]) -> Optional[str]:
+    return value.decode("utf-8", errors="replace") if value is not None else fallback
+
+
+def export_raw_row(audit_record: TapirAdminAudit, comment_binary: Optional[bytes], data_binary: Optional[bytes],
+                   error: Exception) -> dict:
+    """The record as stored, for the one that could not be decoded"""
+    return {
+        "entry_id": audit_record.entry_id,
+        "log_date": audit_record.log_date,
+        "action": audit_record.action,
+        "admin_user": audit_record.admin_user,
+        "affected_user": audit_record.affected_user,
+        "session_id": audit_record.session_id,
+        "remote_ip": audit_record.ip_addr,
+        "remote_hostname": audit_record.remote_host,
+        "tracking_cookie": audit_record.tracking_cookie,
+        "data": _text(data_binary, audit_record.data),
+        "comment": _text(comment_binary, audit_record.comment),
+        "error": f"{type(error).__name__}: {error}",
+    }
+
+
+def _ndjson_chunks(rows: Iterator[dict]) -> Iterator[str]:
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False))
+        if len(lines) >= EXPORT_BATCH_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def _csv_chunks(rows: Iterator[dict]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count >= EXPORT_BATCH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            count = 0
+    yield buffer.getvalue()
+
+
+def _export_rows(filters: AdminAuditFilter, after_entry_id: Optional[int]) -> Iterator[dict]:
+    # The request's session is gone by the time the response streams - the export has its own.
+    with DatabaseSession() as session:
+        statement = admin_audit_export_select(filters, after_entry_id=after_entry_id)
+        for audit_record, comment_binary, data_binary in admin_audit_records(session, statement,
+                                                                             yield_per=EXPORT_BATCH_SIZE):
+            # The response has started - a record that does not decode goes out as is, not as an error
+            try:
+                yield export_row(decode_admin_audit_record(audit_record, comment_binary, data_binary))
+            except Exception as exc:
+                logger.warning("Audit export: entry %s does not decode: %s", audit_record.entry_id, exc)
+                yield export_raw_row(audit_record, comment_binary, data_binary, exc)
+
+
+@router.get('/export', description="Stream the admin audit trail as NDJSON or CSV")
+def export_admin_audit(
+        format: Literal["ndjson", "csv"] = Query("ndjson"),
+        affected_user: Optional[int] = Query(None),
+        admin_user: Optional[int] = Query(None),
+        action: Optional[List[str]] = Query(None, description="Actions to include. Repeat for more than one"),
+        session_id: Optional[int] = Query(None),
+        since: Optional[int] = Query(None, description="log_date from, inclusive (epoch seconds)"),
+        until: Optional[int] = Query(None, description="log_date to, exclusive (epoch seconds)"),
+        after_entry_id: Optional[int] = Query(None, description="Resume after this entry_id"),
+        authn: Optional[ArxivUserClaims | ApiToken] = Depends(get_authn_or_none),
+) -> StreamingResponse:
+    """
+    Streams the matching tapir_admin_audit records, decoded, in entry_id order.
+    An interrupted export can be resumed with the last entry_id received as after_entry_id.
+    """
+    if authn is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not logged in")
+    if not is_super_user(authn):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
+
+    filters = AdminAuditFilter(affected_user=affected_user, admin_user=admin_user, actions=action,
+                               session_id=session_id, since=since, until=until)
+    logger.info("Audit export by %s: %s after %s", describe_super_user(authn),
+                filters.model_dump(exclude_none=True), after_entry_id)
+
+    rows = _export_rows(filters, after_entry_id)
+    if format == "csv":
+        chunks, media_type = _csv_chunks(rows), "text/csv; charset=utf-8"
+    else:
+        chunks, media_type = _ndjson_chunks(rows), "application/x-ndjson"
+    return StreamingResponse(chunks, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="admin-audit.{format}"'})
@@ -5,11 +5,13 @@ from dataclasses import asdict
 from typing import Optional, Literal, Any, Tuple
 
 from arxiv.db.models import TapirSession
-from arxiv_bizlogic.bizmodels.tapir_to_user_claims import create_user_claims_from_tapir_cookie
-from arxiv_bizlogic.bizmodels.user_model import UserModel
+from arxiv_bizlogic.bizmodels.tapir_to_user_claims import create_user_claims_from_tapir_cookie, \
+    invalidate_tapir_session_claims
+from arxiv_bizlogic.bizmodels.user_model import UserModel, UserProjection
 from arxiv_bizlogic.fastapi_helpers import get_client_host, get_authn_user, get_client_host_name, \
     get_tapir_tracking_cookie
 # from arxiv_bizlogic.ng_auth import ng_cookie
+from arxiv_bizlogic.reverse_dns import get_reverse_dns_resolver
 from arxiv_bizlogic.ng_auth.ng_cookie import create_ng_claims, ng_cookie_encode  # NGClaims, generate_nonce,
 from fastapi import APIRouter, Depends, status, Request, HTTPException, Response
 from fastapi.responses import RedirectResponse, JSONResponse
@@ -29,14 +31,17 @@ from starlette.datastructures import URL
 # from arxiv.auth.legacy import accounts, exceptions
 # from arxiv.auth import domain
 
-from . import get_current_user_or_none, get_db, COOKIE_ENV_NAMES, cookie_params
+from . import get_current_user_or_none, get_db, COOKIE_ENV_NAMES, cookie_params, get_admin_audit_queue, \
+    get_async_keycloak_admin
 from .biz.account_biz import is_user_account_valid
 from .biz.cold_migration import cold_migrate
 from .legacy import get_tapir_cookie_or_none, LegacySessionCookie
 # from .account import AccountRegistrationModel
 
 from .sessions import create_tapir_session
-from arxiv_bizlogic.audit_event import admin_audit, AdminAudit_BecomeUser
+from .blocking_executor import run_blocking
+from arxiv_bizlogic.audit_event import AdminAudit_BecomeUser
+from arxiv_bizlogic.audit_queue import write_admin_audit
 
 logger = logging.getLogger(__name__)
 
@@ -85,10 +90,12 @@ async def oauth2_callback(request: Request,
     client_ip = request.headers.get("x-real-ip", request.client.host if request.client else "")
 
     idp: ArxivOidcIdpClient = request.app.extra["idp"]
-    user_claims: Optional[ArxivUserClaims] = idp.from_code_to_user_claims(code, client_ipv4=client_ip)
+    user_claims: Optional[ArxivUserClaims] = await run_blocking(request, idp.from_code_to_user_claims, code,
+                                                                client_ipv4=client_ip)
 
     # session_cookie_key, classic_cookie_key, keycloak_key, domain, secure, samesite = cookie_params(request)
-    if user_claims and user_claims.user_id and (not is_user_account_valid(session, user_claims.user_id)):
+    if user_claims and user_claims.user_id and (
+            not await run_blocking(request, is_user_account_valid, session, user_claims.user_id)):
         user_claims = None
 
     if user_claims is None:
@@ -108,7 +115,9 @@ async def oauth2_callback(request: Request,
     # Hack - perhaps port the legacy auth. For now, this works.
     from arxiv.db import Session
     Session = session
-    tapir_cookie, tapir_session = create_tapir_session(session, user_claims, client_ip)
+    client_host = await get_reverse_dns_resolver().resolve(client_ip)
+    tapir_cookie, tapir_session = await run_blocking(request, create_tapir_session, session, user_claims, client_ip,
+                                                     client_host or "")
 
     # Legacy cookie
     if tapir_cookie and tapir_session:
@@ -164,13 +173,13 @@ async def impersonate(request: Request,
 
     kc_admin: KeycloakAdmin = request.app.extra["KEYCLOAK_ADMIN"]
     # Tapir user
-    tapir_user = UserModel.one_user(session, user_id)
+    tapir_user = await run_blocking(request, UserModel.one_user, session, user_id, UserProjection.identity)
     if tapir_user is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User ID is not found")
 
     kc_user = None
     try:
-        kc_user = kc_admin.get_user(user_id, user_profile_metadata=True)
+        kc_user = await get_async_keycloak_admin(request).get_user(user_id, user_profile_metadata=True)
     except KeycloakGetError as get_error:
         error_detail = str(get_error)
         if "User not found" not in error_detail:
@@ -182,7 +191,7 @@ async def impersonate(request: Request,
 
     if kc_user is None:
         client_secret = request.app.extra['ARXIV_USER_SECRET']
-        kc_user = cold_migrate(kc_admin, session, user_id, client_secret)
+        kc_user = await run_blocking(request, cold_migrate, kc_admin, session, user_id, client_secret)
 
     access_token = ""
     id_token = ""
@@ -213,7 +222,9 @@ async def impersonate(request: Request,
     # Hack - perhaps port the legacy auth. For now, this works.
     from arxiv.db import Session
     Session = session
-    tapir_cookie, tapir_session = create_tapir_session(session, user_claims, remote_ip)
+    client_host = await get_reverse_dns_resolver().resolve(remote_ip)
+    tapir_cookie, tapir_session = await run_blocking(request, create_tapir_session, session, user_claims, remote_ip,
+                                                     client_host or "")
 
     if tapir_session is None or tapir_session.session_id is None:
         raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="Tapir session is not given")
@@ -229,9 +240,11 @@ async def impersonate(request: Request,
         user_claims.set_tapir_session(tapir_cookie, tapir_session)
 
     # Audit
-    admin_audit(
+    await run_blocking(
+        request,
+        write_admin_audit,
         session,
-        AdminAudit_BecomeUser(
+        [AdminAudit_BecomeUser(
             current_user.user_id,
             user_id,
             current_user.tapir_session_id,
@@ -239,12 +252,12 @@ async def impersonate(request: Request,
             remote_ip=remote_ip,
             remote_hostname=remote_hostname,
             tracking_cookie=tracking_cookie,
-        )
+        )],
+        get_admin_audit_queue(request)
     )
 
     # Perform impersonation (returns a URL to redirect to)
-    impersonation_response = kc_admin.connection.raw_post(f"admin/realms/{kc_admin.connection.user_realm_name}/users/{user_id}/impersonation", {})  # type: ignore
-    impersonation_url = impersonation_response.headers.get("redirect")
+    impersonation_url = await get_async_keycloak_admin(request).impersonate(user_id)
     response = make_cookie_response(request, user_claims, tapir_cookie, impersonation_url)
 
     return response
@@ -418,6 +431,8 @@ async def logout(request: Request,
         logger.info('%s log out', email)
 
     if classic_cookie:
+        # Whatever happens to the tapir session, the cached claims of it must go.
+        invalidate_tapir_session_claims(classic_cookie)
         try:
             legacy_invalidate(classic_cookie)
         except UnknownSession:
@@ -554,34 +569,26 @@ def make_cookie_response(request: Request,
         if len(token) > 4096:
             logger.warning('Cookie %s exceeds Chrome limit of 4096 bytes: %d bytes', session_cookie_key, len(token))
 
-        response.set_cookie(session_cookie_key, token, max_age=cookie_max_age,
-                            domain=domain, path="/", secure=secure, samesite=samesite, httponly=True)
-        response.set_cookie(keycloak_access_key, user_claims.access_token,  max_age=cookie_max_age,
-                            domain=domain, path="/", secure=secure, samesite=samesite, httponly=True)
-        response.set_cookie(keycloak_refresh_key, user_claims.refresh_token,  max_age=cookie_max_age,
-                            domain=domain, path="/", secure=secure, samesite=samesite, httponly=True)
+        cparam.set_cookie(response, session_cookie_key, token)
+        cparam.set_cookie(response, keycloak_access_key, user_claims.access_token)
+        cparam.set_cookie(response, keycloak_refresh_key, user_claims.refresh_token)
 
         if session_cookie_key != ng_cookie_key:
             try:
-                response.set_cookie(ng_cookie_key, ng_cookie_encode(create_ng_claims(user_claims), secret),
-                    max_age=cookie_max_age, domain=domain, path="/", secure=secure, samesite=samesite, httponly=True)
+                cparam.set_cookie(response, ng_cookie_key, ng_cookie_encode(create_ng_claims(user_claims), secret))
             except Exception as exc:
                 logger.warning("Setting NG cookie failed", exc_info=exc)
                 pass
 
     else:
         for key in [session_cookie_key, keycloak_access_key, keycloak_refresh_key, ng_cookie_key]:
-            response.set_cookie(key, "", max_age=0,
-                                domain=domain, path="/", secure=secure, samesite=samesite, expires=1)
+            cparam.delete_cookie(response, key)
 
     if tapir_cookie:
         logger.debug('%s=%s',classic_cookie_key, tapir_cookie)
-        response.set_cookie(classic_cookie_key, tapir_cookie, max_age=cookie_max_age,
-                            domain=domain, path="/", secure=secure, samesite=samesite, httponly=True)
+        cparam.set_cookie(response, classic_cookie_key, tapir_cookie)
     else:
         logger.debug('%s=<EMPTY>',classic_cookie_key)
-        response.set_cookie(classic_cookie_key, '', max_age=0,
-                            domain=domain, path="/", secure=secure, samesite=samesite,
-                            expires=1)
+        cparam.delete_cookie(response, classic_cookie_key)
     return response
 
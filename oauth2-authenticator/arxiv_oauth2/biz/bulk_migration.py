@@ -0,0 +1,353 @@
+"""
+Bulk migration of Tapir users to Keycloak without credentials.
+
+cold_migrate migrates one user on demand - it smashes the Tapir password, logs in with a password grant
+so the legacy auth provider creates the user, restores the password and deletes the Keycloak credentials.
+That is several Keycloak round trips and two DB commits per user.
+
+This job creates the users directly with the realm partial import, from the same record the legacy
+auth provider gives Keycloak (user_model_to_auth_response), minus the credentials. Every user is linked
+to the legacy auth provider's user storage component (federationLink), so Keycloak asks the provider to
+check the password on the first login - without the link, a user with no credentials could not log in.
+It is not cold_migrate's end state: the provider has not seen the user yet, and does its part of the
+migration (the password) on the first login.
+
+  - users are read in user id order over [start_user_id, end_user_id], batch_size at a time
+  - up to `concurrency` batches are in flight to Keycloak
+  - the users Keycloak already has are skipped (ifResourceExists: SKIP)
+  - a batch Keycloak refuses is retried one user at a time, so one bad user does not hold the others back
+  - the checkpoint file records the last user id below which every batch is done; a rerun resumes there
+
+    python -m arxiv_oauth2.biz.bulk_migration --start-user-id 1 --end-user-id 100000 --checkpoint bulk.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from arxiv.base import logging
+from arxiv.db.models import TapirUser
+from arxiv_bizlogic.bizmodels.tapir_to_kc_mapping import AuthResponse, user_model_to_auth_response
+from arxiv_bizlogic.bizmodels.user_model import UserModel
+from keycloak.exceptions import KeycloakConnectionError, KeycloakError
+from pydantic import BaseModel
+from sqlalchemy.orm import Session, joinedload
+
+from ..keycloak_admin_async import AsyncKeycloakAdminProtocol
+
+logger = logging.getLogger(__name__)
+
+# (last user id of the batch, Keycloak user representations)
+UserBatch = Tuple[int, List[dict]]
+
+USER_STORAGE_PROVIDER_TYPE = "org.keycloak.storage.UserStorageProvider"
+# The component name in the realm (keycloak_bend/realms, setup_arxiv_realm.py)
+LEGACY_AUTH_PROVIDER_NAME = "arXiv Legacy Auth Provider"
+
+
+class BulkMigrationReport(BaseModel):
+    start_user_id: int
+    end_user_id: Optional[int] = None
+    last_user_id: int
+    users: int = 0
+    added: int = 0
+    skipped: int = 0
+    failed: int = 0
+    failed_user_ids: List[str] = []
+    batches: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def users_per_second(self) -> float:
+        return self.users / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.users} users up to {self.last_user_id} in {self.elapsed:.1f}s "
+                f"({self.users_per_second:.1f}/s): added {self.added}, skipped {self.skipped}, failed {self.failed}")
+
+
+async def legacy_federation_link(kc_admin: AsyncKeycloakAdminProtocol,
+                                 provider_name: str = LEGACY_AUTH_PROVIDER_NAME) -> str:
+    """
+    The id of the legacy auth provider's user storage component - the federationLink of the imported users.
+    The component of the name, or else the only user storage component of the realm.
+
+    :raises ValueError: no such component
+    """
+    components = await kc_admin.get_components({"type": USER_STORAGE_PROVIDER_TYPE})
+    named = [component for component in components if component.get("name") == provider_name]
+    if not named and len(components) == 1:
+        named = components
+    if len(named) != 1:
+        raise ValueError(f"No user storage component '{provider_name}' among "
+                         f"{[component.get('name') for component in components]}")
+    return named[0]["id"]
+
+
+def to_kc_import_user(auth: AuthResponse, federation_link: str) -> dict:
+    """
+    The Keycloak user representation for the partial import. The Tapir user id is the Keycloak id,
+    as with the legacy auth provider. No credentials.
+
+    :param federation_link: legacy_federation_link
+    """
+    return {
+        "id": auth.id,
+        "federationLink": federation_link,
+        "username": auth.username,
+        "email": auth.email,
+        "firstName": auth.firstName,
+        "lastName": auth.lastName,
+        "enabled": auth.enabled,
+        "emailVerified": auth.emailVerified,
+        "attributes": auth.attributes,
+        # user_flags_to_roles may list a role twice
+        "realmRoles": list(dict.fromkeys(auth.roles)),
+        "groups": [f"/{group}" for group in auth.groups],
+        "requiredActions": auth.requiredActions,
+    }
+
+
+def tapir_user_batches(session: Session, federation_link: str, start_user_id: int, end_user_id: Optional[int] = None,
+                       batch_size: int = 200, include_deleted: bool = False) -> Iterator[UserBatch]:
+    """
+    Keycloak user representations of the Tapir users in [start_user_id, end_user_id], in user id order.
+
+    :param session: SQLAlchemy session
+    :param federation_link: legacy_federation_link
+    :param start_user_id: first user id
+    :param end_user_id: last user id, None for no limit
+    :param batch_size: users per batch
+    :param include_deleted: also the deleted users. They can not log in, so cold_migrate is enough for them.
+    """
+    last_user_id = start_user_id - 1
+    while True:
+        query = session.query(TapirUser) \
+            .options(joinedload(TapirUser.tapir_policy_classes)) \
+            .filter(TapirUser.user_id > last_user_id)
+        if end_user_id is not None:
+            query = query.filter(TapirUser.user_id <= end_user_id)
+        tapir_users: List[TapirUser] = query.order_by(TapirUser.user_id).limit(batch_size).all()
+        if not tapir_users:
+            return
+        last_user_id = tapir_users[-1].user_id
+
+        if not include_deleted:
+            tapir_users = [tapir_user for tapir_user in tapir_users if not tapir_user.flag_deleted]
+        user_models = UserModel.many_users(session, [tapir_user.user_id for tapir_user in tapir_users])
+        users = [to_kc_import_user(user_model_to_auth_response(um, tapir_user), federation_link)
+                 for um, tapir_user in zip(user_models, tapir_users) if um is not None]
+        # Nothing is held between the batches
+        session.expunge_all()
+        yield last_user_id, users
+
+
+class MigrationCheckpoint:
+    """The report of the run so far, in a JSON file. Written atomically."""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+
+    def load(self) -> Optional[BulkMigrationReport]:
+        if not self.path or not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding="utf-8") as checkpoint_file:
+            return BulkMigrationReport.model_validate(json.load(checkpoint_file))
+
+    def save(self, report: BulkMigrationReport) -> None:
+        if not self.path:
+            return
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as checkpoint_file:
+            checkpoint_file.write(report.model_dump_json(indent=2))
+        os.replace(temp_path, self.path)
+
+
+class BulkMigration:
+    """
+    Runs the batches through the partial import with bounded concurrency.
+
+    :param kc_admin: AsyncKeycloakAdmin
+    :param concurrency: batches in flight
+    :param checkpoint: where the progress is saved, after every batch
+    :param timeout: per partial import call. Large batches take Keycloak a while.
+    """
+
+    def __init__(self, kc_admin: AsyncKeycloakAdminProtocol, concurrency: int = 4,
+                 checkpoint: Optional[MigrationCheckpoint] = None, timeout: float = 120.0,
+                 clock=time.monotonic):
+        self.kc_admin = kc_admin
+        self.concurrency = concurrency
+        self.checkpoint = checkpoint or MigrationCheckpoint(None)
+        self.timeout = timeout
+        self.clock = clock
+
+    async def _import(self, users: List[dict]) -> Dict[str, Any]:
+        return await self.kc_admin.partial_import({"ifResourceExists": "SKIP", "users": users},
+                                                  timeout=self.timeout)
+
+    async def _import_batch(self, users: List[dict]) -> Tuple[int, int, List[str]]:
+        """:return: (added, skipped, failed user ids)"""
+        if not users:
+            return 0, 0, []
+        try:
+            result = await self._import(users)
+            return result.get("added", 0), result.get("skipped", 0), []
+        except KeycloakConnectionError:
+            raise
+        except KeycloakError as exc:
+            logger.warning("Partial import of %d users refused, one at a time: %s", len(users), exc)
+
+        added = skipped = 0
+        failed = []
+        for user in users:
+            try:
+                result = await self._import([user])
+                added += result.get("added", 0)
+                skipped += result.get("skipped", 0)
+            except KeycloakConnectionError:
+                raise
+            except KeycloakError as exc:
+                logger.warning("User %s not migrated: %s", user["id"], exc)
+                failed.append(user["id"])
+        return added, skipped, failed
+
+    async def run(self, batches: Iterator[UserBatch], start_user_id: int,
+                  end_user_id: Optional[int] = None) -> BulkMigrationReport:
+        """
+        :param batches: from tapir_user_batches. It is advanced on a worker thread, as it queries the DB.
+        :param start_user_id: reported as is. Resuming from the checkpoint is up to the caller.
+        :param end_user_id: reported as is
+        """
+        report = BulkMigrationReport(start_user_id=start_user_id, end_user_id=end_user_id,
+                                     last_user_id=start_user_id - 1)
+        started = self.clock()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        # The batches finish out of order. The checkpoint only moves over a done prefix.
+        done_batches: Dict[int, int] = {}
+        next_batch = 0
+        tasks = set()
+        errors: List[BaseException] = []
+
+        async def migrate(index: int, last_user_id: int, users: List[dict]) -> None:
+            nonlocal next_batch
+            try:
+                added, skipped, failed = await self._import_batch(users)
+            except Exception as exc:
+                # Keycloak is gone. The checkpoint stays before this batch.
+                errors.append(exc)
+                return
+            finally:
+                semaphore.release()
+            report.users += len(users)
+            report.added += added
+            report.skipped += skipped
+            report.failed += len(failed)
+            report.failed_user_ids.extend(failed)
+            report.batches += 1
+            done_batches[index] = last_user_id
+            while next_batch in done_batches:
+                report.last_user_id = done_batches.pop(next_batch)
+                next_batch += 1
+            report.elapsed = self.clock() - started
+            self.checkpoint.save(report)
+            logger.info("Bulk migration: %s", report.summary())
+
+        try:
+            index = 0
+            while True:
+                await semaphore.acquire()
+                # Stop reading when Keycloak is gone
+                batch = None if errors else await asyncio.to_thread(next, batches, None)
+                if batch is None:
+                    semaphore.release()
+                    break
+                task = asyncio.create_task(migrate(index, *batch))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                index += 1
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            for task in list(tasks):
+                task.cancel()
+            report.elapsed = self.clock() - started
+            self.checkpoint.save(report)
+        if errors:
+            raise errors[0]
+        return report
+
+
+async def bulk_migrate(session: Session, kc_admin: AsyncKeycloakAdminProtocol, start_user_id: int,
+                       end_user_id: Optional[int] = None, batch_size: int = 200, concurrency: int = 4,
+                       checkpoint_path: Optional[str] = None, include_deleted: bool = False) -> BulkMigrationReport:
+    """
+    Migrates the Tapir users in [start_user_id, end_user_id], resuming after the checkpoint if there is one.
+    The failed user ids of the earlier runs are kept in the report - cold_migrate or a rerun over them.
+    """
+    checkpoint = MigrationCheckpoint(checkpoint_path)
+    previous = checkpoint.load()
+    resume_user_id = start_user_id
+    if previous is not None and previous.start_user_id == start_user_id and previous.end_user_id == end_user_id:
+        resume_user_id = max(start_user_id, previous.last_user_id + 1)
+        logger.info("Bulk migration resumes at user %d", resume_user_id)
+
+    federation_link = await legacy_federation_link(kc_admin)
+    logger.info("Bulk migrated users are linked to the user storage component %s", federation_link)
+    migration = BulkMigration(kc_admin, concurrency=concurrency, checkpoint=checkpoint)
+    batches = tapir_user_batches(session, federation_link, resume_user_id, end_user_id, batch_size=batch_size,
+                                 include_deleted=include_deleted)
+    report = await migration.run(batches, start_user_id, end_user_id)
+    if previous is not None and resume_user_id != start_user_id:
+        report.failed_user_ids = previous.failed_user_ids + report.failed_user_ids
+        report.failed += previous.failed
+        checkpoint.save(report)
+    return report
+
+
+def main():
+    from arxiv.config import Settings
+    from arxiv_bizlogic.database import Database
+    from ..keycloak_admin_async import AsyncKeycloakAdmin
+
+    parser = argparse.ArgumentParser(description="Migrate the Tapir users to Keycloak without credentials")
+    parser.add_argument("--start-user-id", type=int, default=1, help="First user id")
+    parser.add_argument("--end-user-id", type=int, default=None, help="Last user id")
+    parser.add_argument("--batch-size", type=int, default=200, help="Users per partial import")
+    parser.add_argument("--concurrency", type=int, default=4, help="Partial imports in flight")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file. A rerun resumes from it.")
+    parser.add_argument("--include-deleted", action="store_true", help="Also migrate the deleted users")
+    args = parser.parse_args()
+
+    settings = Settings(CLASSIC_DB_URI=os.environ.get('CLASSIC_DB_URI', "arXiv"), LATEXML_DB_URI=None)
+    database = Database(settings)
+    kc_admin = AsyncKeycloakAdmin(
+        server_url=os.environ.get('KEYCLOAK_SERVER_URL', 'https://auth.arxiv.org'),
+        realm_name=os.environ.get('ARXIV_REALM_NAME', "arxiv"),
+        username="admin",
+        password=os.environ['KEYCLOAK_ADMIN_SECRET'],
+        user_realm_name="master",
+        client_id="admin-cli",
+        verify=False,
+        max_connections=args.concurrency,
+    )
+
+    async def run() -> BulkMigrationReport:
+        try:
+            with Session(database.engine) as session:
+                return await bulk_migrate(session, kc_admin, args.start_user_id, args.end_user_id,
+                                          batch_size=args.batch_size, concurrency=args.concurrency,
+                                          checkpoint_path=args.checkpoint, include_deleted=args.include_deleted)
+        finally:
+            await kc_admin.aclose()
+
+    report = asyncio.run(run())
+    logger.info("Bulk migration done: %s", report.summary())
+    if report.failed_user_ids:
+        logger.warning("Not migrated: %s", ", ".join(report.failed_user_ids))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,7 @@ Migrate user from Tapir to Keycloak without credentials
 """
 import random
 import string
-from arxiv_bizlogic.bizmodels.user_model import UserModel
+from arxiv_bizlogic.bizmodels.user_model import UserModel, UserProjection, UserIdentityModel
 from fastapi import status, HTTPException
 from arxiv.base import logging
 from arxiv.db.models import TapirUsersPassword
@@ -37,7 +37,8 @@ def cold_migrate(kc_admin: KeycloakAdmin, session: Session, user_id: str, client
 
     # client_secret =
 
-    um: UserModel | None = UserModel.one_user(session, str(user_id))  # Use UserModel to get username
+    # Only the names and email are needed
+    um: UserIdentityModel | None = UserModel.one_user(session, str(user_id), UserProjection.identity)
     if um is None:
         # This should not happen. The tapir user exists and therefore, this must succeed.
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User does not exist")
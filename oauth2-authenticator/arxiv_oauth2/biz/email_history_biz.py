@@ -1,18 +1,20 @@
 from dataclasses import dataclass
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from arxiv_bizlogic.audit_event import admin_audit, AdminAudit_ChangeEmail
+from arxiv_bizlogic.bizmodels.user_model import chunked
+from arxiv_bizlogic.email_history import load_email_changes, query_email_changes, append_email_change, \
+    EmailChangeRow, load_email_changes_many, query_email_changes_many, email_holder_user_ids
 from arxiv_bizlogic.fastapi_helpers import datetime_to_epoch
-from sqlalchemy import Integer, String, Boolean
 from sqlalchemy.orm import Session
-from sqlalchemy.sql import func, union_all, select
+from sqlalchemy.sql import select
 from datetime import datetime, timedelta, timezone
 import logging
 import time
 
 from arxiv.db.models import TapirEmailChangeToken, TapirUser, t_tapir_email_change_tokens_used, TapirNickname, \
-    TapirAdminAudit, TapirSession
+    TapirSession
 from pydantic import BaseModel
 from arxiv_bizlogic.randomness import generate_random_string
 
@@ -97,7 +99,7 @@ def get_last_tapir_session(session: Session, user_id: str) -> Optional[TapirSess
 
 def get_user_email_history(session: Session, user_id: str) -> UserEmailHistory:
     """
-    Retrieve the complete email change history for a user using SQLAlchemy models.
+    Retrieve the complete email change history for a user, from the materialized arXiv_email_history record.
 
     Args:
         session: SQLAlchemy session
@@ -123,77 +125,31 @@ def get_user_email_history(session: Session, user_id: str) -> UserEmailHistory:
     email, joined_date_int, nickname = user_result
     # identifier = nickname if nickname else email
 
-    # Convert Unix timestamp to datetime
-    joined_date = datetime.fromtimestamp(joined_date_int)
+    # The email changes, materialized. The union query until the backfill has built the user's record -
+    # a read does not write, Database.get_session would not commit a Core statement anyway.
+    email_changes_result = load_email_changes(session, int(user_id))
+    if email_changes_result is None:
+        email_changes_result = query_email_changes(session, int(user_id))
 
-    # Build the UNION query for email changes
-    # Query 1: Catalyst email changes (consumed tokens)
-    query1 = (
-        select(
-            TapirEmailChangeToken.consumed_when.label('used_when'),
-            TapirEmailChangeToken.old_email,
-            TapirEmailChangeToken.new_email,
-            func.space(128).label('who'),
-            func.cast(0, Integer).label('admin_id'),
-            TapirEmailChangeToken.issued_when,
-            TapirEmailChangeToken.used,
-        )
-        .where(
-            TapirEmailChangeToken.user_id == user_id,
-            TapirEmailChangeToken.used == 1,
-            TapirEmailChangeToken.consumed_when.isnot(None)
-        )
-    )
+    return build_user_email_history(str(user_id), email, joined_date_int, email_changes_result)
 
-    # Query 2: Tapir email changes (from used tokens table)
-    query2 = (
-        select(
-            t_tapir_email_change_tokens_used.c.used_when,
-            TapirEmailChangeToken.old_email,
-            TapirEmailChangeToken.new_email,
-            func.space(128).label('who'),
-            func.cast(0, Integer).label('admin_id'),
-            TapirEmailChangeToken.issued_when,
-            TapirEmailChangeToken.used,
-        )
-        .select_from(
-            t_tapir_email_change_tokens_used.join(
-                TapirEmailChangeToken,
-                t_tapir_email_change_tokens_used.c.secret == TapirEmailChangeToken.secret
-            )
-        )
-        .where(
-            t_tapir_email_change_tokens_used.c.user_id == user_id,
-            TapirEmailChangeToken.consumed_when.is_(None)
-        )
-    )
 
-    # Query 3: Admin email changes
-    query3 = (
-        select(
-            TapirAdminAudit.log_date.label('used_when'),
-            func.cast('', String).label('old_email'),
-            TapirAdminAudit.data.label('new_email'),
-            TapirNickname.nickname.label('who'),
-            TapirAdminAudit.admin_user.label('admin_id'),
-            TapirAdminAudit.log_date.label('issued_when'),
-            func.cast(True, Boolean).label('used'),
-        )
-        .join(
-            TapirNickname,
-            TapirAdminAudit.admin_user == TapirNickname.user_id,
-            isouter=True
-        )
-        .where(
-            TapirAdminAudit.affected_user == user_id,
-            TapirAdminAudit.action == 'change-email'
-        )
-    )
+def build_user_email_history(user_id: str, email: str, joined_date_int: int,
+                             email_changes_result: List[EmailChangeRow]) -> UserEmailHistory:
+    """
+    Turns the user's email changes into the periods each email was held.
 
-    # Combine all queries with UNION and order by used_when
-    union_query = union_all(query1, query2, query3).order_by('used_when')
+    Args:
+        user_id: The user ID
+        email: The current email
+        joined_date_int: tapir_users.joined_date
+        email_changes_result: The user's changes, in used_when order
 
-    email_changes_result = session.execute(union_query).fetchall()
+    Returns:
+        UserEmailHistory: Complete user email history with typed data
+    """
+    # Convert Unix timestamp to datetime
+    joined_date = datetime.fromtimestamp(joined_date_int)
 
     # Process email changes
     email_history = []
@@ -201,7 +157,7 @@ def get_user_email_history(session: Session, user_id: str) -> UserEmailHistory:
     next_admin_change: EmailChangedBy = EmailChangedBy.USER
 
     for index, change in enumerate(email_changes_result):
-        used_when_int, old_email, new_email, who, admin_id, issued_when, used = change
+        used_when_int, old_email, new_email, admin_id, issued_when, used, _secret = change
 
         # Convert Unix timestamp to datetime
         used_when = datetime.fromtimestamp(used_when_int)
@@ -257,6 +213,49 @@ def get_user_email_history(session: Session, user_id: str) -> UserEmailHistory:
     )
 
 
+def get_user_email_history_many(session: Session, user_ids: List[str]) -> List[UserEmailHistory]:
+    """
+    Batched get_user_email_history. The users, the materialized changes and the union query for the users
+    without the record are one IN-list query each per chunk of users. Nothing is written.
+
+    Args:
+        session: SQLAlchemy session
+        user_ids: The user IDs to look up
+
+    Returns:
+        List[UserEmailHistory]: In the order of user_ids. Users that do not exist are left out.
+    """
+    ids = list(dict.fromkeys(int(user_id) for user_id in user_ids))
+    users: Dict[int, tuple] = {}
+    for chunk in chunked(ids):
+        for user_id, email, joined_date_int in session.execute(
+                select(TapirUser.user_id, TapirUser.email, TapirUser.joined_date)
+                .where(TapirUser.user_id.in_(chunk))).all():
+            users[int(user_id)] = (email, joined_date_int)
+
+    changes = load_email_changes_many(session, list(users))
+    missing = [user_id for user_id in users if user_id not in changes]
+    if missing:
+        changes.update(query_email_changes_many(session, missing))
+
+    return [build_user_email_history(str(user_id), users[user_id][0], users[user_id][1], changes[user_id])
+            for user_id in ids if user_id in users]
+
+
+def get_email_holders_history(session: Session, email: str) -> List[UserEmailHistory]:
+    """
+    Reverse lookup - the email histories of every user who has ever held the email address.
+
+    Args:
+        session: SQLAlchemy session
+        email: The email address
+
+    Returns:
+        List[UserEmailHistory]: In user id order
+    """
+    return get_user_email_history_many(session, [str(user_id) for user_id in email_holder_user_ids(session, email)])
+
+
 class EmailHistoryBiz:
     """
     Class to handle retrieving and managing email change history for a user.
@@ -364,6 +363,12 @@ class EmailHistoryBiz:
         )
         
         self.session.add(new_token)
+        # Pending until verified - the union query has it from tapir_email_change_tokens_used
+        # (generate_email_verify_token), which is written in the same second.
+        append_email_change(self.session, int(self.user_id),
+                            (new_token.issued_when, old_email, change_request.new_email, 0,
+                             new_token.issued_when, False, email_secret))
+        self.email_history = None
         return new_token
     
     def email_verified(self, timestamp: datetime | None = None, remote_ip: str = "", remote_host: str = "",
@@ -455,6 +460,12 @@ class EmailHistoryBiz:
                     logger.info(f"User {self.user_id} email changes from {user.email} to {email_change_token.new_email}")
                     user.email = email_change_token.new_email
 
+            # 4. The consumed token replaces the pending one in the materialized history
+            append_email_change(self.session, int(self.user_id),
+                                (epoch_timestamp, email_change_token.old_email, email_change_token.new_email, 0,
+                                 email_change_token.issued_when, True, email_change_token.secret))
+            self.email_history = None
+
             logger.info(f"Email change token for user {self.user_id} marked as verified")
             return True
             
@@ -464,6 +475,18 @@ class EmailHistoryBiz:
             return False
 
 
+    def admin_email_changed(self, event: AdminAudit_ChangeEmail) -> None:
+        """
+        Adds the admin's email change to the materialized history.
+
+        Args:
+            event: The change-email audit event of the change
+        """
+        append_email_change(self.session, int(self.user_id),
+                            (int(event.timestamp), "", event.data, int(event.admin_user),
+                             int(event.timestamp), True, ""))
+        self.email_history = None
+
     def generate_email_verify_token(self, change_request: EmailChangeRequest) -> str:
         """
         Generates a unique email verification token.
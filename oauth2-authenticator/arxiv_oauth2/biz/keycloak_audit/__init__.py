@@ -10,6 +10,8 @@ import os
 import inspect
 from sqlalchemy.orm import Session
 
+from ...keycloak_user_cache import KeycloakUserCache, invalidate_keycloak_event
+
 user_id_pattern = re.compile("^users/([^/]+)/")
 
 def get_user_id_from_audit_message(data: dict) -> Optional[str]:
@@ -68,7 +70,8 @@ def get_keycloak_dispatch_functions() -> Dict[str, Callable[..., None]]:
     return dispatch_functions
 
 
-def handle_keycloak_event(session: Session, data: dict[str, Any], dispatch_functions: Dict[str, Callable]) -> None:
+def handle_keycloak_event(session: Session, data: dict[str, Any], dispatch_functions: Dict[str, Callable],
+                          user_cache: Optional[KeycloakUserCache] = None) -> None:
     """Keycloak event handler
     the event looks like
     {
@@ -90,9 +93,11 @@ def handle_keycloak_event(session: Session, data: dict[str, Any], dispatch_funct
         "resourceTypeAsString" : "REALM_ROLE_MAPPING"
     }
 
-    Some events may not be interesting to Tapir
+    Some events may not be interesting to Tapir, but any event about a user makes the cached
+    Keycloak representations of the user stale.
     """
     logger = logging.getLogger(__name__)
+    invalidate_keycloak_event(user_cache, data)
 
     # If this is not for arxiv realm, I don't care so eat it up and move on
     realm_name = data.get("realmName")
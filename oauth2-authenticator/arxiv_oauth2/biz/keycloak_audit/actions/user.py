@@ -34,6 +34,7 @@ from arxiv.auth.legacy import accounts
 from arxiv.auth import domain
 
 from ...email_history_biz import EmailHistoryBiz, get_last_tapir_session
+from ...profile_sync import is_profile_sync_echo
 
 
 def update_username(value: Any, user: domain.User, logger: logging.Logger) -> bool:
@@ -91,6 +92,8 @@ def update_email_verified(session: Session, representation: dict, key: str, user
     # 3. Go into Keycloak console and set the email to verified.
     #
     # This is for 2, 3
+    if key not in representation:
+        return False
     value = representation.get(key)
 
     user: TapirUser | None = session.query(TapirUser).filter(TapirUser.user_id == user_id).one_or_none()
@@ -120,9 +123,17 @@ direct_user_updates = [
 ]
 
 
-def dispatch_user_do_update(_data: dict, representation: Any, session: Session, logger: logging.Logger) -> None:
+def dispatch_user_do_update(data: dict, representation: Any, session: Session, logger: logging.Logger) -> None:
     logger.debug(f"Entering {__name__} - r: {representation!r}")
     user_id = representation.get("id")
+    # A partial update (ie. the profile sync) has no id in the representation
+    resource_path = data.get("resourcePath", "")
+    if user_id is None and resource_path.startswith("users/"):
+        user_id = resource_path.split("/")[1]
+
+    if is_profile_sync_echo(session, user_id, representation):
+        logger.debug("user %s update is an echo of the profile sync - dropped", user_id)
+        return
 
     changed = reduce(lambda x, y : x or y, [updater(session, representation, key, user_id, logger) for key, updater in direct_user_updates], False)
     if changed:
@@ -130,7 +141,8 @@ def dispatch_user_do_update(_data: dict, representation: Any, session: Session,
         return
 
     user = accounts.get_user_by_id(user_id)
-    changed = reduce(lambda x, y : x or y, [updater(representation.get(key), user, logger) for key, updater in domain_user_updates], False)
+    # Only what the representation has - a partial update leaves the rest as is
+    changed = reduce(lambda x, y : x or y, [updater(representation.get(key), user, logger) for key, updater in domain_user_updates if key in representation], False)
     if changed:
         logger.info(f"update user {representation!r}")
         accounts.update(user)
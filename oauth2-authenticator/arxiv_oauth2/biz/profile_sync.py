@@ -0,0 +1,158 @@
+"""
+Tapir to Keycloak profile sync.
+
+Tapir is the source of truth for the profile. Keycloak keeps a copy of the names (KC_PROFILE_FIELDS).
+sync_kc_profile PUTs only the fields that differ from the last known Keycloak representation, and
+nothing at all when none do - a suffix or affiliation change does not go to Keycloak. The cached
+representation is per process and may be stale, so a field is known only when the cache and the Tapir
+profile before the update agree on it.
+
+Every write to Keycloak comes back as an admin event through the bridge to /keycloak/audit, where
+dispatch_user_do_update would apply it to Tapir again. The representation of the event is the PUT
+payload, so the writes are tagged with the user id and the payload, and is_profile_sync_echo drops the
+event carrying them. The tags are per process. An echo landing on another replica is recognized by
+tapir_profile_matches - it has nothing Tapir does not have already.
+"""
+import json
+from typing import Any, Optional
+
+from arxiv_bizlogic.bizmodels.user_model import UserModel, UserProjection
+from arxiv_bizlogic.ttl_cache import TTLCache
+from sqlalchemy.orm import Session
+
+from ..keycloak_admin_async import AsyncKeycloakAdminProtocol
+from ..keycloak_user_cache import KeycloakUserCache
+
+# Keycloak user representation field -> UserModel field
+KC_PROFILE_FIELDS = {
+    "firstName": "first_name",
+    "lastName": "last_name",
+}
+
+# What tapir_profile_matches can compare. Anything else in the representation is not an echo.
+_MATCHABLE_FIELDS = {
+    "id": "id",
+    "username": "username",
+    "email": "email",
+    **KC_PROFILE_FIELDS,
+}
+
+
+def kc_profile(user: Any) -> dict:
+    """The Keycloak copy of the profile. user is UserModel or UserIdentityModel."""
+    return {kc_field: getattr(user, field) for kc_field, field in KC_PROFILE_FIELDS.items()}
+
+
+def kc_profile_diff(profile: dict, known: dict) -> dict:
+    """
+    The fields of profile that differ from the known representation, or are not in it.
+    Keycloak leaves out the empty names, so None and "" are the same.
+    """
+    return {field: value for field, value in profile.items()
+            if field not in known or (known[field] or "") != (value or "")}
+
+
+def known_kc_profile(user_cache: Optional[KeycloakUserCache], user_id: str, previous: Any) -> dict:
+    """
+    The fields Keycloak is known to have. The Tapir profile before the update is what Keycloak was
+    last given, unless the user changed it in Keycloak since. With a cached representation, only the
+    fields both agree on are known - the others are written whatever the cache says.
+
+    :param user_cache: app.extra[KEYCLOAK_USER_CACHE]
+    :param previous: UserModel before the update
+    """
+    known = kc_profile(previous)
+    cached = user_cache.get_user(user_id) if user_cache is not None else None
+    if cached is None:
+        return known
+    return {field: value for field, value in known.items() if (cached.get(field) or "") == (value or "")}
+
+
+class ProfileSyncTags:
+    """
+    The Keycloak writes whose admin events are still to come back.
+
+    :param ttl: how long to wait for the event. The bridge may lag behind.
+    """
+
+    def __init__(self, ttl: float = 600.0, maxsize: int = 4096):
+        self._tags: TTLCache[bool] = TTLCache(maxsize=maxsize, default_ttl=ttl)
+
+    @staticmethod
+    def _key(user_id: str, payload: dict) -> tuple:
+        return str(user_id), json.dumps(payload, sort_keys=True, ensure_ascii=False)
+
+    def tag(self, user_id: str, payload: dict) -> None:
+        self._tags.put(self._key(user_id, payload), True)
+
+    def discard(self, user_id: str, payload: dict) -> None:
+        self._tags.invalidate(self._key(user_id, payload))
+
+    def is_echo(self, user_id: str, representation: dict) -> bool:
+        """True once for each tagged write"""
+        return self._tags.invalidate(self._key(user_id, representation))
+
+    def clear(self) -> None:
+        self._tags.clear()
+
+    def stats(self) -> dict:
+        return self._tags.stats()
+
+
+_profile_sync_tags = ProfileSyncTags()
+
+
+def get_profile_sync_tags() -> ProfileSyncTags:
+    """The tags sync_kc_profile and is_profile_sync_echo use. For tests."""
+    return _profile_sync_tags
+
+
+async def sync_kc_profile(kc_admin: AsyncKeycloakAdminProtocol, user_id: str, profile: dict, known: dict,
+                          tags: Optional[ProfileSyncTags] = None) -> dict:
+    """
+    PUTs the changed fields of the profile to Keycloak, tagged.
+
+    :param kc_admin: app.extra[KEYCLOAK_ASYNC_ADMIN]
+    :param profile: kc_profile of the updated user
+    :param known: known_kc_profile
+    :return: the fields written. Empty when Keycloak is up to date and was not called.
+    """
+    changes = kc_profile_diff(profile, known)
+    if not changes:
+        return changes
+    tags = tags or _profile_sync_tags
+    # Before the PUT - the event can be back before update_user returns
+    tags.tag(user_id, changes)
+    try:
+        await kc_admin.update_user(user_id=user_id, payload=changes)
+    except Exception:
+        tags.discard(user_id, changes)
+        raise
+    return changes
+
+
+def tapir_profile_matches(session: Session, user_id: str, representation: dict) -> bool:
+    """
+    True when the representation has only the fields Tapir mirrors, with the values Tapir has.
+    Keycloak lowercases the username.
+    """
+    if not representation or not set(representation).issubset(_MATCHABLE_FIELDS):
+        return False
+    user = UserModel.one_user(session, user_id, UserProjection.identity)
+    if user is None:
+        return False
+    for kc_field, value in representation.items():
+        tapir_value = getattr(user, _MATCHABLE_FIELDS[kc_field])
+        if kc_field in ("username", "email", "id"):
+            if str(tapir_value or "").lower() != str(value or "").lower():
+                return False
+        elif (tapir_value or "").strip() != (value or "").strip():
+            return False
+    return True
+
+
+def is_profile_sync_echo(session: Session, user_id: str, representation: dict,
+                         tags: Optional[ProfileSyncTags] = None) -> bool:
+    """Is the USER UPDATE admin event the echo of a Tapir to Keycloak write?"""
+    tags = tags or _profile_sync_tags
+    return tags.is_echo(user_id, representation) or tapir_profile_matches(session, user_id, representation)
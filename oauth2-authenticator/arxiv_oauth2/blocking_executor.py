@@ -0,0 +1,118 @@
+"""
+Bounded thread pool for blocking DB / Keycloak work done from async route handlers.
+
+SQLAlchemy sessions and KeycloakAdmin are synchronous. Calling them directly from an
+`async def` handler blocks the event loop, so one slow Keycloak call stalls every request
+on the worker. Handlers hand such work to the executor with `run_blocking`.
+
+The pool is created in create_app and lives in app.extra[BLOCKING_EXECUTOR].
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from fastapi import HTTPException, Request, status
+
+BLOCKING_EXECUTOR = 'BLOCKING_EXECUTOR'
+
+T = TypeVar("T")
+
+
+class BlockingExecutor:
+    """
+    Thread pool with a bounded backlog and wait-time metrics.
+
+    :param max_workers: number of threads
+    :param max_queue: number of calls allowed to wait for a thread. When the backlog is full,
+        the call is rejected with 503 rather than piling up behind a stuck backend.
+    """
+
+    def __init__(self, max_workers: int = 16, max_queue: int = 64, name: str = "aaa-blocking"):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self.submitted = 0
+        self.started = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _run(self, enqueued_at: float, func: Callable[[], T]) -> T:
+        wait = time.monotonic() - enqueued_at
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+            self.started += 1
+            self.total_wait += wait
+            if wait > self.max_wait:
+                self.max_wait = wait
+        try:
+            return func()
+        finally:
+            with self._lock:
+                self._active -= 1
+                self.completed += 1
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Runs func(*args, **kwargs) on the pool and awaits the result."""
+        with self._lock:
+            if self._queued + self._active >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                    detail="Server is busy. Please try again later.")
+            self._queued += 1
+            self.submitted += 1
+
+        # Carry the context (correlation id, logging) over to the worker thread
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, func, *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self._pool, self._run, time.monotonic(), call)
+        except RuntimeError:
+            # Pool is shut down, the call never got queued.
+            with self._lock:
+                self._queued -= 1
+            raise
+        return await future
+
+    def stats(self) -> dict:
+        """Queue depth and wait time metrics."""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self._queued,
+                "active": self._active,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "average_wait": (self.total_wait / self.started) if self.started else 0.0,
+                "max_wait": self.max_wait,
+            }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def get_blocking_executor(request: Request) -> BlockingExecutor | None:
+    return request.app.extra.get(BLOCKING_EXECUTOR)
+
+
+async def run_blocking(request: Request, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Runs the blocking call on the app's executor.
+    Falls back to the default thread pool when the app has none (ie. in unit tests.)
+    """
+    executor = get_blocking_executor(request)
+    if executor is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return await executor.run(func, *args, **kwargs)
@@ -16,6 +16,7 @@ from fastapi.responses import JSONResponse
 from . import (get_db, verify_bearer_token, ApiToken, get_keycloak_admin, is_authenticated,
                is_authorized)  # , get_client_host
 from .biz.keycloak_audit import handle_keycloak_event
+from .keycloak_user_cache import KEYCLOAK_USER_CACHE
 
 logger = logging.getLogger(__name__)
 
@@ -37,7 +38,7 @@ async def audit_event(
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
 
     functions = request.app.extra['KEYCLOAK_DISPATCH_FUNCTIONS']
-    handle_keycloak_event(session, body, functions)
+    handle_keycloak_event(session, body, functions, user_cache=request.app.extra.get(KEYCLOAK_USER_CACHE))
 
 
 @router.get('/user/{user_id:str}', description="")
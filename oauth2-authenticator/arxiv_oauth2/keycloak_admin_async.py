@@ -0,0 +1,434 @@
+"""
+Async Keycloak admin client.
+
+python-keycloak's KeycloakAdmin is synchronous - each call holds a worker thread for the whole
+Keycloak round trip, and it fetches a fresh admin token whenever it is asked for one. Keycloak latency
+is the dominant term of the profile and password flows, so the async handlers talk to Keycloak with
+AsyncKeycloakAdmin instead:
+
+  - one pooled httpx.AsyncClient for the app, HTTP/2 when the h2 package is installed
+  - the admin token is reused, and refreshed shortly before it expires by whichever call gets there first
+  - every call takes a timeout
+  - a circuit breaker fails calls fast while Keycloak is down, instead of queueing them behind the timeout
+
+The profile update, password change and reset, impersonation and bulk migration use it. Migrating a
+user Keycloak does not have yet (migrate_to_keycloak, cold_migrate) still goes through the sync
+KeycloakAdmin on the blocking executor.
+
+Errors are python-keycloak's exceptions (KeycloakGetError etc. with response_code), so callers handle
+both clients the same way. BlockingKeycloakAdmin gives the same interface over a sync KeycloakAdmin
+(or MockKeycloakAdmin) on the blocking executor, for when there is no admin secret.
+
+The client is created in create_app and lives in app.extra[KEYCLOAK_ASYNC_ADMIN].
+"""
+import asyncio
+import json
+import time
+from typing import Any, List, Optional, Protocol
+
+import httpx
+from arxiv.base import logging
+from keycloak.exceptions import (
+    KeycloakAuthenticationError,
+    KeycloakConnectionError,
+    KeycloakDeleteError,
+    KeycloakError,
+    KeycloakGetError,
+    KeycloakPostError,
+    KeycloakPutError,
+    raise_error_from_response,
+)
+
+from .blocking_executor import BlockingExecutor
+
+logger = logging.getLogger(__name__)
+
+KEYCLOAK_ASYNC_ADMIN = 'KEYCLOAK_ASYNC_ADMIN'
+
+# The error python-keycloak raises for each method
+_METHOD_ERRORS = {
+    "GET": KeycloakGetError,
+    "POST": KeycloakPostError,
+    "PUT": KeycloakPutError,
+    "DELETE": KeycloakDeleteError,
+}
+
+try:
+    import h2  # noqa: F401 - httpx needs it for HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def _impersonation_redirect(response: Any) -> Optional[str]:
+    """
+    The URL to redirect to after the impersonation POST - the "redirect" header, or else "redirect"
+    of the JSON body. The response is httpx's or requests'.
+    """
+    redirect = response.headers.get("redirect")
+    if redirect is None and response.content:
+        redirect = response.json().get("redirect")
+    return redirect
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures. While open, calls fail without trying.
+    After reset_timeout seconds one call is let through (half open) - its success closes the
+    breaker, its failure opens it again.
+
+    :param failure_threshold: consecutive failures that open the breaker
+    :param reset_timeout: seconds to stay open
+    :param clock: time source, for tests
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead. In half open, only one at a time."""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def release_trial(self) -> None:
+        """Ends the half open trial, however the call ended. The next call may try again."""
+        self._trial_running = False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._trial_running = False
+        if self._opened_at is not None or self._failures >= self.failure_threshold:
+            self._opened_at = self._clock()
+
+
+class AsyncKeycloakAdminProtocol(Protocol):
+    """The Keycloak admin operations this app uses."""
+
+    async def get_user(self, user_id: str, user_profile_metadata: bool = False,
+                       timeout: Optional[float] = None) -> dict: ...
+
+    async def update_user(self, user_id: str, payload: dict, timeout: Optional[float] = None) -> None: ...
+
+    async def set_user_password(self, user_id: str, password: str, temporary: bool = False,
+                                timeout: Optional[float] = None) -> None: ...
+
+    async def get_credentials(self, user_id: str, timeout: Optional[float] = None) -> List[dict]: ...
+
+    async def delete_credential(self, user_id: str, credential_id: str, timeout: Optional[float] = None) -> None: ...
+
+    async def send_update_account(self, user_id: str, payload: Any, timeout: Optional[float] = None) -> None: ...
+
+    async def create_user(self, payload: dict, exist_ok: bool = False, timeout: Optional[float] = None) -> str: ...
+
+    async def impersonate(self, user_id: str, timeout: Optional[float] = None) -> Optional[str]: ...
+
+    async def partial_import(self, payload: dict, timeout: Optional[float] = None) -> dict: ...
+
+    async def get_components(self, query: Optional[dict] = None, timeout: Optional[float] = None) -> List[dict]: ...
+
+    async def status(self) -> dict: ...
+
+    async def aclose(self) -> None: ...
+
+
+class AsyncKeycloakAdmin:
+    """
+    Keycloak admin REST client on a pooled httpx.AsyncClient.
+
+    :param server_url: Keycloak base URL
+    :param realm_name: realm the users are in
+    :param username: admin user
+    :param password: admin password
+    :param user_realm_name: realm of the admin user
+    :param client_id: client of the admin token
+    :param verify: verify the TLS certificate
+    :param timeout: default seconds per call
+    :param max_connections: connection pool size
+    :param token_refresh_margin: refresh the admin token this many seconds before it expires
+    :param circuit_breaker: defaults to 5 failures / 30 seconds
+    :param transport: httpx transport, for tests
+    """
+
+    def __init__(self, server_url: str, realm_name: str, username: str, password: str,
+                 user_realm_name: str = "master", client_id: str = "admin-cli", verify: bool = True,
+                 timeout: float = 10.0, max_connections: int = 50, token_refresh_margin: float = 30.0,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.server_url = server_url.rstrip("/")
+        self.realm_name = realm_name
+        self.user_realm_name = user_realm_name
+        self.client_id = client_id
+        self._username = username
+        self._password = password
+        self.timeout = timeout
+        self.token_refresh_margin = token_refresh_margin
+        self.circuit_breaker = circuit_breaker if circuit_breaker else CircuitBreaker()
+        self._client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE and transport is None,
+            verify=verify,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+        self._access_token: Optional[str] = None
+        self._access_expires_at = 0.0
+        self._refresh_token: Optional[str] = None
+        self._refresh_expires_at = 0.0
+        self._token_lock = asyncio.Lock()
+        self.token_fetches = 0
+
+    @property
+    def admin_url(self) -> str:
+        return f"{self.server_url}/admin/realms/{self.realm_name}"
+
+    def _token_fresh(self) -> bool:
+        return self._access_token is not None and \
+            time.monotonic() < self._access_expires_at - self.token_refresh_margin
+
+    async def get_token(self, force: bool = False) -> str:
+        """
+        The admin access token. Fetched only when there is none, it is about to expire, or force.
+        Concurrent callers wait for the one fetch.
+        """
+        if not force and self._token_fresh():
+            return self._access_token  # type: ignore[return-value]
+        async with self._token_lock:
+            if not force and self._token_fresh():
+                return self._access_token  # type: ignore[return-value]
+            await self._fetch_token()
+            return self._access_token  # type: ignore[return-value]
+
+    async def _fetch_token(self) -> None:
+        now = time.monotonic()
+        if self._refresh_token and now < self._refresh_expires_at - self.token_refresh_margin:
+            data = {"grant_type": "refresh_token", "client_id": self.client_id, "refresh_token": self._refresh_token}
+        else:
+            data = {"grant_type": "password", "client_id": self.client_id,
+                    "username": self._username, "password": self._password}
+        url = f"{self.server_url}/realms/{self.user_realm_name}/protocol/openid-connect/token"
+        try:
+            response = await self._client.post(url, data=data, timeout=self.timeout)
+        except httpx.HTTPError as exc:
+            raise KeycloakConnectionError(f"Keycloak token request failed: {exc!r}") from exc
+
+        if response.status_code == 400 and data["grant_type"] == "refresh_token":
+            # The refresh token was revoked, or the session is gone. Log in again.
+            self._refresh_token = None
+            return await self._fetch_token()
+        if response.status_code >= 500:
+            raise KeycloakConnectionError(error_message=response.text, response_code=response.status_code,
+                                          response_body=response.content)
+        if response.status_code >= 400:
+            raise KeycloakAuthenticationError(error_message=response.text, response_code=response.status_code,
+                                              response_body=response.content)
+
+        token = response.json()
+        self._access_token = token["access_token"]
+        self._access_expires_at = now + float(token.get("expires_in", 60))
+        self._refresh_token = token.get("refresh_token")
+        self._refresh_expires_at = now + float(token.get("refresh_expires_in", 0))
+        self.token_fetches += 1
+
+    async def _request(self, method: str, path: str, timeout: Optional[float] = None,
+                       expected: tuple = (200, 201, 204), **kwargs) -> httpx.Response:
+        trial = self.circuit_breaker.state == CircuitBreaker.HALF_OPEN
+        if not self.circuit_breaker.allow():
+            raise KeycloakConnectionError("Keycloak circuit breaker is open")
+        try:
+            return await self._send(method, path, timeout, expected, **kwargs)
+        finally:
+            # Cancelled, or failed with something unexpected - not to leave the breaker half open for good
+            if trial:
+                self.circuit_breaker.release_trial()
+
+    async def _send(self, method: str, path: str, timeout: Optional[float], expected: tuple,
+                    **kwargs) -> httpx.Response:
+        url = f"{self.admin_url}/{path}"
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            headers = {"Authorization": f"Bearer {await self.get_token()}"}
+            response = await self._client.request(method, url, headers=headers, timeout=timeout, **kwargs)
+            if response.status_code == 401:
+                # Revoked before it expired - one more time with a new one
+                headers = {"Authorization": f"Bearer {await self.get_token(force=True)}"}
+                response = await self._client.request(method, url, headers=headers, timeout=timeout, **kwargs)
+        except httpx.HTTPError as exc:
+            self.circuit_breaker.record_failure()
+            raise KeycloakConnectionError(f"Keycloak {method} {path} failed: {exc!r}") from exc
+        except KeycloakConnectionError:
+            self.circuit_breaker.record_failure()
+            raise
+        except KeycloakError:
+            # The token was refused - Keycloak itself is up
+            self.circuit_breaker.record_success()
+            raise
+
+        if response.status_code >= 500:
+            self.circuit_breaker.record_failure()
+        else:
+            self.circuit_breaker.record_success()
+
+        if response.status_code not in expected:
+            raise _METHOD_ERRORS[method](error_message=response.text, response_code=response.status_code,
+                                         response_body=response.content)
+        return response
+
+    async def get_user(self, user_id: str, user_profile_metadata: bool = False,
+                       timeout: Optional[float] = None) -> dict:
+        params = {"userProfileMetadata": "true"} if user_profile_metadata else None
+        response = await self._request("GET", f"users/{user_id}", timeout=timeout, expected=(200,), params=params)
+        return response.json()
+
+    async def get_user_id(self, username: str, timeout: Optional[float] = None) -> Optional[str]:
+        response = await self._request("GET", "users", timeout=timeout, expected=(200,),
+                                       params={"username": username, "exact": "true"})
+        users = response.json()
+        return users[0]["id"] if users else None
+
+    async def update_user(self, user_id: str, payload: dict, timeout: Optional[float] = None) -> None:
+        await self._request("PUT", f"users/{user_id}", timeout=timeout, expected=(204,), json=payload)
+
+    async def set_user_password(self, user_id: str, password: str, temporary: bool = False,
+                                timeout: Optional[float] = None) -> None:
+        payload = {"type": "password", "temporary": temporary, "value": password}
+        await self._request("PUT", f"users/{user_id}/reset-password", timeout=timeout, expected=(204,),
+                            json=payload)
+
+    async def get_credentials(self, user_id: str, timeout: Optional[float] = None) -> List[dict]:
+        response = await self._request("GET", f"users/{user_id}/credentials", timeout=timeout, expected=(200,))
+        return response.json()
+
+    async def delete_credential(self, user_id: str, credential_id: str, timeout: Optional[float] = None) -> None:
+        await self._request("DELETE", f"users/{user_id}/credentials/{credential_id}", timeout=timeout,
+                            expected=(204,))
+
+    async def send_update_account(self, user_id: str, payload: Any, timeout: Optional[float] = None) -> None:
+        await self._request("PUT", f"users/{user_id}/execute-actions-email", timeout=timeout, expected=(200, 204),
+                            json=payload)
+
+    async def create_user(self, payload: dict, exist_ok: bool = False, timeout: Optional[float] = None) -> str:
+        """:return: the Keycloak user id"""
+        try:
+            response = await self._request("POST", "users", timeout=timeout, expected=(201,), json=payload)
+        except KeycloakPostError as exc:
+            if exist_ok and exc.response_code == 409:
+                user_id = await self.get_user_id(payload["username"], timeout=timeout)
+                if user_id:
+                    return user_id
+            raise
+        return response.headers.get("Location", "").rstrip("/").split("/")[-1]
+
+    async def impersonate(self, user_id: str, timeout: Optional[float] = None) -> Optional[str]:
+        """:return: the URL to redirect to"""
+        response = await self._request("POST", f"users/{user_id}/impersonation", timeout=timeout, expected=(200,),
+                                       json={})
+        return _impersonation_redirect(response)
+
+    async def partial_import(self, payload: dict, timeout: Optional[float] = None) -> dict:
+        """
+        Realm partial import - {"ifResourceExists": "SKIP", "users": [...]}.
+
+        :return: {"added": n, "skipped": n, "overwritten": n, "results": [...]}
+        """
+        response = await self._request("POST", "partialImport", timeout=timeout, expected=(200,), json=payload)
+        return response.json()
+
+    async def get_components(self, query: Optional[dict] = None, timeout: Optional[float] = None) -> List[dict]:
+        """The realm components - query {"type": ...} for the components of a provider type"""
+        response = await self._request("GET", "components", timeout=timeout, expected=(200,), params=query)
+        return response.json()
+
+    async def status(self) -> dict:
+        """For /status. Does not call Keycloak when the token is fresh."""
+        await self.get_token()
+        return {"circuit": self.circuit_breaker.state, "token_fetches": self.token_fetches}
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+class BlockingKeycloakAdmin:
+    """
+    The AsyncKeycloakAdmin interface over a sync KeycloakAdmin, run on the blocking executor.
+    Per-call timeouts are not enforced.
+    """
+
+    def __init__(self, kc_admin: Any, executor: BlockingExecutor):
+        self.kc_admin = kc_admin
+        self.executor = executor
+
+    async def get_user(self, user_id: str, user_profile_metadata: bool = False,
+                       timeout: Optional[float] = None) -> dict:
+        return await self.executor.run(self.kc_admin.get_user, user_id, user_profile_metadata=user_profile_metadata)
+
+    async def update_user(self, user_id: str, payload: dict, timeout: Optional[float] = None) -> None:
+        await self.executor.run(self.kc_admin.update_user, user_id=user_id, payload=payload)
+
+    async def set_user_password(self, user_id: str, password: str, temporary: bool = False,
+                                timeout: Optional[float] = None) -> None:
+        await self.executor.run(self.kc_admin.set_user_password, user_id, password, temporary=temporary)
+
+    async def get_credentials(self, user_id: str, timeout: Optional[float] = None) -> List[dict]:
+        return await self.executor.run(self.kc_admin.get_credentials, user_id)
+
+    async def delete_credential(self, user_id: str, credential_id: str, timeout: Optional[float] = None) -> None:
+        await self.executor.run(self.kc_admin.delete_credential, user_id=user_id, credential_id=credential_id)
+
+    async def send_update_account(self, user_id: str, payload: Any, timeout: Optional[float] = None) -> None:
+        await self.executor.run(self.kc_admin.send_update_account, user_id=user_id, payload=payload)
+
+    async def create_user(self, payload: dict, exist_ok: bool = False, timeout: Optional[float] = None) -> str:
+        return await self.executor.run(self.kc_admin.create_user, payload, exist_ok=exist_ok)
+
+    async def impersonate(self, user_id: str, timeout: Optional[float] = None) -> Optional[str]:
+        connection = self.kc_admin.connection
+        response = await self.executor.run(
+            connection.raw_post, f"admin/realms/{connection.realm_name}/users/{user_id}/impersonation", {})
+        raise_error_from_response(response, KeycloakPostError, expected_codes=[200])
+        return _impersonation_redirect(response)
+
+    async def partial_import(self, payload: dict, timeout: Optional[float] = None) -> dict:
+        connection = self.kc_admin.connection
+        response = await self.executor.run(
+            connection.raw_post, f"admin/realms/{connection.realm_name}/partialImport", json.dumps(payload))
+        return raise_error_from_response(response, KeycloakPostError, expected_codes=[200])
+
+    async def get_components(self, query: Optional[dict] = None, timeout: Optional[float] = None) -> List[dict]:
+        return await self.executor.run(self.kc_admin.get_components, query=query)
+
+    async def status(self) -> dict:
+        connection = self.kc_admin.connection
+        await self.executor.run(connection.get_token)
+        token = connection.token
+        if not (isinstance(token, dict) and token.get('access_token', None)):
+            raise KeycloakAuthenticationError("No admin token")
+        return {"circuit": CircuitBreaker.CLOSED}
+
+    async def aclose(self) -> None:
+        return None
@@ -0,0 +1,186 @@
+"""
+Local validation of Keycloak access tokens.
+
+Keycloak signs the access tokens with the realm keys it publishes as the JWKS. KeycloakTokenValidator
+keeps the keys and checks the signature, expiry, issuer and audience itself, so a password change
+does not wait on the introspection endpoint:
+
+  - the JWKS is fetched on first use and again after jwks_ttl
+  - a token signed with a key id not in the set fetches the set again (Keycloak rotated the keys),
+    at most once per min_refresh_interval, so made up key ids do not hammer Keycloak
+  - one fetch at a time - the callers waiting on it use what it got
+  - the expected iss is the issuer of the realm's OIDC discovery document (.well-known/openid-configuration),
+    fetched with the first JWKS. Keycloak puts its frontend URL there, which may not be server_url.
+
+What it can not tell is whether the session of the token was ended before the token expired.
+JWKSUnavailable means the keys could not be had - the caller falls back to the introspection
+(kc_verify_access_token in biz.account_biz). A token that fails the checks is refused without
+the introspection - that includes jwt.InvalidIssuerError, so a wrong issuer (KEYCLOAK_TOKEN_ISSUER)
+refuses every token rather than falling back.
+
+The validator is created in create_app and lives in app.extra[KEYCLOAK_TOKEN_VALIDATOR]. It is None
+when KEYCLOAK_TOKEN_VALIDATION=introspect.
+"""
+import asyncio
+import time
+from typing import Dict, Iterable, Optional
+
+import httpx
+import jwt
+from arxiv.base import logging
+
+logger = logging.getLogger(__name__)
+
+KEYCLOAK_TOKEN_VALIDATOR = 'KEYCLOAK_TOKEN_VALIDATOR'
+
+
+class JWKSUnavailable(Exception):
+    """The realm signing keys could not be fetched"""
+    pass
+
+
+class KeycloakTokenValidator:
+    """
+    :param server_url: Keycloak server URL
+    :param realm_name: the realm of the tokens
+    :param client_id: the client the tokens are for - aud or azp
+    :param audiences: more audiences to accept
+    :param issuer: iss of the tokens. By default, the issuer of the realm's OIDC discovery document.
+    :param leeway: seconds of clock skew for exp / iat
+    :param jwks_ttl: seconds to keep the JWKS
+    :param min_refresh_interval: seconds between the fetches for an unknown key id, or after a failed fetch
+    """
+
+    def __init__(self, server_url: str, realm_name: str, client_id: str,
+                 audiences: Optional[Iterable[str]] = None,
+                 issuer: Optional[str] = None,
+                 verify: bool = True,
+                 timeout: float = 5.0,
+                 leeway: float = 30.0,
+                 jwks_ttl: float = 3600.0,
+                 min_refresh_interval: float = 30.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None,
+                 clock=time.monotonic):
+        realm_url = f"{server_url.rstrip('/')}/realms/{realm_name}"
+        self.jwks_url = f"{realm_url}/protocol/openid-connect/certs"
+        self.discovery_url = f"{realm_url}/.well-known/openid-configuration"
+        self.issuer = issuer
+        self.audiences = {client_id, *(audiences or [])}
+        self.leeway = leeway
+        self.jwks_ttl = jwks_ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.clock = clock
+        self._client = httpx.AsyncClient(verify=verify, timeout=timeout, transport=transport)
+        self._lock = asyncio.Lock()
+        self._keys: Dict[str, jwt.PyJWK] = {}
+        self._fetched_at: Optional[float] = None
+        self._retry_after = 0.0
+        self._last_fetch_failed = False
+        # Bumped by every fetch, good or bad. Tells the waiters the fetch they waited for is done.
+        self._fetch_count = 0
+        self.jwks_fetches = 0
+
+    def _expired(self, now: float) -> bool:
+        return self._fetched_at is None or now - self._fetched_at > self.jwks_ttl
+
+    async def _refresh(self, seen_fetch_count: int) -> None:
+        async with self._lock:
+            if self._fetch_count != seen_fetch_count:
+                # Fetched while this one waited
+                return
+            try:
+                if self.issuer is None:
+                    self.issuer = await self._fetch_issuer()
+                    logger.info("Keycloak token issuer: %s", self.issuer)
+                response = await self._client.get(self.jwks_url)
+                response.raise_for_status()
+                keys = self._parse_jwks(response.json())
+            except (httpx.HTTPError, ValueError, KeyError, TypeError) as exc:
+                logger.warning("Fetching the JWKS %s failed: %r", self.jwks_url, exc)
+                self._last_fetch_failed = True
+                self._retry_after = self.clock() + self.min_refresh_interval
+                return
+            finally:
+                # After the fetch - the callers that came during it are its waiters, not the next fetch
+                self._fetch_count += 1
+            now = self.clock()
+            self._keys = keys
+            self._fetched_at = now
+            self._retry_after = now + self.min_refresh_interval
+            self._last_fetch_failed = False
+            self.jwks_fetches += 1
+            logger.info("JWKS %s: key ids %s", self.jwks_url, ", ".join(keys))
+
+    async def _fetch_issuer(self) -> str:
+        response = await self._client.get(self.discovery_url)
+        response.raise_for_status()
+        issuer = response.json()["issuer"]
+        if not isinstance(issuer, str) or not issuer:
+            raise ValueError(f"No issuer in {self.discovery_url}")
+        return issuer
+
+    @staticmethod
+    def _parse_jwks(jwks: dict) -> Dict[str, jwt.PyJWK]:
+        keys = {}
+        for jwk in jwks["keys"]:
+            # The realm also publishes the encryption keys
+            if jwk.get("use", "sig") != "sig" or "kid" not in jwk:
+                continue
+            try:
+                keys[jwk["kid"]] = jwt.PyJWK(jwk)
+            except jwt.PyJWKError as exc:
+                logger.warning("JWK %s is not usable: %s", jwk.get("kid"), exc)
+        return keys
+
+    async def get_signing_key(self, kid: str) -> jwt.PyJWK:
+        """
+        :raises jwt.InvalidTokenError: the key id is not the realm's
+        :raises JWKSUnavailable: the keys could not be fetched to find out
+        """
+        now = self.clock()
+        key = self._keys.get(kid)
+        if key is not None and not self._expired(now):
+            return key
+        if now >= self._retry_after:
+            await self._refresh(self._fetch_count)
+            key = self._keys.get(kid)
+        if key is not None:
+            # Kept through a failed fetch - the keys rarely rotate
+            return key
+        if self._last_fetch_failed or not self._keys:
+            raise JWKSUnavailable(f"No signing keys from {self.jwks_url}")
+        raise jwt.InvalidTokenError(f"Unknown signing key {kid!r}")
+
+    async def validate(self, access_token: str) -> dict:
+        """
+        :return: the claims of the valid access token
+        :raises jwt.InvalidTokenError: the token is not valid
+        :raises JWKSUnavailable: the signing keys could not be had, so the token could not be checked
+        """
+        try:
+            header = jwt.get_unverified_header(access_token)
+        except jwt.DecodeError as exc:
+            raise jwt.InvalidTokenError(f"Malformed token: {exc}") from exc
+        kid = header.get("kid")
+        if not kid:
+            raise jwt.InvalidTokenError("Token has no key id")
+
+        key = await self.get_signing_key(kid)
+        if self.issuer is None:
+            raise JWKSUnavailable(f"No issuer from {self.discovery_url}")
+        claims = jwt.decode(access_token, key.key, algorithms=[key.algorithm_name], issuer=self.issuer,
+                            leeway=self.leeway,
+                            options={"verify_aud": False, "require": ["exp", "iat", "iss"]})
+
+        # Keycloak puts the client in azp, and the resource servers in aud
+        audience = claims.get("aud") or []
+        audience = {audience} if isinstance(audience, str) else set(audience)
+        if not (audience & self.audiences or claims.get("azp") in self.audiences):
+            raise jwt.InvalidAudienceError(f"Token is not for {', '.join(sorted(self.audiences))}")
+        # Not an ID token
+        if claims.get("typ", "Bearer") != "Bearer":
+            raise jwt.InvalidTokenError(f"Not an access token: {claims.get('typ')}")
+        return claims
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
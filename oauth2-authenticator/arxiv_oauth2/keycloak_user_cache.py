@@ -0,0 +1,202 @@
+"""
+Read-through cache of Keycloak user and realm role representations.
+
+The admin screens, /impersonate and the password flows ask Keycloak for the same users over and over,
+sometimes twice in one request. CachingKeycloakAdmin and CachingAsyncKeycloakAdmin put a short-TTL,
+size-bounded cache in front of get_user and get_realm_roles_of_user, and drop a user's entries when
+the app changes the user through them. Every drop bumps the user's generation; a read that started
+before the drop does not cache what it got.
+
+The cache is per process. Changes made elsewhere (the Keycloak console, the other replicas) arrive as
+Keycloak events at /keycloak/audit, which handle_keycloak_event passes to invalidate_keycloak_event -
+but each event reaches one replica only. On the other replicas a user changed elsewhere is stale for
+up to the TTL.
+
+The cache is created in create_app and lives in app.extra[KEYCLOAK_USER_CACHE].
+"""
+import copy
+import itertools
+import re
+import threading
+from typing import Any, List, Optional
+
+from arxiv_bizlogic.ttl_cache import TTLCache
+
+KEYCLOAK_USER_CACHE = 'KEYCLOAK_USER_CACHE'
+
+# users/<id> and users/<id>/role-mappings/...
+_resource_user_pattern = re.compile("^users/([^/]+)")
+
+
+class KeycloakUserCache:
+    """
+    :param ttl: seconds to keep a representation
+    :param maxsize: number of representations
+    :param generation_ttl: seconds to remember an invalidation. Longer than any Keycloak read takes.
+    """
+
+    def __init__(self, ttl: float = 30.0, maxsize: int = 4096, generation_ttl: float = 600.0):
+        self._cache: TTLCache[Any] = TTLCache(maxsize=maxsize, default_ttl=ttl)
+        # user id -> generation of the last invalidation. Unknown users are generation 0.
+        self._generations: TTLCache[int] = TTLCache(maxsize=maxsize, default_ttl=generation_ttl)
+        self._next_generation = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def generation(self, user_id: str) -> int:
+        """Take this before reading the user from Keycloak, and give it to put_user / put_realm_roles."""
+        return self._generations.get(str(user_id)) or 0
+
+    def _put(self, key: tuple, user_id: str, value: Any, generation: Optional[int]) -> None:
+        with self._lock:
+            # Invalidated while it was read - what was read may be from before the change
+            if generation is not None and generation != self.generation(user_id):
+                return
+            self._cache.put(key, copy.deepcopy(value))
+
+    def get_user(self, user_id: str, user_profile_metadata: bool = False) -> Optional[dict]:
+        user = self._cache.get(("user", str(user_id), user_profile_metadata))
+        # Callers are free to modify what they get
+        return copy.deepcopy(user) if user is not None else None
+
+    def put_user(self, user_id: str, user: dict, user_profile_metadata: bool = False,
+                 generation: Optional[int] = None) -> None:
+        """:param generation: generation() from before the read. Not cached when the user was invalidated since."""
+        self._put(("user", str(user_id), user_profile_metadata), user_id, user, generation)
+
+    def get_realm_roles(self, user_id: str) -> Optional[List[dict]]:
+        roles = self._cache.get(("roles", str(user_id)))
+        return copy.deepcopy(roles) if roles is not None else None
+
+    def put_realm_roles(self, user_id: str, roles: List[dict], generation: Optional[int] = None) -> None:
+        self._put(("roles", str(user_id)), user_id, roles, generation)
+
+    def invalidate(self, user_id: Optional[str]) -> None:
+        """Drops everything about the user, and bumps the user's generation."""
+        if not user_id:
+            return
+        user_id = str(user_id)
+        with self._lock:
+            self._generations.put(user_id, next(self._next_generation))
+            self._cache.invalidate(("user", user_id, False))
+            self._cache.invalidate(("user", user_id, True))
+            self._cache.invalidate(("roles", user_id))
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+def invalidate_keycloak_event(cache: Optional[KeycloakUserCache], data: dict) -> Optional[str]:
+    """
+    Drops the user an arxiv realm Keycloak event is about - an admin event on users/<id>...
+    (USER, REALM_ROLE_MAPPING, ...), or a user event other than login / logout.
+
+    :return: the user id invalidated
+    """
+    if cache is None or data.get("realmName") != "arxiv":
+        return None
+    user_id = None
+    matched = _resource_user_pattern.match(data.get("resourcePath", "") or "")
+    if matched:
+        user_id = matched.group(1)
+    elif data.get("type", "").lower() not in ("login", "logout"):
+        user_id = data.get("userId")
+    cache.invalidate(user_id)
+    return user_id
+
+
+class CachingKeycloakAdmin:
+    """
+    KeycloakAdmin with the cache in front of get_user and get_realm_roles_of_user.
+    Everything else goes to the KeycloakAdmin as is.
+    """
+
+    def __init__(self, kc_admin: Any, cache: KeycloakUserCache):
+        self.kc_admin = kc_admin
+        self.cache = cache
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.kc_admin, name)
+
+    def get_user(self, user_id: str, user_profile_metadata: bool = False) -> dict:
+        user = self.cache.get_user(user_id, user_profile_metadata)
+        if user is None:
+            generation = self.cache.generation(user_id)
+            user = self.kc_admin.get_user(user_id, user_profile_metadata=user_profile_metadata)
+            self.cache.put_user(user_id, user, user_profile_metadata, generation=generation)
+        return user
+
+    def get_realm_roles_of_user(self, user_id: str) -> List[dict]:
+        roles = self.cache.get_realm_roles(user_id)
+        if roles is None:
+            generation = self.cache.generation(user_id)
+            roles = self.kc_admin.get_realm_roles_of_user(user_id)
+            self.cache.put_realm_roles(user_id, roles, generation=generation)
+        return roles
+
+    # The writes drop the user after the change. A read that overlapped the write sees the generation
+    # changed and does not cache what it read.
+
+    def update_user(self, user_id: str, payload: dict, *args: Any, **kwargs: Any) -> Any:
+        try:
+            return self.kc_admin.update_user(user_id, payload, *args, **kwargs)
+        finally:
+            self.cache.invalidate(user_id)
+
+    def create_user(self, payload: dict, *args: Any, **kwargs: Any) -> Any:
+        try:
+            return self.kc_admin.create_user(payload, *args, **kwargs)
+        finally:
+            self.cache.invalidate(payload.get("id"))
+
+    def delete_user(self, user_id: str) -> Any:
+        try:
+            return self.kc_admin.delete_user(user_id)
+        finally:
+            self.cache.invalidate(user_id)
+
+    def assign_realm_roles(self, user_id: str, roles: Any) -> Any:
+        try:
+            return self.kc_admin.assign_realm_roles(user_id, roles)
+        finally:
+            self.cache.invalidate(user_id)
+
+    def delete_realm_roles_of_user(self, user_id: str, roles: Any) -> Any:
+        try:
+            return self.kc_admin.delete_realm_roles_of_user(user_id, roles)
+        finally:
+            self.cache.invalidate(user_id)
+
+
+class CachingAsyncKeycloakAdmin:
+    """The same over AsyncKeycloakAdmin / BlockingKeycloakAdmin."""
+
+    def __init__(self, kc_admin: Any, cache: KeycloakUserCache):
+        self.kc_admin = kc_admin
+        self.cache = cache
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.kc_admin, name)
+
+    async def get_user(self, user_id: str, user_profile_metadata: bool = False,
+                       timeout: Optional[float] = None) -> dict:
+        user = self.cache.get_user(user_id, user_profile_metadata)
+        if user is None:
+            generation = self.cache.generation(user_id)
+            user = await self.kc_admin.get_user(user_id, user_profile_metadata=user_profile_metadata, timeout=timeout)
+            self.cache.put_user(user_id, user, user_profile_metadata, generation=generation)
+        return user
+
+    async def update_user(self, user_id: str, payload: dict, timeout: Optional[float] = None) -> None:
+        try:
+            await self.kc_admin.update_user(user_id, payload, timeout=timeout)
+        finally:
+            self.cache.invalidate(user_id)
+
+    async def create_user(self, payload: dict, exist_ok: bool = False, timeout: Optional[float] = None) -> str:
+        try:
+            return await self.kc_admin.create_user(payload, exist_ok=exist_ok, timeout=timeout)
+        finally:
+            self.cache.invalidate(payload.get("id"))
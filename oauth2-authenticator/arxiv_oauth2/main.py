@@ -22,15 +22,25 @@ from .authentication import router as authn_router, WellKnownServices
 from .account import router as account_router
 from .captcha import router as captcha_router
 from .keycloak import router as keycloak_router
+from .audit import router as audit_router
 
 from .app_logging import setup_logger
 from .mysql_retry import MySQLRetryMiddleware
-from . import get_db, COOKIE_ENV_NAMES, get_keycloak_admin
+from .blocking_executor import BlockingExecutor, BLOCKING_EXECUTOR
+from arxiv_bizlogic.audit_queue import AdminAuditQueue, ADMIN_AUDIT_QUEUE, AUDIT_MODE_STRICT
+from arxiv_bizlogic.database import DatabaseSession
+from . import get_db, COOKIE_ENV_NAMES, get_keycloak_admin, COOKIE_PARAMS, build_cookie_params, \
+    get_async_keycloak_admin
 from .biz.keycloak_audit import get_keycloak_dispatch_functions
 from arxiv_bizlogic.fastapi_helpers import TapirCookieToUserClaimsMiddleware, COOKIE_ENV_NAMES_TYPE, gatekeep_users, \
     ENABLE_USER_ACCESS_KEY
 
 from .transitional.mock_keycloak_admin import MockKeycloakAdmin
+from .keycloak_admin_async import AsyncKeycloakAdmin, BlockingKeycloakAdmin, AsyncKeycloakAdminProtocol, \
+    CircuitBreaker
+from .keycloak_token_validator import KeycloakTokenValidator
+from .keycloak_user_cache import KeycloakUserCache, CachingKeycloakAdmin, CachingAsyncKeycloakAdmin, \
+    KEYCLOAK_USER_CACHE
 
 origins = [
     "http://localhost",
@@ -121,7 +131,8 @@ def create_app(*args, **kwargs) -> FastAPI:
         CLASSIC_DB_URI = os.environ.get('CLASSIC_DB_URI', "arXiv"),
         LATEXML_DB_URI = None
     )
-    from arxiv_bizlogic.database import Database
+    from arxiv_bizlogic.database import Database, preload_column_charsets
+    from arxiv_bizlogic.email_history import ensure_email_history_table
     database = Database(settings)
     database.set_to_global()
 
@@ -218,6 +229,63 @@ def create_app(*args, **kwargs) -> FastAPI:
         COOKIE_ENV_NAMES.keycloak_refresh_token_env: KEYCLOAK_REFRESH_TOKEN_NAME,
     }
 
+    # Blocking DB / Keycloak calls from async handlers run on this pool.
+    blocking_executor = BlockingExecutor(
+        max_workers=int(os.environ.get("BLOCKING_EXECUTOR_WORKERS", "16")),
+        max_queue=int(os.environ.get("BLOCKING_EXECUTOR_QUEUE", "64")),
+    )
+    logger.info(f"BLOCKING_EXECUTOR: workers={blocking_executor.max_workers}, queue={blocking_executor.max_queue}")
+
+    # Async Keycloak admin for the async handlers - pooled connections, reused admin token, circuit breaker.
+    if keycloak_admin_secret == "<NOT-SET>":
+        keycloak_async_admin = BlockingKeycloakAdmin(keycloak_admin, blocking_executor)
+    else:
+        keycloak_async_admin = AsyncKeycloakAdmin(
+            server_url=KEYCLOAK_SERVER_URL,
+            realm_name=realm_name,
+            username="admin",
+            password=keycloak_admin_secret,
+            user_realm_name="master",
+            client_id="admin-cli",
+            verify=False,
+            timeout=float(os.environ.get("KEYCLOAK_ADMIN_TIMEOUT", "10")),
+            max_connections=int(os.environ.get("KEYCLOAK_ADMIN_POOL_SIZE", "50")),
+        )
+
+    # Keycloak user / realm role representations, per process. Dropped on this app's writes and the Keycloak
+    # events this replica gets - the other replicas keep theirs until KEYCLOAK_USER_CACHE_TTL.
+    keycloak_user_cache = KeycloakUserCache(
+        ttl=float(os.environ.get("KEYCLOAK_USER_CACHE_TTL", "30")),
+        maxsize=int(os.environ.get("KEYCLOAK_USER_CACHE_SIZE", "4096")),
+    )
+    keycloak_admin = CachingKeycloakAdmin(keycloak_admin, keycloak_user_cache)
+    keycloak_async_admin = CachingAsyncKeycloakAdmin(keycloak_async_admin, keycloak_user_cache)
+
+    # Access tokens are checked against the realm JWKS. KEYCLOAK_TOKEN_VALIDATION=introspect asks Keycloak instead.
+    # The issuer is the one of the realm's OIDC discovery document, unless KEYCLOAK_TOKEN_ISSUER says otherwise.
+    # A token from another issuer is refused - there is no introspection fallback for it.
+    keycloak_token_validator = None
+    if os.environ.get("KEYCLOAK_TOKEN_VALIDATION", "local").lower() != "introspect":
+        keycloak_token_validator = KeycloakTokenValidator(
+            server_url=well_known.oidc_url,
+            realm_name=_idp_.realm,
+            client_id=_idp_.client_id,
+            issuer=os.environ.get("KEYCLOAK_TOKEN_ISSUER") or None,
+            verify=OIDC_SERVER_SSL_VERIFY,
+            jwks_ttl=float(os.environ.get("KEYCLOAK_JWKS_TTL", "3600")),
+        )
+    logger.info(f"KEYCLOAK_TOKEN_VALIDATION: {'local' if keycloak_token_validator else 'introspect'}")
+
+    # Admin audit records - "strict" writes them in the request transaction, "write-behind" queues them.
+    admin_audit_queue = AdminAuditQueue(
+        DatabaseSession,
+        mode=os.environ.get("ADMIN_AUDIT_MODE", AUDIT_MODE_STRICT),
+        spool_path=os.environ.get("ADMIN_AUDIT_SPOOL"),
+        max_queue=int(os.environ.get("ADMIN_AUDIT_QUEUE_SIZE", "10000")),
+        batch_size=int(os.environ.get("ADMIN_AUDIT_BATCH_SIZE", "200")),
+    )
+    logger.info(f"ADMIN_AUDIT_MODE: {admin_audit_queue.mode}, spool={admin_audit_queue.spool_path}")
+
     extra_options = {}
     if os.environ.get(ENABLE_USER_ACCESS_KEY):
         extra_options[ENABLE_USER_ACCESS_KEY] = os.environ.get(ENABLE_USER_ACCESS_KEY)
@@ -237,16 +305,24 @@ def create_app(*args, **kwargs) -> FastAPI:
         COOKIE_MAX_AGE=int(os.environ.get('COOKIE_MAX_AGE', '99073266')),
         SESSION_DURATION=SESSION_DURATION,
         KEYCLOAK_ADMIN=keycloak_admin,
+        KEYCLOAK_ASYNC_ADMIN=keycloak_async_admin,
+        KEYCLOAK_USER_CACHE=keycloak_user_cache,
+        KEYCLOAK_TOKEN_VALIDATOR=keycloak_token_validator,
         ARXIV_USER_SECRET=ARXIV_USER_SECRET,
         CAPTCHA_SECRET=os.environ.get("CAPTCHA_SECRET", "foocaptcha"),
         WELL_KNOWN=well_known,
         AAA_API_SECRET_KEY=os.environ.get("AAA_API_SECRET_KEY", ""),
         KEYCLOAK_DISPATCH_FUNCTIONS=get_keycloak_dispatch_functions(),
+        BLOCKING_EXECUTOR=blocking_executor,
+        ADMIN_AUDIT_QUEUE=admin_audit_queue,
         **URLs,
         **cookie_names,
         **extra_options
     )
 
+    # Cookie attributes do not change for the life of app. Freeze them once.
+    app.extra[COOKIE_PARAMS] = build_cookie_params(app.extra)
+
     if CORS_ORIGINS:
         for cors_origin in CORS_ORIGINS.split(","):
             origins.append(cors_origin.strip())
@@ -277,11 +353,23 @@ def create_app(*args, **kwargs) -> FastAPI:
 
     app.add_middleware(TapirCookieToUserClaimsMiddleware)
 
+    app.add_event_handler("shutdown", blocking_executor.shutdown)
+    app.add_event_handler("shutdown", keycloak_async_admin.aclose)
+    if keycloak_token_validator is not None:
+        app.add_event_handler("shutdown", keycloak_token_validator.aclose)
+    app.add_event_handler("startup", admin_audit_queue.start)
+    # Column charsets of the written tables, so the first write after a deploy does not reflect them
+    app.add_event_handler("startup", lambda: preload_column_charsets(database.engine))
+    # The materialized email history (arXiv_email_history) is the app's own table. Without it, the union query.
+    app.add_event_handler("startup", lambda: ensure_email_history_table(database.engine))
+    app.add_event_handler("shutdown", admin_audit_queue.shutdown)
+
     app.include_router(authn_router)
     # app.include_router(authz_router)
     app.include_router(account_router, dependencies=[Depends(gatekeep_users)])
     app.include_router(captcha_router)
     app.include_router(keycloak_router)
+    app.include_router(audit_router)
 
     @app.middleware("http")
     async def apply_response_headers(request: Request, call_next: Callable) -> Response:
@@ -299,13 +387,14 @@ def create_app(*args, **kwargs) -> FastAPI:
 
     @app.get("/status", response_model=dict)
     async def health_check(session: Session = Depends(get_db),
-                           kc_admin: KeycloakAdmin = Depends(get_keycloak_admin)) -> dict | HTTPException:
+                           kc_async_admin: AsyncKeycloakAdminProtocol = Depends(get_async_keycloak_admin)
+                           ) -> dict | HTTPException:
         result = {}
 
         try:
-            keycloak_admin.connection.get_token()
-            token = keycloak_admin.connection.token
-            result.update({"keycloak": "good" if isinstance(token, dict) and token.get('access_token', None) else "bad"})
+            # The admin token is reused while fresh - a probe does not log in to Keycloak every time
+            kc_status = await kc_async_admin.status()
+            result.update({"keycloak": "good" if kc_status["circuit"] != CircuitBreaker.OPEN else "bad"})
         except Exception as exc:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Keycloak: " + str(exc))
 
@@ -330,4 +419,19 @@ def create_app(*args, **kwargs) -> FastAPI:
         except Exception as exc:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="mysql: " + str(exc))
 
+    @app.get("/status/executor", response_model=dict)
+    async def executor_status(request: Request) -> dict:
+        """Queue depth and wait time of the blocking call executor."""
+        return request.app.extra[BLOCKING_EXECUTOR].stats()
+
+    @app.get("/status/keycloak-cache", response_model=dict)
+    async def keycloak_cache_status(request: Request) -> dict:
+        """Keycloak user cache counters."""
+        return request.app.extra[KEYCLOAK_USER_CACHE].stats()
+
+    @app.get("/status/audit", response_model=dict)
+    async def audit_status(request: Request) -> dict:
+        """Admin audit queue and spool counters."""
+        return request.app.extra[ADMIN_AUDIT_QUEUE].stats()
+
     return app
@@ -1,4 +1,3 @@
-import socket
 import logging
 from typing import Tuple, Optional
 
@@ -7,21 +6,28 @@ from arxiv.auth.user_claims_to_legacy import create_tapir_session_from_user_clai
 from arxiv.auth.domain import Session as ArxivSession
 from arxiv.auth.legacy.exceptions import NoSuchUser, SessionCreationFailed
 from sqlalchemy.orm import Session
+from arxiv_bizlogic.reverse_dns import get_reverse_dns_resolver
 
 logger = logging.getLogger(__name__)
 
 def create_tapir_session(
         session: Session,
-        user_claims: ArxivUserClaims, client_ip: str
+        user_claims: ArxivUserClaims, client_ip: str,
+        client_host: Optional[str] = None,
 ) -> Tuple[Optional[str], Optional[ArxivSession]]:
+    """
+    Create a tapir session for the user claims.
+
+    client_host is the reverse DNS of the client IP. Async callers should resolve it up front
+    (get_reverse_dns_resolver().resolve) - if not given, it is looked up here.
+    """
     # legacy cookie
-    client_host = ''
     logger.info("User claims: ip=%s", client_ip)
-    try:
-        client_host = socket.gethostbyaddr(client_ip)[0]
-    except Exception as _exc:
+    if client_host is None:
+        client_host = get_reverse_dns_resolver().resolve_blocking(client_ip)
+    if not client_host:
         logger.info('client host resolve failed for ip %s', client_ip)
-        pass
+        client_host = ''
 
     tapir_cookie = None
     tapir_session = None
@@ -1,3 +1,4 @@
+from types import SimpleNamespace
 from typing import Optional
 
 class MockKCConnection:
@@ -5,10 +6,15 @@ class MockKCConnection:
         self.realm_name = realm_name
         self.headers = {"redirect": ""}
         self.server_url = "http://localhost:8080/auth"
+        self.token = {"access_token": "mock"}
+
+    def get_token(self) -> dict:
+        return self.token
 
     # kc_admin.connection.raw_post(f"admin/realms/{kc_admin.connection.user_realm_name}/users/{user_id}/impersonation", {})  # type: ignore
-    def raw_post(self, url: str, payload: dict) -> dict:
-        return {"headers": {"redirect": "http://localhost:8000/login"}}
+    def raw_post(self, url: str, payload: dict) -> SimpleNamespace:
+        return SimpleNamespace(status_code=200, headers={"redirect": "http://localhost:8000/login"}, content=b"",
+                               json=lambda: {})
 
     #     impersonation_url = impersonation_response.headers.get("redirect")
 
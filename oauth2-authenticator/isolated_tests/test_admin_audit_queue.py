@@ -0,0 +1,172 @@
+import json
+import os
+import tempfile
+import unittest
+from contextlib import contextmanager
+from types import SimpleNamespace
+from unittest import mock
+
+from arxiv.db.models import TapirAdminAudit
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import Session
+
+from arxiv_bizlogic import database
+from arxiv_bizlogic.audit_event import AdminAudit_ChangePassword, admin_audit_row
+from arxiv_bizlogic.audit_queue import AdminAuditQueue, AUDIT_MODE_WRITE_BEHIND, AUDIT_MODE_STRICT
+from arxiv_bizlogic.database import Database, DatabaseSession
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.available = True
+        self.batches = []
+
+    @contextmanager
+    def session(self):
+        yield mock.Mock()
+
+    def insert(self, _session, rows):
+        if not self.available:
+            raise ConnectionError("MySQL server has gone away")
+        self.batches.append(list(rows))
+        return len(rows)
+
+
+def make_event(n: int) -> AdminAudit_ChangePassword:
+    return AdminAudit_ChangePassword("100", str(200 + n), "12345", comment=f"comment {n}")
+
+
+def committed(audit_queue: AdminAuditQueue, events) -> None:
+    """Audits the events in a request that commits"""
+    session = Session()
+    audit_queue.write(session, events)
+    session.commit()
+    session.close()
+
+
+class TestAdminAuditQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.db = FakeDatabase()
+        patcher = mock.patch("arxiv_bizlogic.audit_queue.insert_admin_audit_rows", side_effect=self.db.insert)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.spool_dir.cleanup)
+        self.spool_path = os.path.join(self.spool_dir.name, "audit.spool")
+
+    def test_write_behind_batches(self):
+        audit_queue = AdminAuditQueue(self.db.session, mode=AUDIT_MODE_WRITE_BEHIND, batch_size=10,
+                                      flush_interval=0.01)
+        session = Session()
+        with mock.patch.object(session, "execute") as execute:
+            audit_queue.write(session, [make_event(n) for n in range(25)])
+            self.assertEqual(0, audit_queue.stats()["queued"])
+            session.commit()
+        audit_queue.shutdown()
+        execute.assert_not_called()
+        self.assertEqual(25, sum(len(batch) for batch in self.db.batches))
+        self.assertEqual("comment 0", self.db.batches[0][0]["comment"])
+        self.assertEqual(25, audit_queue.stats()["written"])
+
+    def test_spool_and_replay(self):
+        audit_queue = AdminAuditQueue(self.db.session, mode=AUDIT_MODE_WRITE_BEHIND, spool_path=self.spool_path,
+                                      batch_size=2)
+        self.db.available = False
+        committed(audit_queue, [make_event(n) for n in range(3)])
+        audit_queue.shutdown()
+        with open(self.spool_path, encoding="utf-8") as spool:
+            self.assertEqual(["200", "201", "202"], [str(json.loads(line)["affected_user"]) for line in spool])
+
+        # Still down - the spool is kept
+        self.assertEqual(0, audit_queue.replay_spool())
+        self.assertTrue(os.path.exists(self.spool_path))
+
+        self.db.available = True
+        self.assertEqual(3, audit_queue.replay_spool())
+        self.assertFalse(os.path.exists(self.spool_path))
+        self.assertEqual(3, audit_queue.stats()["replayed"])
+
+    def test_full_queue_spools(self):
+        audit_queue = AdminAuditQueue(self.db.session, mode=AUDIT_MODE_WRITE_BEHIND, spool_path=self.spool_path,
+                                      max_queue=1)
+        committed(audit_queue, [make_event(0), make_event(1)])
+        self.assertEqual(1, audit_queue.stats()["queued"])
+        self.assertEqual(1, audit_queue.stats()["spooled"])
+
+    def test_rollback_drops_records(self):
+        audit_queue = AdminAuditQueue(self.db.session, mode=AUDIT_MODE_WRITE_BEHIND, flush_interval=0.01)
+        engine = create_engine("sqlite://")
+        with Session(engine) as session:
+            session.execute(text("SELECT 1"))
+            audit_queue.write(session, [make_event(0)])
+            session.rollback()
+            # The session goes on, and commits what comes after the rollback only
+            audit_queue.write(session, [make_event(1)])
+            session.commit()
+
+        # Closed without a commit
+        session = Session()
+        audit_queue.write(session, [make_event(2)])
+        session.close()
+        session.commit()
+
+        audit_queue.shutdown()
+        self.assertEqual(["201"], [str(row["affected_user"]) for batch in self.db.batches for row in batch])
+        engine.dispose()
+
+    def test_strict_writes_in_session(self):
+        audit_queue = AdminAuditQueue(self.db.session, mode=AUDIT_MODE_STRICT)
+        session = mock.Mock()
+        with mock.patch("arxiv_bizlogic.audit_queue.admin_audit_events") as admin_audit_events:
+            audit_queue.write(session, [make_event(0)])
+        self.assertIs(session, admin_audit_events.call_args[0][0])
+        self.assertEqual(0, audit_queue.stats()["queued"])
+
+
+class TestAdminAuditQueueDatabase(unittest.TestCase):
+    """The batches through DatabaseSession, into a sqlite tapir_admin_audit"""
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.addCleanup(os.unlink, self.db_path)
+        settings = SimpleNamespace(CLASSIC_DB_URI=f"sqlite:///{self.db_path}", ECHO_SQL=False,
+                                   CLASSIC_DB_TRANSACTION_ISOLATION_LEVEL=None, REQUEST_CONCURRENCY=10,
+                                   POOL_PRE_PING=False, LATEXML_DB_URI=None)
+        self.db = Database(settings)
+        self.addCleanup(self.db.engine.dispose)
+        TapirAdminAudit.__table__.create(self.db.engine)
+        patcher = mock.patch.dict(database.__dict__, {"_DATABASE_INSTANCE_": self.db})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.spool_dir.cleanup)
+        self.spool_path = os.path.join(self.spool_dir.name, "audit.spool")
+
+    def audited_users(self):
+        with Session(self.db.engine) as session:
+            return [str(user_id) for user_id in
+                    session.scalars(select(TapirAdminAudit.affected_user).order_by(TapirAdminAudit.entry_id))]
+
+    def test_flush_commits(self):
+        audit_queue = AdminAuditQueue(DatabaseSession, mode=AUDIT_MODE_WRITE_BEHIND, batch_size=2)
+        committed(audit_queue, [make_event(n) for n in range(3)])
+        audit_queue.shutdown()
+        self.assertEqual(["200", "201", "202"], self.audited_users())
+        self.assertEqual(3, audit_queue.stats()["written"])
+
+    def test_replay_commits(self):
+        audit_queue = AdminAuditQueue(DatabaseSession, mode=AUDIT_MODE_WRITE_BEHIND, spool_path=self.spool_path,
+                                      batch_size=2)
+        # Spooled while the database was down
+        with open(self.spool_path, "w", encoding="utf-8") as spool:
+            for n in range(3):
+                spool.write(json.dumps(admin_audit_row(make_event(n))) + "\n")
+        self.assertEqual(3, audit_queue.replay_spool())
+        self.assertFalse(os.path.exists(self.spool_path))
+        self.assertEqual(["200", "201", "202"], self.audited_users())
+
+
+if __name__ == '__main__':
+    unittest.main()
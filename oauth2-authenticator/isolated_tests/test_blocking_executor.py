@@ -0,0 +1,48 @@
+import asyncio
+import threading
+import unittest
+
+from fastapi import HTTPException
+
+from arxiv_oauth2.blocking_executor import BlockingExecutor
+
+
+class TestBlockingExecutor(unittest.TestCase):
+
+    def test_run(self):
+        executor = BlockingExecutor(max_workers=2, max_queue=2)
+        try:
+            result = asyncio.run(executor.run(lambda a, b=0: a + b, 1, b=2))
+            self.assertEqual(3, result)
+            stats = executor.stats()
+            self.assertEqual(1, stats["submitted"])
+            self.assertEqual(1, stats["completed"])
+            self.assertEqual(0, stats["queued"])
+            self.assertEqual(0, stats["active"])
+        finally:
+            executor.shutdown()
+
+    def test_rejects_when_full(self):
+        executor = BlockingExecutor(max_workers=1, max_queue=1)
+        gate = threading.Event()
+
+        async def scenario():
+            first = asyncio.ensure_future(executor.run(gate.wait))
+            second = asyncio.ensure_future(executor.run(gate.wait))
+            await asyncio.sleep(0.05)
+            with self.assertRaises(HTTPException) as ctx:
+                await executor.run(gate.wait)
+            self.assertEqual(503, ctx.exception.status_code)
+            gate.set()
+            await asyncio.gather(first, second)
+
+        try:
+            asyncio.run(scenario())
+            self.assertEqual(1, executor.stats()["rejected"])
+            self.assertEqual(2, executor.stats()["completed"])
+        finally:
+            executor.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
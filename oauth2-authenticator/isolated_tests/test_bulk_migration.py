@@ -0,0 +1,163 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from arxiv_bizlogic.bizmodels.tapir_to_kc_mapping import AuthResponse
+from keycloak.exceptions import KeycloakConnectionError, KeycloakPostError
+
+from arxiv_oauth2.biz import bulk_migration
+from arxiv_oauth2.biz.bulk_migration import (
+    BulkMigration,
+    MigrationCheckpoint,
+    bulk_migrate,
+    legacy_federation_link,
+    to_kc_import_user,
+)
+
+LEGACY_COMPONENT = {"id": "legacy-component-id", "name": "arXiv Legacy Auth Provider",
+                    "providerId": "User migration using a REST client",
+                    "providerType": "org.keycloak.storage.UserStorageProvider"}
+
+
+class FakePartialImport:
+    """Keycloak's partialImport with ifResourceExists SKIP"""
+
+    def __init__(self, existing=(), refused=(), down_after=None, components=(LEGACY_COMPONENT,)):
+        self.existing = set(existing)
+        self.components = list(components)
+        self.payloads = []
+        self.refused = set(refused)
+        self.down_after = down_after
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def partial_import(self, payload, timeout=None):
+        if self.down_after is not None and len(self.calls) >= self.down_after:
+            raise KeycloakConnectionError("Keycloak circuit breaker is open")
+        ids = [user["id"] for user in payload["users"]]
+        self.calls.append(ids)
+        self.payloads.append(payload)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            # Later batches finish first
+            await asyncio.sleep(0.001 * (10 - len(self.calls) % 10))
+            if self.refused.intersection(ids):
+                raise KeycloakPostError(error_message="Unable to find group", response_code=400)
+            added = [user_id for user_id in ids if user_id not in self.existing]
+            self.existing.update(added)
+            return {"added": len(added), "skipped": len(ids) - len(added), "overwritten": 0}
+        finally:
+            self.in_flight -= 1
+
+    async def get_components(self, query=None, timeout=None):
+        assert query == {"type": "org.keycloak.storage.UserStorageProvider"}
+        return self.components
+
+
+def make_batches(first, last, batch_size):
+    for start in range(first, last + 1, batch_size):
+        end = min(start + batch_size - 1, last)
+        yield end, [{"id": str(user_id)} for user_id in range(start, end + 1)]
+
+
+def make_auth(user_id):
+    return AuthResponse(id=user_id, username=f"user{user_id}", email="user@example.com", firstName="First",
+                        lastName="Last", enabled=True, emailVerified=True,
+                        attributes={"email": ["user@example.com"]},
+                        roles=["AllowTexProduced", "Administrator", "AllowTexProduced"],
+                        groups=["Admin"], requiredActions=[])
+
+
+class TestBulkMigration(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.checkpoint = MigrationCheckpoint(os.path.join(self.temp_dir.name, "checkpoint.json"))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    async def test_migrates_range(self):
+        keycloak = FakePartialImport(existing={"3", "4"})
+        migration = BulkMigration(keycloak, concurrency=3, checkpoint=self.checkpoint)
+        report = await migration.run(make_batches(1, 50, 5), start_user_id=1, end_user_id=50)
+
+        self.assertEqual((report.users, report.added, report.skipped, report.failed), (50, 48, 2, 0))
+        self.assertEqual(report.batches, 10)
+        self.assertEqual(report.last_user_id, 50)
+        self.assertLessEqual(keycloak.max_in_flight, 3)
+        self.assertGreater(keycloak.max_in_flight, 1)
+        self.assertEqual(self.checkpoint.load(), report)
+
+    async def test_refused_batch_is_retried_per_user(self):
+        keycloak = FakePartialImport(refused={"7"})
+        migration = BulkMigration(keycloak, concurrency=2, checkpoint=self.checkpoint)
+        report = await migration.run(make_batches(1, 10, 5), start_user_id=1)
+
+        self.assertEqual((report.added, report.failed), (9, 1))
+        self.assertEqual(report.failed_user_ids, ["7"])
+        self.assertIn(["6"], keycloak.calls)
+
+    async def test_checkpoint_stops_before_unfinished_batch(self):
+        keycloak = FakePartialImport(down_after=3)
+        migration = BulkMigration(keycloak, concurrency=1, checkpoint=self.checkpoint)
+        with self.assertRaises(KeycloakConnectionError):
+            await migration.run(make_batches(1, 50, 5), start_user_id=1)
+
+        with open(self.checkpoint.path, encoding="utf-8") as checkpoint_file:
+            saved = json.load(checkpoint_file)
+        self.assertEqual(saved["last_user_id"], 15)
+        self.assertEqual(saved["users"], 15)
+
+    async def test_users_are_linked_to_legacy_provider(self):
+        def tapir_user_batches(session, federation_link, start_user_id, end_user_id=None, batch_size=200,
+                               include_deleted=False):
+            for last_user_id, users in make_batches(start_user_id, end_user_id, batch_size):
+                yield last_user_id, [to_kc_import_user(make_auth(user["id"]), federation_link) for user in users]
+
+        keycloak = FakePartialImport()
+        with mock.patch.object(bulk_migration, "tapir_user_batches", tapir_user_batches):
+            report = await bulk_migrate(None, keycloak, 1, 10, batch_size=5,
+                                        checkpoint_path=self.checkpoint.path)
+        self.assertEqual(report.added, 10)
+        users = [user for payload in keycloak.payloads for user in payload["users"]]
+        self.assertEqual(len(users), 10)
+        self.assertTrue(all(user["federationLink"] == "legacy-component-id" for user in users))
+
+
+class TestLegacyFederationLink(unittest.IsolatedAsyncioTestCase):
+
+    async def test_component_by_name(self):
+        ldap = {"id": "ldap-component-id", "name": "ldap"}
+        keycloak = FakePartialImport(components=[ldap, LEGACY_COMPONENT])
+        self.assertEqual(await legacy_federation_link(keycloak), "legacy-component-id")
+
+    async def test_only_component(self):
+        keycloak = FakePartialImport(components=[dict(LEGACY_COMPONENT, name="legacy")])
+        self.assertEqual(await legacy_federation_link(keycloak), "legacy-component-id")
+
+    async def test_no_component(self):
+        for components in [[], [{"id": "a", "name": "ldap"}, {"id": "b", "name": "kerberos"}]]:
+            with self.assertRaises(ValueError):
+                await legacy_federation_link(FakePartialImport(components=components))
+
+
+class TestKcImportUser(unittest.TestCase):
+
+    def test_representation(self):
+        user = to_kc_import_user(make_auth("1129053"), "legacy-component-id")
+        self.assertEqual(user["id"], "1129053")
+        # Without it, Keycloak does not ask the legacy provider for the password
+        self.assertEqual(user["federationLink"], "legacy-component-id")
+        self.assertEqual(user["realmRoles"], ["AllowTexProduced", "Administrator"])
+        self.assertEqual(user["groups"], ["/Admin"])
+        self.assertNotIn("credentials", user)
+
+
+if __name__ == '__main__':
+    unittest.main()
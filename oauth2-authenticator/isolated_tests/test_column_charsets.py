@@ -0,0 +1,96 @@
+import threading
+import unittest
+from unittest import mock
+
+from arxiv_bizlogic.database import ColumnCharsetRegistry, get_column_charset_registry, is_column_latin1
+
+DB_URL = "mysql://arxiv@localhost/arXiv"
+
+COLUMNS = [
+    ("tapir_admin_audit", "data", "latin1"),
+    ("tapir_admin_audit", "entry_id", None),
+    ("tapir_users", "first_name", "latin1"),
+    ("arXiv_orcid_ids", "orcid", "utf8mb4"),
+]
+
+
+def make_engine(rows=COLUMNS, dialect="mysql"):
+    engine = mock.MagicMock()
+    engine.dialect.name = dialect
+    engine.url = DB_URL
+    connection = engine.connect.return_value.__enter__.return_value
+    connection.execute.return_value.all.return_value = rows
+    return engine
+
+
+def make_session(dialect="mysql"):
+    session = mock.Mock()
+    session.bind.dialect.name = dialect
+    session.bind.url = DB_URL
+    return session
+
+
+class TestColumnCharsetRegistry(unittest.TestCase):
+
+    def test_preload_is_one_query(self):
+        registry = ColumnCharsetRegistry()
+        engine = make_engine()
+        self.assertEqual(registry.preload(engine, ["tapir_admin_audit", "tapir_users", "arXiv_orcid_ids"]), 4)
+        engine.connect.return_value.__enter__.return_value.execute.assert_called_once()
+
+        session = make_session()
+        with mock.patch("arxiv_bizlogic.database.inspect") as inspect:
+            self.assertEqual(registry.charset(session, "tapir_admin_audit", "data"), "latin1")
+            self.assertEqual(registry.charset(session, "arXiv_orcid_ids", "orcid"), "utf8mb4")
+            self.assertIsNone(registry.charset(session, "tapir_admin_audit", "entry_id"))
+            # Preloaded table, unknown column - still no reflection
+            self.assertIsNone(registry.charset(session, "tapir_users", "no_such_column"))
+            inspect.assert_not_called()
+
+    def test_not_preloaded_table_is_reflected_once(self):
+        registry = ColumnCharsetRegistry()
+        session = make_session()
+        with mock.patch("arxiv_bizlogic.database.inspect") as inspect:
+            inspect.return_value.get_columns.return_value = [
+                {"name": "comment", "type": mock.Mock(charset="latin1")}]
+            self.assertEqual(registry.charset(session, "arXiv_submissions", "comment"), "latin1")
+            self.assertEqual(registry.charset(session, "arXiv_submissions", "comment"), "latin1")
+            inspect.assert_called_once()
+
+    def test_not_mysql(self):
+        registry = ColumnCharsetRegistry()
+        engine = make_engine(dialect="sqlite")
+        self.assertEqual(registry.preload(engine), 0)
+        engine.connect.assert_not_called()
+        self.assertFalse(is_column_latin1(make_session(dialect="sqlite"), "tapir_users", "first_name"))
+
+    def test_concurrent_lookups(self):
+        registry = ColumnCharsetRegistry()
+        session = make_session()
+        results = []
+        with mock.patch("arxiv_bizlogic.database.inspect") as inspect:
+            inspect.return_value.get_columns.return_value = [
+                {"name": "title", "type": mock.Mock(charset="latin1")}]
+            threads = [threading.Thread(target=lambda: results.append(
+                registry.charset(session, "arXiv_metadata", "title"))) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            inspect.assert_called_once()
+        self.assertEqual(results, ["latin1"] * 8)
+
+    def test_is_column_latin1_uses_registry(self):
+        registry = get_column_charset_registry()
+        registry.clear()
+        try:
+            registry.preload(make_engine(), ["tapir_admin_audit", "tapir_users"])
+            session = make_session()
+            self.assertTrue(is_column_latin1(session, "tapir_admin_audit", "data"))
+            self.assertFalse(is_column_latin1(session, "tapir_admin_audit", "entry_id"))
+        finally:
+            registry.clear()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+from fastapi import Response
+
+from arxiv_oauth2 import CookieParams
+
+
+def cookie_attributes(response: Response) -> list:
+    return [set(header.split("; ")) for header in response.headers.getlist("set-cookie")]
+
+
+class TestCookieParams(unittest.TestCase):
+    cparams = CookieParams(
+        auth_session_cookie_name="ARXIVNG_SESSION_ID",
+        classic_cookie_name="tapir_session",
+        keycloak_access_token_name="keycloak_access_token",
+        keycloak_refresh_token_name="keycloak_refresh_token",
+        ng_cookie_name="ARXIVNG_SESSION_ID",
+        domain="arxiv.org",
+        secure=True,
+        samesite="lax",
+        jwt_secret="secret",
+        max_age=3600,
+    )
+
+    def test_set_cookie_matches_starlette(self):
+        expected = Response()
+        expected.set_cookie("tapir_session", "abc.def-ghi", max_age=3600, domain="arxiv.org", path="/",
+                            secure=True, samesite="lax", httponly=True)
+        rendered = Response()
+        self.cparams.set_cookie(rendered, "tapir_session", "abc.def-ghi")
+        self.assertEqual(cookie_attributes(expected), cookie_attributes(rendered))
+
+    def test_value_is_quoted(self):
+        rendered = Response()
+        self.cparams.set_cookie(rendered, "tapir_session", "a b;c")
+        self.assertTrue(rendered.headers["set-cookie"].startswith('tapir_session="a b\\073c"; '))
+
+    def test_delete_cookie(self):
+        rendered = Response()
+        self.cparams.delete_cookie(rendered, "tapir_session")
+        attributes = cookie_attributes(rendered)[0]
+        self.assertIn('tapir_session=""', attributes)
+        self.assertIn("Max-Age=0", attributes)
+        self.assertIn("Domain=arxiv.org", attributes)
+
+    def test_frozen(self):
+        with self.assertRaises(Exception):
+            self.cparams.max_age = 0
+
+
+if __name__ == '__main__':
+    unittest.main()
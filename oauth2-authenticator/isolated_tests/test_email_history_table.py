@@ -0,0 +1,73 @@
+import unittest
+from unittest import mock
+
+from sqlalchemy.exc import OperationalError
+
+from arxiv_bizlogic import email_history
+from arxiv_bizlogic.email_history import append_email_change, backfill_email_history, ensure_email_history_table, \
+    load_email_changes, load_email_changes_many
+
+
+def locked_table(statement):
+    """The table a SELECT ... FOR UPDATE reads, None for any other statement"""
+    if getattr(statement, "_for_update_arg", None) is None:
+        return None
+    return statement.get_final_froms()[0].name
+
+
+class TestEnsureEmailHistoryTable(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, email_history, "_email_history_enabled", email_history._email_history_enabled)
+
+    def test_created(self):
+        with mock.patch.object(email_history, "create_email_history_table") as create:
+            self.assertTrue(ensure_email_history_table(mock.sentinel.engine))
+        create.assert_called_once_with(mock.sentinel.engine)
+
+    def test_no_create_privilege(self):
+        denied = OperationalError("CREATE TABLE", {}, Exception("(1142, 'CREATE command denied')"))
+        with mock.patch.object(email_history, "create_email_history_table", side_effect=denied):
+            self.assertFalse(ensure_email_history_table(mock.sentinel.engine))
+
+        # The record is neither read nor written - the callers use the union query
+        session = mock.Mock()
+        self.assertIsNone(load_email_changes(session, 1))
+        self.assertEqual(load_email_changes_many(session, [1, 2]), {})
+        self.assertFalse(append_email_change(session, 1, (1, "old@example.com", "new@example.com", 0, 1, True, "")))
+        session.execute.assert_not_called()
+
+
+class TestEmailHistoryLocks(unittest.TestCase):
+
+    def test_append_locks_user_before_record(self):
+        session = mock.Mock()
+        session.execute.return_value.scalars.return_value = [1]
+        session.execute.return_value.scalar_one_or_none.return_value = None
+        self.assertFalse(append_email_change(session, 1, (1, "old@example.com", "new@example.com", 0, 1, True, "")))
+        locked = [locked_table(call.args[0]) for call in session.execute.call_args_list]
+        self.assertEqual(locked, ["tapir_users", "arXiv_email_history"])
+
+    def test_backfill_locks_batch_before_union(self):
+        calls = []
+        session = mock.Mock()
+        batches = iter([[1, 2], []])
+
+        def execute(statement):
+            calls.append(("lock", locked_table(statement)))
+            return mock.Mock(scalars=mock.Mock(return_value=next(batches)))
+
+        session.execute.side_effect = execute
+        session.commit.side_effect = lambda: calls.append(("commit", None))
+        with mock.patch.object(email_history, "query_email_changes_many",
+                               side_effect=lambda _, user_ids: calls.append(("union", tuple(user_ids))) or
+                               {user_id: [] for user_id in user_ids}), \
+                mock.patch.object(email_history, "store_email_changes",
+                                  side_effect=lambda _, user_id, __: calls.append(("store", user_id))):
+            self.assertEqual(backfill_email_history(session), (2, 2))
+        self.assertEqual(calls, [("commit", None), ("lock", "tapir_users"), ("union", (1, 2)), ("store", 1),
+                                 ("store", 2), ("commit", None), ("lock", "tapir_users"), ("commit", None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+import asyncio
+import unittest
+
+import httpx
+from types import SimpleNamespace
+
+from keycloak.exceptions import KeycloakConnectionError, KeycloakGetError, KeycloakPostError
+
+from arxiv_oauth2.blocking_executor import BlockingExecutor
+from arxiv_oauth2.keycloak_admin_async import AsyncKeycloakAdmin, BlockingKeycloakAdmin, CircuitBreaker
+
+SERVER = "http://keycloak:8080"
+
+
+class FakeKeycloak:
+    """Just enough of the Keycloak admin REST API"""
+
+    def __init__(self, expires_in: int = 300):
+        self.expires_in = expires_in
+        self.token_requests = []
+        self.requests = []
+        self.down = False
+        self.revoked = set()
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        if self.down:
+            raise httpx.ConnectError("connection refused", request=request)
+        path = request.url.path
+        if path == "/realms/master/protocol/openid-connect/token":
+            form = dict(httpx.QueryParams(request.content.decode()))
+            self.token_requests.append(form["grant_type"])
+            return httpx.Response(200, json={
+                "access_token": f"token-{len(self.token_requests)}", "expires_in": self.expires_in,
+                "refresh_token": "refresh", "refresh_expires_in": 1800})
+
+        self.requests.append((request.method, path))
+        if request.headers["Authorization"].removeprefix("Bearer ") in self.revoked:
+            return httpx.Response(401)
+        if path == "/admin/realms/arxiv/users/1" and request.method == "GET":
+            return httpx.Response(200, json={"id": "1", "username": "user0001"})
+        if path == "/admin/realms/arxiv/users" and request.method == "POST":
+            return httpx.Response(201, headers={"Location": f"{SERVER}/admin/realms/arxiv/users/42"})
+        if path == "/admin/realms/arxiv/users/1/impersonation":
+            return httpx.Response(200, json={"sameRealm": True, "redirect": "http://localhost/account"})
+        if path == "/admin/realms/arxiv/users/2/impersonation":
+            return httpx.Response(200, headers={"redirect": "http://localhost/account"})
+        if path == "/admin/realms/arxiv/users/1" and request.method == "PUT":
+            return httpx.Response(204)
+        return httpx.Response(404, json={"error": "User not found"})
+
+
+def make_admin(keycloak: FakeKeycloak, **kwargs) -> AsyncKeycloakAdmin:
+    return AsyncKeycloakAdmin(SERVER, "arxiv", "admin", "secret",
+                              transport=httpx.MockTransport(keycloak.handler), **kwargs)
+
+
+class TestAsyncKeycloakAdmin(unittest.IsolatedAsyncioTestCase):
+
+    async def test_token_is_reused(self):
+        keycloak = FakeKeycloak()
+        admin = make_admin(keycloak)
+        for _ in range(5):
+            self.assertEqual((await admin.get_user("1"))["username"], "user0001")
+        self.assertEqual(keycloak.token_requests, ["password"])
+        await admin.aclose()
+
+    async def test_token_refreshed_before_expiry(self):
+        keycloak = FakeKeycloak(expires_in=20)
+        admin = make_admin(keycloak, token_refresh_margin=30)
+        await admin.get_user("1")
+        await admin.get_user("1")
+        # Inside the margin on every call - refreshed with the refresh token
+        self.assertEqual(keycloak.token_requests, ["password", "refresh_token"])
+        await admin.aclose()
+
+    async def test_revoked_token_is_replaced(self):
+        keycloak = FakeKeycloak()
+        admin = make_admin(keycloak)
+        await admin.get_user("1")
+        keycloak.revoked.add("token-1")
+        self.assertEqual((await admin.get_user("1"))["id"], "1")
+        self.assertEqual(len(keycloak.token_requests), 2)
+        await admin.aclose()
+
+    async def test_errors_are_python_keycloak_errors(self):
+        admin = make_admin(FakeKeycloak())
+        with self.assertRaises(KeycloakGetError) as raised:
+            await admin.get_user("999")
+        self.assertEqual(raised.exception.response_code, 404)
+        self.assertIn("User not found", str(raised.exception))
+        await admin.aclose()
+
+    async def test_operations(self):
+        keycloak = FakeKeycloak()
+        admin = make_admin(keycloak)
+        self.assertEqual(await admin.create_user({"username": "new"}), "42")
+        self.assertEqual(await admin.impersonate("1"), "http://localhost/account")
+        await admin.update_user("1", {"firstName": "First"})
+        self.assertIn(("PUT", "/admin/realms/arxiv/users/1"), keycloak.requests)
+        await admin.aclose()
+
+    async def test_circuit_breaker(self):
+        now = [0.0]
+        keycloak = FakeKeycloak()
+        admin = make_admin(keycloak, circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=10,
+                                                                    clock=lambda: now[0]))
+        await admin.get_user("1")
+        keycloak.down = True
+        for _ in range(2):
+            with self.assertRaises(KeycloakConnectionError):
+                await admin.get_user("1")
+        self.assertEqual(admin.circuit_breaker.state, CircuitBreaker.OPEN)
+
+        # Fails fast - Keycloak is not called
+        keycloak.down = False
+        calls = len(keycloak.requests)
+        with self.assertRaises(KeycloakConnectionError):
+            await admin.get_user("1")
+        self.assertEqual(len(keycloak.requests), calls)
+
+        now[0] = 11.0
+        self.assertEqual(admin.circuit_breaker.state, CircuitBreaker.HALF_OPEN)
+        await admin.get_user("1")
+        self.assertEqual(admin.circuit_breaker.state, CircuitBreaker.CLOSED)
+        await admin.aclose()
+
+    async def test_cancelled_trial_releases_the_breaker(self):
+        now = [0.0]
+        keycloak = FakeKeycloak()
+        admin = make_admin(keycloak, circuit_breaker=CircuitBreaker(failure_threshold=1, reset_timeout=10,
+                                                                    clock=lambda: now[0]))
+        await admin.get_user("1")
+        keycloak.down = True
+        with self.assertRaises(KeycloakConnectionError):
+            await admin.get_user("1")
+        keycloak.down = False
+        now[0] = 11.0
+
+        # The half open trial is cancelled while it waits for Keycloak
+        started = asyncio.Event()
+
+        async def slow_send(*args, **kwargs):
+            started.set()
+            await asyncio.sleep(10)
+
+        admin._send = slow_send
+        trial = asyncio.create_task(admin.get_user("1"))
+        await started.wait()
+        with self.assertRaises(KeycloakConnectionError):
+            await admin.get_user("1")
+        trial.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await trial
+
+        # The next call is the trial
+        del admin._send
+        self.assertEqual((await admin.get_user("1"))["id"], "1")
+        self.assertEqual(admin.circuit_breaker.state, CircuitBreaker.CLOSED)
+        await admin.aclose()
+
+
+class TestBlockingKeycloakAdmin(unittest.IsolatedAsyncioTestCase):
+
+    def make_blocking_admin(self, keycloak: FakeKeycloak) -> BlockingKeycloakAdmin:
+        def raw_post(path, data):
+            request = httpx.Request("POST", f"{SERVER}/{path}", headers={"Authorization": "Bearer admin"}, json=data)
+            return keycloak.handler(request)
+
+        executor = BlockingExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        kc_admin = SimpleNamespace(connection=SimpleNamespace(realm_name="arxiv", raw_post=raw_post))
+        return BlockingKeycloakAdmin(kc_admin, executor)
+
+    async def test_impersonate_same_as_async(self):
+        keycloak = FakeKeycloak()
+        blocking = self.make_blocking_admin(keycloak)
+        admin = make_admin(keycloak)
+        # The redirect in the body, and in the header
+        for user_id in ("1", "2"):
+            self.assertEqual(await blocking.impersonate(user_id), "http://localhost/account")
+            self.assertEqual(await admin.impersonate(user_id), "http://localhost/account")
+
+        for client in (blocking, admin):
+            with self.assertRaises(KeycloakPostError) as raised:
+                await client.impersonate("999")
+            self.assertEqual(raised.exception.response_code, 404)
+        await admin.aclose()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import time
+import unittest
+from unittest import mock
+
+import httpx
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from arxiv_oauth2.biz.account_biz import kc_verify_access_token
+from arxiv_oauth2.keycloak_token_validator import KeycloakTokenValidator, JWKSUnavailable
+
+SERVER = "http://keycloak:8080"
+ISSUER = f"{SERVER}/realms/arxiv"
+
+
+def make_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+class FakeRealm:
+    """The realm keys, and the certs endpoint"""
+
+    def __init__(self, issuer=ISSUER):
+        self.keys = {"key-1": make_key()}
+        self.issuer = issuer
+        self.fetches = 0
+        self.discoveries = 0
+        self.down = False
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/realms/arxiv/.well-known/openid-configuration":
+            self.discoveries += 1
+            if self.down:
+                return httpx.Response(503)
+            return httpx.Response(200, json={"issuer": self.issuer,
+                                             "jwks_uri": f"{self.issuer}/protocol/openid-connect/certs"})
+        assert request.url.path == "/realms/arxiv/protocol/openid-connect/certs"
+        self.fetches += 1
+        # Slow enough for the callers to pile up
+        await asyncio.sleep(0.01)
+        if self.down:
+            return httpx.Response(503)
+        keys = []
+        for kid, key in self.keys.items():
+            jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(key.public_key()))
+            keys.append(dict(jwk, kid=kid, use="sig", alg="RS256"))
+        # Not for signatures
+        keys.append(dict(keys[0], kid="enc-1", use="enc", alg="RSA-OAEP"))
+        return httpx.Response(200, json={"keys": keys})
+
+    def token(self, kid="key-1", **claims):
+        now = int(time.time())
+        payload = {"iss": self.issuer, "aud": "account", "azp": "arxiv-user", "typ": "Bearer", "sub": "1129053",
+                   "iat": now, "exp": now + 300}
+        payload.update(claims)
+        return jwt.encode(payload, self.keys[kid], algorithm="RS256", headers={"kid": kid})
+
+
+class TestKeycloakTokenValidator(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.now = [1000.0]
+        self.realm = FakeRealm()
+        self.validator = KeycloakTokenValidator(SERVER, "arxiv", "arxiv-user", min_refresh_interval=30,
+                                                transport=httpx.MockTransport(self.realm.handler),
+                                                clock=lambda: self.now[0])
+
+    async def asyncTearDown(self):
+        await self.validator.aclose()
+
+    async def test_valid_token(self):
+        for _ in range(3):
+            claims = await self.validator.validate(self.realm.token())
+            self.assertEqual(claims["sub"], "1129053")
+        self.assertEqual(self.realm.fetches, 1)
+
+    async def test_single_flight(self):
+        tokens = [self.realm.token() for _ in range(10)]
+        await asyncio.gather(*[self.validator.validate(token) for token in tokens])
+        self.assertEqual(self.realm.fetches, 1)
+        self.assertEqual(self.realm.discoveries, 1)
+
+    async def test_issuer_from_discovery(self):
+        # Keycloak behind its frontend URL
+        realm = FakeRealm(issuer="https://auth.arxiv.org/realms/arxiv")
+        validator = KeycloakTokenValidator(SERVER, "arxiv", "arxiv-user", transport=httpx.MockTransport(realm.handler))
+        self.assertEqual((await validator.validate(realm.token()))["iss"], "https://auth.arxiv.org/realms/arxiv")
+        with self.assertRaises(jwt.InvalidIssuerError):
+            await validator.validate(realm.token(iss=ISSUER))
+        await validator.aclose()
+
+        # Configured - not asked
+        realm = FakeRealm()
+        validator = KeycloakTokenValidator(SERVER, "arxiv", "arxiv-user", issuer=ISSUER,
+                                           transport=httpx.MockTransport(realm.handler))
+        await validator.validate(realm.token())
+        self.assertEqual(realm.discoveries, 0)
+        await validator.aclose()
+
+    async def test_invalid_tokens(self):
+        other_realm = FakeRealm()
+        for token in [
+            self.realm.token(exp=int(time.time()) - 120),
+            self.realm.token(iss=f"{SERVER}/realms/master"),
+            self.realm.token(aud="other", azp="other"),
+            self.realm.token(typ="ID"),
+            other_realm.token(),
+            "not-a-token",
+        ]:
+            with self.assertRaises(jwt.InvalidTokenError):
+                await self.validator.validate(token)
+
+    async def test_key_rotation(self):
+        await self.validator.validate(self.realm.token())
+        self.realm.keys["key-2"] = make_key()
+        # Within min_refresh_interval of the last fetch, an unknown key id does not fetch
+        with self.assertRaises(jwt.InvalidTokenError):
+            await self.validator.validate(self.realm.token(kid="key-2"))
+        self.assertEqual(self.realm.fetches, 1)
+
+        self.now[0] += 31
+        await self.validator.validate(self.realm.token(kid="key-2"))
+        self.assertEqual(self.realm.fetches, 2)
+
+    async def test_keys_kept_when_keycloak_is_down(self):
+        await self.validator.validate(self.realm.token())
+        self.realm.down = True
+        self.now[0] += 3601
+        await self.validator.validate(self.realm.token())
+
+        self.realm.keys["key-2"] = make_key()
+        with self.assertRaises(JWKSUnavailable):
+            await self.validator.validate(self.realm.token(kid="key-2"))
+
+
+class TestKcVerifyAccessToken(unittest.IsolatedAsyncioTestCase):
+
+    async def test_introspection_fallback(self):
+        realm = FakeRealm()
+        realm.down = True
+        validator = KeycloakTokenValidator(SERVER, "arxiv", "arxiv-user", transport=httpx.MockTransport(realm.handler))
+        with mock.patch("arxiv_oauth2.biz.account_biz.kc_validate_access_token", return_value=True) as introspect:
+            self.assertTrue(await kc_verify_access_token(validator, None, None, realm.token()))
+            introspect.assert_awaited_once()
+
+            # Keys at hand - a bad token is refused without asking Keycloak
+            realm.down = False
+            validator._retry_after = 0.0
+            introspect.reset_mock()
+            self.assertFalse(await kc_verify_access_token(validator, None, None, realm.token(typ="ID")))
+            introspect.assert_not_awaited()
+            # Nor for the wrong issuer
+            self.assertFalse(await kc_verify_access_token(validator, None, None,
+                                                          realm.token(iss=f"{SERVER}/realms/master")))
+            introspect.assert_not_awaited()
+        await validator.aclose()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import unittest
+from unittest import mock
+
+from arxiv_oauth2.keycloak_user_cache import (
+    KeycloakUserCache,
+    CachingKeycloakAdmin,
+    CachingAsyncKeycloakAdmin,
+    invalidate_keycloak_event,
+)
+
+
+def make_kc_admin():
+    kc_admin = mock.Mock()
+    kc_admin.get_user.side_effect = lambda user_id, user_profile_metadata=False: \
+        {"id": user_id, "attributes": {}, "metadata": user_profile_metadata}
+    kc_admin.get_realm_roles_of_user.return_value = [{"name": "Public"}]
+    return kc_admin
+
+
+class TestCachingKeycloakAdmin(unittest.TestCase):
+
+    def test_read_through(self):
+        kc_admin = make_kc_admin()
+        admin = CachingKeycloakAdmin(kc_admin, KeycloakUserCache())
+        for _ in range(3):
+            self.assertEqual(admin.get_user("1")["id"], "1")
+            self.assertEqual(admin.get_realm_roles_of_user("1"), [{"name": "Public"}])
+        self.assertEqual(kc_admin.get_user.call_count, 1)
+        self.assertEqual(kc_admin.get_realm_roles_of_user.call_count, 1)
+
+        # With the profile metadata is another representation
+        self.assertTrue(admin.get_user("1", user_profile_metadata=True)["metadata"])
+        self.assertEqual(kc_admin.get_user.call_count, 2)
+
+    def test_returns_copies(self):
+        admin = CachingKeycloakAdmin(make_kc_admin(), KeycloakUserCache())
+        admin.get_user("1")["attributes"]["changed"] = True
+        self.assertEqual(admin.get_user("1")["attributes"], {})
+
+    def test_writes_invalidate(self):
+        kc_admin = make_kc_admin()
+        admin = CachingKeycloakAdmin(kc_admin, KeycloakUserCache())
+        admin.get_user("1")
+        admin.update_user(user_id="1", payload={"firstName": "New"})
+        admin.get_user("1")
+        admin.assign_realm_roles("1", [{"name": "Administrator"}])
+        admin.get_user("1")
+        self.assertEqual(kc_admin.get_user.call_count, 3)
+        kc_admin.update_user.assert_called_once_with("1", {"firstName": "New"})
+
+    def test_read_racing_a_write_is_not_cached(self):
+        kc_admin = make_kc_admin()
+        cache = KeycloakUserCache()
+        admin = CachingKeycloakAdmin(kc_admin, cache)
+
+        def stale_read(user_id, user_profile_metadata=False):
+            # The update lands while the old representation is on its way back
+            admin.update_user(user_id=user_id, payload={"firstName": "New"})
+            return {"id": user_id, "firstName": "Old"}
+
+        kc_admin.get_user.side_effect = stale_read
+        self.assertEqual(admin.get_user("1")["firstName"], "Old")
+        self.assertIsNone(cache.get_user("1"))
+
+        # Reads after the write cache again
+        kc_admin.get_user.side_effect = lambda user_id, user_profile_metadata=False: {"id": user_id,
+                                                                                       "firstName": "New"}
+        admin.get_user("1")
+        self.assertEqual(cache.get_user("1")["firstName"], "New")
+
+    def test_not_found_is_not_cached(self):
+        kc_admin = make_kc_admin()
+        kc_admin.get_user.side_effect = KeyError("User not found")
+        admin = CachingKeycloakAdmin(kc_admin, KeycloakUserCache())
+        for _ in range(2):
+            with self.assertRaises(KeyError):
+                admin.get_user("1")
+        self.assertEqual(kc_admin.get_user.call_count, 2)
+
+    def test_other_calls_pass_through(self):
+        kc_admin = make_kc_admin()
+        admin = CachingKeycloakAdmin(kc_admin, KeycloakUserCache())
+        admin.set_user_password("1", "password", temporary=False)
+        kc_admin.set_user_password.assert_called_once_with("1", "password", temporary=False)
+
+
+class TestKeycloakEventInvalidation(unittest.TestCase):
+
+    def setUp(self):
+        self.kc_admin = make_kc_admin()
+        self.cache = KeycloakUserCache()
+        self.admin = CachingKeycloakAdmin(self.kc_admin, self.cache)
+        self.admin.get_user("1212")
+        self.admin.get_realm_roles_of_user("1212")
+
+    def assert_refetched(self):
+        self.admin.get_user("1212")
+        self.admin.get_realm_roles_of_user("1212")
+        self.assertEqual(self.kc_admin.get_user.call_count, 2)
+        self.assertEqual(self.kc_admin.get_realm_roles_of_user.call_count, 2)
+
+    def test_user_update(self):
+        user_id = invalidate_keycloak_event(self.cache, {
+            "realmName": "arxiv", "resourceType": "USER", "operationType": "UPDATE", "resourcePath": "users/1212"})
+        self.assertEqual(user_id, "1212")
+        self.assert_refetched()
+
+    def test_realm_role_mapping(self):
+        invalidate_keycloak_event(self.cache, {
+            "realmName": "arxiv", "resourceType": "REALM_ROLE_MAPPING", "operationType": "DELETE",
+            "resourcePath": "users/1212/role-mappings/realm"})
+        self.assert_refetched()
+
+    def test_login_and_other_realms_keep_entries(self):
+        invalidate_keycloak_event(self.cache, {"realmName": "arxiv", "type": "LOGIN", "userId": "1212"})
+        invalidate_keycloak_event(self.cache, {"realmName": "master", "resourcePath": "users/1212"})
+        self.admin.get_user("1212")
+        self.assertEqual(self.kc_admin.get_user.call_count, 1)
+
+
+class TestCachingAsyncKeycloakAdmin(unittest.IsolatedAsyncioTestCase):
+
+    async def test_read_through(self):
+        kc_admin = mock.AsyncMock()
+        kc_admin.get_user.return_value = {"id": "1"}
+        admin = CachingAsyncKeycloakAdmin(kc_admin, KeycloakUserCache())
+        await admin.get_user("1", user_profile_metadata=True)
+        await admin.get_user("1", user_profile_metadata=True)
+        self.assertEqual(kc_admin.get_user.await_count, 1)
+        await admin.update_user("1", {"email": "new@example.com"})
+        await admin.get_user("1", user_profile_metadata=True)
+        self.assertEqual(kc_admin.get_user.await_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
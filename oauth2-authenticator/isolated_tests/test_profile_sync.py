@@ -0,0 +1,111 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from keycloak.exceptions import KeycloakPutError
+
+from arxiv_oauth2.biz.profile_sync import (
+    ProfileSyncTags,
+    is_profile_sync_echo,
+    kc_profile,
+    kc_profile_diff,
+    known_kc_profile,
+    sync_kc_profile,
+)
+from arxiv_oauth2.keycloak_user_cache import KeycloakUserCache
+
+
+def make_user(first_name="First", last_name="Last", suffix_name=None):
+    return SimpleNamespace(id=1212, username="User0001", email="user@example.com",
+                           first_name=first_name, last_name=last_name, suffix_name=suffix_name)
+
+
+class TestProfileSync(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.kc_admin = mock.AsyncMock()
+        self.tags = ProfileSyncTags()
+
+    def test_diff(self):
+        self.assertEqual(kc_profile_diff({"firstName": "A", "lastName": "B"}, {"firstName": "A", "lastName": "C"}),
+                         {"lastName": "B"})
+        self.assertEqual(kc_profile_diff({"firstName": "A", "lastName": ""}, {"firstName": "A", "lastName": None}),
+                         {})
+        # Not known - written
+        self.assertEqual(kc_profile_diff({"firstName": "A", "lastName": "B"}, {"firstName": "A"}), {"lastName": "B"})
+
+    async def test_tapir_only_change_is_not_sent(self):
+        before = make_user()
+        after = make_user(suffix_name="Jr.")
+        changes = await sync_kc_profile(self.kc_admin, "1212", kc_profile(after), kc_profile(before),
+                                        tags=self.tags)
+        self.assertEqual(changes, {})
+        self.kc_admin.update_user.assert_not_called()
+
+    async def test_only_changed_fields_are_sent(self):
+        changes = await sync_kc_profile(self.kc_admin, "1212", kc_profile(make_user(last_name="New")),
+                                        kc_profile(make_user()), tags=self.tags)
+        self.assertEqual(changes, {"lastName": "New"})
+        self.kc_admin.update_user.assert_called_once_with(user_id="1212", payload={"lastName": "New"})
+
+    def test_known_profile(self):
+        cache = KeycloakUserCache()
+        self.assertEqual(known_kc_profile(cache, "1212", make_user()), {"firstName": "First", "lastName": "Last"})
+        self.assertEqual(known_kc_profile(None, "1212", make_user()), {"firstName": "First", "lastName": "Last"})
+        # Keycloak leaves out the empty last name
+        cache.put_user("1212", {"id": "1212", "firstName": "First"})
+        self.assertEqual(known_kc_profile(cache, "1212", make_user(last_name="")), {"firstName": "First",
+                                                                                   "lastName": ""})
+        # Changed in Keycloak since - the cache and Tapir disagree
+        cache.put_user("1212", {"id": "1212", "firstName": "Cached", "lastName": "Last"})
+        self.assertEqual(known_kc_profile(cache, "1212", make_user()), {"lastName": "Last"})
+
+    async def test_stale_cache_does_not_skip_write(self):
+        # The cache has the new name from an earlier write, but Keycloak was changed since
+        cache = KeycloakUserCache()
+        cache.put_user("1212", {"id": "1212", "firstName": "New", "lastName": "Last"})
+        known = known_kc_profile(cache, "1212", make_user(first_name="Old"))
+        changes = await sync_kc_profile(self.kc_admin, "1212", kc_profile(make_user(first_name="New")), known,
+                                        tags=self.tags)
+        self.assertEqual(changes, {"firstName": "New"})
+        self.kc_admin.update_user.assert_called_once_with(user_id="1212", payload={"firstName": "New"})
+
+        # Both agree on the new value - nothing to write
+        self.kc_admin.reset_mock()
+        known = known_kc_profile(cache, "1212", make_user(first_name="New"))
+        self.assertEqual(await sync_kc_profile(self.kc_admin, "1212", kc_profile(make_user(first_name="New")),
+                                               known, tags=self.tags), {})
+        self.kc_admin.update_user.assert_not_called()
+
+    async def test_echo_is_dropped_once(self):
+        session = mock.Mock()
+        await sync_kc_profile(self.kc_admin, "1212", {"firstName": "New", "lastName": "Last"},
+                              {"firstName": "Old", "lastName": "Last"}, tags=self.tags)
+        self.assertTrue(is_profile_sync_echo(session, "1212", {"firstName": "New"}, tags=self.tags))
+
+        # The same change again is not tagged - nor is a different user or a different change
+        with mock.patch("arxiv_oauth2.biz.profile_sync.UserModel.one_user", return_value=make_user()):
+            self.assertFalse(is_profile_sync_echo(session, "1212", {"firstName": "New"}, tags=self.tags))
+            self.assertFalse(is_profile_sync_echo(session, "1213", {"firstName": "New"}, tags=self.tags))
+
+    async def test_failed_write_is_not_tagged(self):
+        self.kc_admin.update_user.side_effect = KeycloakPutError(error_message="down", response_code=500)
+        with self.assertRaises(KeycloakPutError):
+            await sync_kc_profile(self.kc_admin, "1212", {"firstName": "New"}, {"firstName": "Old"},
+                                  tags=self.tags)
+        self.assertFalse(self.tags.is_echo("1212", {"firstName": "New"}))
+
+    def test_echo_on_other_replica_matches_tapir(self):
+        session = mock.Mock()
+        with mock.patch("arxiv_oauth2.biz.profile_sync.UserModel.one_user", return_value=make_user()) as one_user:
+            self.assertTrue(is_profile_sync_echo(session, "1212", {"firstName": "First", "username": "user0001"},
+                                                 tags=self.tags))
+            self.assertFalse(is_profile_sync_echo(session, "1212", {"firstName": "Other"}, tags=self.tags))
+            # Not something Tapir mirrors - not an echo, and no need to look
+            one_user.reset_mock()
+            self.assertFalse(is_profile_sync_echo(session, "1212", {"enabled": False}, tags=self.tags))
+            one_user.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import asyncio
+import socket
+import threading
+import unittest
+from unittest import mock
+
+from arxiv_bizlogic.reverse_dns import ReverseDNSResolver
+
+
+class TestReverseDNSResolver(unittest.TestCase):
+
+    def test_resolve_and_cache(self):
+        resolver = ReverseDNSResolver()
+        with mock.patch("socket.gethostbyaddr", return_value=("host.example.com", [], ["10.0.0.1"])) as lookup:
+            self.assertEqual("host.example.com", asyncio.run(resolver.resolve("10.0.0.1")))
+            self.assertEqual("host.example.com", asyncio.run(resolver.resolve("10.0.0.1")))
+            self.assertEqual("host.example.com", resolver.resolve_blocking("10.0.0.1"))
+            self.assertEqual(1, lookup.call_count)
+
+    def test_negative_cache(self):
+        resolver = ReverseDNSResolver()
+        with mock.patch("socket.gethostbyaddr", side_effect=socket.herror("unknown host")) as lookup:
+            self.assertIsNone(asyncio.run(resolver.resolve("10.0.0.2")))
+            self.assertIsNone(resolver.resolve_blocking("10.0.0.2"))
+            self.assertEqual(1, lookup.call_count)
+            self.assertEqual("", resolver.cached("10.0.0.2"))
+
+    def test_coalescing_and_timeout(self):
+        resolver = ReverseDNSResolver(timeout=0.05)
+        gate = threading.Event()
+
+        def slow_lookup(ip):
+            gate.wait(2)
+            return ("slow.example.com", [], [ip])
+
+        async def scenario():
+            results = await asyncio.gather(*[resolver.resolve("10.0.0.3") for _ in range(5)])
+            gate.set()
+            return results
+
+        with mock.patch("socket.gethostbyaddr", side_effect=slow_lookup) as lookup:
+            self.assertEqual([None] * 5, asyncio.run(scenario()))
+            resolver._pool.shutdown(wait=True)
+            self.assertEqual(1, lookup.call_count)
+            self.assertEqual(4, resolver.coalesced)
+            self.assertEqual("slow.example.com", resolver.cached("10.0.0.3"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+from datetime import datetime, timedelta, UTC
+from types import SimpleNamespace
+from unittest import mock
+
+from arxiv.auth.legacy.exceptions import SessionExpired
+
+from arxiv_bizlogic.bizmodels import tapir_to_user_claims
+from arxiv_bizlogic.bizmodels.tapir_to_user_claims import (
+    TAPIR_SESSION_CLAIMS_MAX_TTL,
+    cache_user_claims_from_tapir_cookie,
+    get_cached_user_claims_from_tapir_cookie,
+    invalidate_tapir_session_claims,
+)
+from arxiv_bizlogic.ttl_cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = datetime.now(tz=UTC).timestamp()
+
+    def __call__(self) -> float:
+        return self.now
+
+
+# What unpack gives for each cookie - (session id, user id, ip, issued at, expires at, capabilities)
+COOKIES = {
+    "cookie-1": ("100", "1", "127.0.0.1", datetime.now(tz=UTC), datetime.now(tz=UTC) + timedelta(days=1), "6"),
+    "cookie-1-reissued": ("100", "1", "127.0.0.1", datetime.now(tz=UTC), datetime.now(tz=UTC) + timedelta(days=1), "6"),
+    "cookie-short": ("200", "2", "127.0.0.1", datetime.now(tz=UTC), datetime.now(tz=UTC) + timedelta(seconds=60), "6"),
+    "cookie-expired": ("300", "3", "127.0.0.1", datetime.now(tz=UTC) - timedelta(days=2),
+                       datetime.now(tz=UTC) - timedelta(days=1), "6"),
+}
+
+
+class TestTapirSessionClaimsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TTLCache(maxsize=16, default_ttl=TAPIR_SESSION_CLAIMS_MAX_TTL, clock=self.clock)
+        patches = [
+            mock.patch.object(tapir_to_user_claims, "TAPIR_SESSION_CLAIMS_CACHE", self.cache),
+            mock.patch.object(tapir_to_user_claims, "unpack", side_effect=lambda cookie: COOKIES[cookie]),
+            mock.patch.object(tapir_to_user_claims, "time", SimpleNamespace(time=self.clock)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(get_cached_user_claims_from_tapir_cookie("cookie-1"))
+        cache_user_claims_from_tapir_cookie("cookie-1", mock.sentinel.claims)
+        self.assertIs(get_cached_user_claims_from_tapir_cookie("cookie-1"), mock.sentinel.claims)
+        # Same session, another cookie - not the cached claims
+        self.assertIsNone(get_cached_user_claims_from_tapir_cookie("cookie-1-reissued"))
+
+    def test_max_ttl_cap(self):
+        cache_user_claims_from_tapir_cookie("cookie-1", mock.sentinel.claims)
+        self.clock.now += TAPIR_SESSION_CLAIMS_MAX_TTL - 1
+        self.assertIs(get_cached_user_claims_from_tapir_cookie("cookie-1"), mock.sentinel.claims)
+        # The cookie is good for a day, the entry is not
+        self.clock.now += 2
+        self.assertIsNone(get_cached_user_claims_from_tapir_cookie("cookie-1"))
+
+    def test_cookie_expiry_before_cap(self):
+        cache_user_claims_from_tapir_cookie("cookie-short", mock.sentinel.claims)
+        self.clock.now += 61
+        self.assertIsNone(self.cache.get("200"))
+
+    def test_expired_cookie(self):
+        with self.assertRaises(SessionExpired):
+            get_cached_user_claims_from_tapir_cookie("cookie-expired")
+
+    def test_logout_invalidates(self):
+        cache_user_claims_from_tapir_cookie("cookie-1", mock.sentinel.claims)
+        invalidate_tapir_session_claims("cookie-1")
+        self.assertIsNone(get_cached_user_claims_from_tapir_cookie("cookie-1"))
+
+    def test_bad_cookie_is_a_miss(self):
+        with mock.patch.object(tapir_to_user_claims, "unpack", side_effect=ValueError("bad cookie")):
+            cache_user_claims_from_tapir_cookie("garbage", mock.sentinel.claims)
+            self.assertIsNone(get_cached_user_claims_from_tapir_cookie("garbage"))
+            invalidate_tapir_session_claims("garbage")
+        self.assertEqual(len(self.cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+from arxiv_bizlogic.ttl_cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_hit_and_miss(self):
+        cache = TTLCache(maxsize=4, clock=FakeClock())
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", 1)
+        self.assertEqual(1, cache.get("a"))
+        self.assertEqual({"size": 1, "maxsize": 4, "hits": 1, "misses": 1, "evictions": 0}, cache.stats())
+
+    def test_expiry(self):
+        clock = FakeClock()
+        cache = TTLCache(maxsize=4, clock=clock)
+        cache.put("a", 1, expires_at=clock.now + 10)
+        cache.put("stale", 2, expires_at=clock.now - 1)
+        self.assertIsNone(cache.get("stale"))
+        clock.now += 10
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(0, len(cache))
+
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, clock=FakeClock())
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(1, cache.get("a"))
+        self.assertEqual(3, cache.get("c"))
+        self.assertEqual(1, cache.stats()["evictions"])
+
+    def test_invalidate(self):
+        cache = TTLCache(maxsize=2, clock=FakeClock())
+        cache.put("a", 1)
+        self.assertTrue(cache.invalidate("a"))
+        self.assertFalse(cache.invalidate("a"))
+        self.assertIsNone(cache.get("a"))
+
+
+if __name__ == '__main__':
+    unittest.main()
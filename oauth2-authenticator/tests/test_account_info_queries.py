@@ -0,0 +1,58 @@
+"""
+Statement counts of the account info read path.
+
+/account/current and /account/{id}/profile call get_account_info on every poll of the account UI.
+"""
+from contextlib import contextmanager
+
+from arxiv.db.models import TapirUser
+from sqlalchemy import event
+
+from arxiv_oauth2.biz.account_biz import get_account_info, get_account_info_many
+
+ROUNDS = 50
+
+
+@contextmanager
+def count_statements(session):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+class TestAccountInfoQueries:
+
+    def test_get_account_info_is_one_statement(self, database_session):
+        with database_session() as session:
+            user_id = session.query(TapirUser.user_id).order_by(TapirUser.user_id).limit(1).scalar()
+            assert user_id is not None
+
+            with count_statements(session) as statements:
+                for _ in range(ROUNDS):
+                    info = get_account_info(session, str(user_id))
+
+            assert info is not None
+            assert str(user_id) == info.id
+            # One statement per call
+            assert ROUNDS == len(statements)
+
+    def test_get_account_info_many_matches(self, database_session):
+        with database_session() as session:
+            user_ids = [str(row.user_id) for row in
+                        session.query(TapirUser.user_id).order_by(TapirUser.user_id).limit(20).all()]
+
+            with count_statements(session) as statements:
+                many = get_account_info_many(session, user_ids)
+            # users, moderators, categories, orcid ids, author ids
+            assert len(statements) <= 5
+
+            for user_id, info in zip(user_ids, many):
+                assert get_account_info(session, user_id) == info
@@ -0,0 +1,105 @@
+import csv
+import io
+import json
+import time
+
+import pytest
+from arxiv.db.models import TapirSession, TapirUser
+from arxiv_bizlogic.audit_event import AdminAudit_ChangePassword, AdminAudit_SetBanned, admin_audit_events, \
+    admin_audit_row, insert_admin_audit_rows
+from arxiv_bizlogic.database import DatabaseSession
+
+
+@pytest.fixture(scope="module")
+def audit_rows(aaa_client):
+    """Three audit records of two users in a tapir session of their own, committed before the exports run"""
+    with DatabaseSession() as session:
+        admin_user, user_1, user_2 = [str(user_id) for user_id in
+                                      session.query(TapirUser.user_id).order_by(TapirUser.user_id).limit(3).scalars()]
+        now = int(time.time())
+        tapir_session = TapirSession(user_id=int(admin_user), last_reissue=now, start_time=now, end_time=0)
+        session.add(tapir_session)
+        session.flush()
+        session_id = str(tapir_session.session_id)
+        events = [
+            AdminAudit_ChangePassword(admin_user, user_1, session_id, comment="export test 1"),
+            AdminAudit_SetBanned(admin_user, user_1, session_id, True, comment="export test 2"),
+            AdminAudit_ChangePassword(admin_user, user_2, session_id, comment="export test 3"),
+        ]
+        admin_audit_events(session, events)
+        session.commit()
+    return events
+
+
+def test_audit_export_requires_admin(aaa_client):
+    response = aaa_client.get("/audit/export")
+    assert response.status_code == 401
+
+
+def test_audit_export_ndjson_and_resume(aaa_client, aaa_api_headers, audit_rows):
+    response = aaa_client.get("/audit/export", headers=aaa_api_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines() if line]
+    entry_ids = [row["entry_id"] for row in rows]
+    assert len(rows) >= len(audit_rows)
+    assert entry_ids == sorted(entry_ids)
+
+    resumed = aaa_client.get("/audit/export", params={"after_entry_id": entry_ids[0]}, headers=aaa_api_headers)
+    assert resumed.status_code == 200
+    resumed_ids = [json.loads(line)["entry_id"] for line in resumed.text.splitlines() if line]
+    assert resumed_ids == entry_ids[1:]
+
+    session_id = audit_rows[0].session_id
+    seeded = aaa_client.get("/audit/export", params={"session_id": session_id}, headers=aaa_api_headers)
+    seeded_rows = [json.loads(line) for line in seeded.text.splitlines() if line]
+    assert [row["comment"] for row in seeded_rows] == ["export test 1", "export test 2", "export test 3"]
+
+    affected_user = audit_rows[0].affected_user
+    filtered = aaa_client.get("/audit/export", params={"affected_user": affected_user, "session_id": session_id},
+                              headers=aaa_api_headers)
+    filtered_rows = [json.loads(line) for line in filtered.text.splitlines() if line]
+    assert len(filtered_rows) == 2
+    assert all(str(row["affected_user"]) == str(affected_user) for row in filtered_rows)
+
+
+def test_audit_export_csv(aaa_client, aaa_api_headers, audit_rows):
+    response = aaa_client.get("/audit/export", params={"format": "csv"}, headers=aaa_api_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    reader = csv.DictReader(io.StringIO(response.text))
+    assert reader.fieldnames[:3] == ["entry_id", "log_date", "action"]
+    rows = list(reader)
+    assert len(rows) >= len(audit_rows)
+    for row in rows:
+        assert row["entry_id"].isdigit()
+
+
+def test_audit_export_undecodable_record(aaa_client, aaa_api_headers):
+    with DatabaseSession() as session:
+        admin_user, user_id = [str(user_id) for user_id in
+                               session.query(TapirUser.user_id).order_by(TapirUser.user_id).limit(2).scalars()]
+        now = int(time.time())
+        tapir_session = TapirSession(user_id=int(admin_user), last_reissue=now, start_time=now, end_time=0)
+        session.add(tapir_session)
+        session.flush()
+        session_id = str(tapir_session.session_id)
+        good = admin_audit_row(AdminAudit_ChangePassword(admin_user, user_id, session_id, comment="decodes"))
+        bad = dict(good, action="no-such-action", data="raw data", comment="does not decode")
+        insert_admin_audit_rows(session, [bad, good])
+        session.commit()
+
+    for format in ["ndjson", "csv"]:
+        response = aaa_client.get("/audit/export", params={"session_id": session_id, "format": format},
+                                  headers=aaa_api_headers)
+        assert response.status_code == 200
+        if format == "csv":
+            rows = list(csv.DictReader(io.StringIO(response.text)))
+        else:
+            rows = [json.loads(line) for line in response.text.splitlines() if line]
+        # The stream goes on past the bad record
+        assert [row["comment"] for row in rows] == ["does not decode", "decodes"]
+        assert rows[0]["action"] == "no-such-action"
+        assert rows[0]["data"] == "raw data"
+        assert "no-such-action" in rows[0]["error"]
+        assert not rows[1].get("error")
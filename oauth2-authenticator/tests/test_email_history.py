@@ -0,0 +1,119 @@
+"""
+The materialized email history agrees with the union query it replaces.
+"""
+import time
+
+from arxiv.db.models import TapirSession, TapirUser
+from arxiv_bizlogic.audit_event import AdminAudit_ChangeEmail, admin_audit_row, insert_admin_audit_rows
+from arxiv_bizlogic.email_history import (
+    backfill_email_history,
+    create_email_history_table,
+    load_email_changes,
+    query_email_changes,
+    rebuild_email_history,
+    store_email_changes,
+)
+
+from arxiv_oauth2.biz.email_history_biz import EmailHistoryBiz, EmailChangeRequest, get_user_email_history, \
+    get_user_email_history_many, get_email_holders_history
+
+
+class TestEmailHistory:
+
+    def test_backfill_matches_union(self, database_session):
+        with database_session() as session:
+            create_email_history_table(session.get_bind())
+            user_ids = list(session.query(TapirUser.user_id).order_by(TapirUser.user_id).limit(20).scalars())
+            done, last_user_id = backfill_email_history(session, after_user_id=user_ids[0] - 1,
+                                                        batch_size=7, max_users=len(user_ids))
+            assert done == len(user_ids)
+            assert last_user_id == user_ids[-1]
+            for user_id in user_ids:
+                assert load_email_changes(session, user_id) == sorted(query_email_changes(session, user_id),
+                                                                      key=lambda change: change[0])
+
+    def test_change_request_is_appended(self, database_session):
+        with database_session() as session:
+            create_email_history_table(session.get_bind())
+            user = session.query(TapirUser).order_by(TapirUser.user_id).first()
+            user_id = str(user.user_id)
+            before = rebuild_email_history(session, user.user_id)
+
+            biz = EmailHistoryBiz(session, user_id)
+            biz.add_email_change_request(EmailChangeRequest(
+                user_id=user_id, new_email="history@example.com", remote_ip="127.0.0.1",
+                remote_hostname="localhost", email=user.email))
+            session.flush()
+
+            appended = load_email_changes(session, user.user_id)
+            assert len(appended) == len(before) + 1
+            assert appended[-1][2] == "history@example.com"
+            assert appended[-1][5] is False
+
+            # The record reads the same as a rebuild from the union query
+            materialized = get_user_email_history(session, user_id)
+            store_email_changes(session, user.user_id, query_email_changes(session, user.user_id))
+            rebuilt = get_user_email_history(session, user_id)
+            assert [entry.email for entry in materialized.change_history] == \
+                   [entry.email for entry in rebuilt.change_history]
+            session.rollback()
+
+    def test_batch_matches_single(self, database_session):
+        with database_session() as session:
+            create_email_history_table(session.get_bind())
+            user_ids = [str(user_id) for user_id in
+                        session.query(TapirUser.user_id).order_by(TapirUser.user_id).limit(30).scalars()]
+            histories = get_user_email_history_many(session, user_ids + ["999999999"])
+            assert [history.user_id for history in histories] == user_ids
+            for history in histories:
+                assert history == get_user_email_history(session, history.user_id)
+
+    def test_holders(self, database_session):
+        with database_session() as session:
+            create_email_history_table(session.get_bind())
+            user = session.query(TapirUser).order_by(TapirUser.user_id).first()
+            holders = get_email_holders_history(session, user.email)
+            assert str(user.user_id) in [history.user_id for history in holders]
+            assert get_email_holders_history(session, "nobody-ever@example.invalid") == []
+
+    def test_holders_of_legacy_admin_change(self, database_session):
+        with database_session() as session:
+            create_email_history_table(session.get_bind())
+            admin_id, user_id = session.query(TapirUser.user_id).order_by(TapirUser.user_id).limit(2).scalars()
+            now = int(time.time())
+            tapir_session = TapirSession(user_id=admin_id, last_reissue=now, start_time=now, end_time=0)
+            session.add(tapir_session)
+            session.flush()
+            try:
+                # The legacy records have "old new" in the data
+                row = admin_audit_row(AdminAudit_ChangeEmail(str(admin_id), str(user_id),
+                                                             str(tapir_session.session_id),
+                                                             email="legacy_new@example.invalid"))
+                row["data"] = "legacy_old@example.invalid legacy_new@example.invalid"
+                insert_admin_audit_rows(session, [row])
+
+                for email in ["legacy_old@example.invalid", "legacy_new@example.invalid"]:
+                    assert str(user_id) in [history.user_id for history in get_email_holders_history(session, email)]
+                # Not a LIKE pattern
+                assert get_email_holders_history(session, "legacy%old@example.invalid") == []
+                assert get_email_holders_history(session, "legacyXold@example.invalid") == []
+            finally:
+                session.rollback()
+
+
+def test_email_history_endpoints(aaa_client, aaa_api_headers):
+    assert aaa_client.post("/account/email/history", json={"user_ids": ["1"]}).status_code == 401
+    assert aaa_client.get("/account/email/holders", params={"email": "a@example.com"}).status_code == 401
+
+    response = aaa_client.get("/account/identifier/?username=user0001", headers=aaa_api_headers)
+    user_id = response.json()["user_id"]
+
+    response = aaa_client.post("/account/email/history", json={"user_ids": [user_id]}, headers=aaa_api_headers)
+    assert response.status_code == 200
+    histories = response.json()
+    assert [history["user_id"] for history in histories] == [user_id]
+
+    email = histories[0]["current"]["email"]
+    response = aaa_client.get("/account/email/holders", params={"email": email}, headers=aaa_api_headers)
+    assert response.status_code == 200
+    assert user_id in [history["user_id"] for history in response.json()]
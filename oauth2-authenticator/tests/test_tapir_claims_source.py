@@ -0,0 +1,113 @@
+"""
+The user claims of a tapir cookie from the fused query (load_tapir_claims_source) against the ones from
+the queries it replaced - TapirUser, TapirSession, UserModel.one_user and user_model_to_auth_response.
+"""
+from datetime import datetime, timedelta, UTC
+from unittest import mock
+
+from arxiv.auth.user_claims import ArxivUserClaims, ArxivUserClaimsModel
+from arxiv.db.models import Demographic, TapirSession, TapirUser, t_arXiv_moderators
+from sqlalchemy import select
+
+from arxiv_bizlogic.bizmodels import tapir_to_user_claims
+from arxiv_bizlogic.bizmodels.tapir_to_kc_mapping import user_model_to_auth_response
+from arxiv_bizlogic.bizmodels.tapir_to_user_claims import create_user_claims_from_tapir_cookie, load_tapir_claims_source
+from arxiv_bizlogic.bizmodels.user_model import UserModel
+from arxiv_bizlogic.fastapi_helpers import datetime_to_epoch
+
+
+def baseline_claims(session, user_id: int, session_id: int, expires_at: datetime) -> ArxivUserClaims:
+    """What create_user_claims_from_tapir_cookie made before the fused query"""
+    tapir_user = session.query(TapirUser).filter(TapirUser.user_id == user_id).one()
+    tapir_session = session.query(TapirSession).filter(TapirSession.session_id == session_id).one()
+    user = UserModel.one_user(session, str(user_id))
+    auth_response = user_model_to_auth_response(user, tapir_user)
+    return ArxivUserClaims(ArxivUserClaimsModel(
+        sub=str(user_id),
+        exp=datetime_to_epoch(None, expires_at),
+        iat=int(tapir_session.start_time),
+        roles=auth_response.roles,
+        email_verified=auth_response.emailVerified,
+        email=str(auth_response.email),
+        first_name=auth_response.firstName,
+        last_name=auth_response.lastName,
+        username=auth_response.username,
+        ts_id=int(session_id),
+        sid="keycloak-session-id-is-not-available"
+    ))
+
+
+def fused_claims(session, user_id: int, session_id: int, expires_at: datetime) -> ArxivUserClaims:
+    cookie = (str(session_id), str(user_id), "127.0.0.1", datetime.now(tz=UTC), expires_at, "6")
+    with mock.patch.object(tapir_to_user_claims, "unpack", return_value=cookie):
+        claims = create_user_claims_from_tapir_cookie(session, "tapir-cookie")
+    assert claims is not None
+    return claims
+
+
+def start_session(session, user_id: int) -> int:
+    """A tapir session for the user. Flushed, never committed."""
+    now = int(datetime.now(tz=UTC).timestamp())
+    tapir_session = TapirSession(user_id=user_id, last_reissue=now, start_time=now, end_time=0)
+    session.add(tapir_session)
+    session.flush()
+    return tapir_session.session_id
+
+
+def assert_same_claims(session, user_id: int):
+    session_id = start_session(session, user_id)
+    expires_at = datetime.now(tz=UTC) + timedelta(hours=1)
+    source = load_tapir_claims_source(session, user_id, session_id)
+    assert source is not None
+    baseline = baseline_claims(session, user_id, session_id, expires_at)
+    fused = fused_claims(session, user_id, session_id, expires_at)
+    assert baseline._claims == fused._claims
+    return source
+
+
+class TestTapirClaimsSource:
+
+    def test_normal_user(self, database_session):
+        with database_session() as session:
+            user_id = session.scalar(
+                select(TapirUser.user_id)
+                .join(Demographic, Demographic.user_id == TapirUser.user_id)
+                .where(TapirUser.flag_edit_users == 0, TapirUser.flag_deleted == 0,
+                       ~TapirUser.user_id.in_(select(t_arXiv_moderators.c.user_id)))
+                .order_by(TapirUser.user_id).limit(1))
+            assert user_id is not None
+            try:
+                source = assert_same_claims(session, user_id)
+                assert not source.flag_is_mod
+            finally:
+                session.rollback()
+
+    def test_moderator(self, database_session):
+        with database_session() as session:
+            user_id = session.scalar(select(t_arXiv_moderators.c.user_id)
+                                     .join(TapirUser, TapirUser.user_id == t_arXiv_moderators.c.user_id)
+                                     .order_by(t_arXiv_moderators.c.user_id).limit(1))
+            assert user_id is not None
+            try:
+                source = assert_same_claims(session, user_id)
+                assert source.flag_is_mod
+            finally:
+                session.rollback()
+
+    def test_user_without_demographic(self, database_session):
+        with database_session() as session:
+            user_id = session.scalar(select(Demographic.user_id).order_by(Demographic.user_id).limit(1))
+            assert user_id is not None
+            try:
+                # Gone for this transaction only
+                session.execute(Demographic.__table__.delete().where(Demographic.user_id == user_id))
+                session.expire_all()
+                source = assert_same_claims(session, user_id)
+                assert not (source.flag_proxy or source.flag_xml or source.flag_suspect)
+            finally:
+                session.rollback()
+
+    def test_unknown_session(self, database_session):
+        with database_session() as session:
+            user_id = session.scalar(select(TapirUser.user_id).order_by(TapirUser.user_id).limit(1))
+            assert load_tapir_claims_source(session, user_id, 0) is None
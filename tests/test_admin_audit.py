@@ -4,8 +4,12 @@ from unittest.mock import Mock, patch
 from unittest import TestCase
 
 from arxiv.db.models import TapirAdminAudit
+from sqlalchemy import select
 from bizlogic.arxiv_bizlogic.audit_event import (
     create_admin_audit_event,
+    create_admin_audit_events,
+    admin_audit,
+    admin_audit_events,
     AdminAuditActionEnum,
     AdminAudit_AddPaperOwner,
     AdminAudit_AddPaperOwner2,
@@ -416,6 +420,84 @@ class TestCreateAdminAuditEvent(TestCase):
         assert event.comment == ""
 
 
+class TestCreateAdminAuditEvents(TestCase):
+    """Test suite for the bulk create_admin_audit_events function."""
+
+    def test_bulk_decodes_binary_columns_in_one_query(self):
+        """Comment and data come from the BLOB columns of the same row, UTF-8 decoded."""
+        records = [
+            create_base_audit_record(entry_id=1, action=AdminAuditActionEnum.CHANGE_PASSWORD.value,
+                                     data="garbled data", comment="garbled"),
+            create_base_audit_record(entry_id=2, action=AdminAuditActionEnum.CHANGE_EMAIL.value,
+                                     data="new@example.com", comment="latin1"),
+        ]
+        session = Mock()
+        session.execute.return_value = iter([
+            (records[0], "コメント".encode("utf-8"), "データ".encode("utf-8")),
+            (records[1], b"\xff\xfe", None),
+        ])
+
+        events = list(create_admin_audit_events(session, select(TapirAdminAudit)))
+
+        assert session.execute.call_count == 1
+        assert isinstance(events[0], AdminAudit_ChangePassword)
+        assert events[0].comment == "コメント"
+        assert events[0].data == "データ"
+        assert isinstance(events[1], AdminAudit_ChangeEmail)
+        # Not UTF-8 - falls back to the value read through the column charset
+        assert events[1].comment == "latin1"
+        # The email is a constructor parameter, not "data", so it is taken from the record as is
+        assert events[1].data == "new@example.com"
+
+    def test_bulk_is_lazy(self):
+        """Events are created as the rows are consumed."""
+        session = Mock()
+        session.execute.return_value = iter([
+            (create_base_audit_record(action="invalid-action"), None, None),
+        ])
+        events = create_admin_audit_events(session, select(TapirAdminAudit))
+        session.execute.assert_not_called()
+        with pytest.raises(ValueError, match="invalid-action is not a valid admin action"):
+            next(events)
+
+
+class TestAdminAuditWrite(TestCase):
+    """Test suite for the admin_audit write path."""
+
+    def _session(self):
+        session = Mock()
+        session.bind.dialect.name = "sqlite"
+        session.execute.return_value.inserted_primary_key = (42,)
+        return session
+
+    def test_admin_audit_is_one_insert(self):
+        session = self._session()
+        event = AdminAudit_ChangePassword("100", "200", "12345", comment="コメント")
+        entry = admin_audit(session, event)
+        assert session.execute.call_count == 1
+        session.add.assert_not_called()
+        session.flush.assert_not_called()
+        assert entry.entry_id == 42
+        assert entry.comment == "コメント"
+        assert entry.affected_user == 200
+
+    def test_admin_audit_events_is_one_multi_row_insert(self):
+        session = self._session()
+        events = [
+            AdminAudit_SetEditUsers("100", "200", "12345", True),
+            AdminAudit_SetEditSystem("100", "200", "12345", False),
+        ]
+        assert admin_audit_events(session, events) == 2
+        assert session.execute.call_count == 1
+        statement = session.execute.call_args[0][0]
+        assert len(statement._multi_values[0]) == 2
+
+    def test_admin_audit_events_nothing_to_write(self):
+        session = self._session()
+        assert admin_audit_events(session, []) == 0
+        session.execute.assert_not_called()
+
+
 class TestAdminAuditEventClasses:
     """Test individual AdminAudit event classes."""
     
@@ -541,6 +623,20 @@ class TestAdminAuditEventSetFlagClasses:
         assert isinstance(event, AdminAudit_SetPointValue)
         assert event.action == AdminAuditActionEnum.FLIP_FLAG
         assert event.data == "arXiv_endorsements.point_value=5"
+
+    def test_set_point_value_validated(self):
+        """Negative point values decode, non-numbers are refused."""
+        audit_record = create_base_audit_record(
+            action=AdminAuditActionEnum.FLIP_FLAG.value,
+            data="arXiv_endorsements.point_value=-10",
+        )
+        assert create_admin_audit_event(audit_record).data == "arXiv_endorsements.point_value=-10"
+
+        for data in ["arXiv_endorsements.point_value=abc", "arXiv_endorsements.point_value=1.5",
+                     "arXiv_endorsements.point_value="]:
+            audit_record = create_base_audit_record(action=AdminAuditActionEnum.FLIP_FLAG.value, data=data)
+            with pytest.raises(ValueError):
+                create_admin_audit_event(audit_record)
     
     def test_set_endorsement_requests_valid_event(self):
         """Test creating AdminAudit_SetEndorsementRequestsValid event."""
@@ -0,0 +1,85 @@
+"""
+Microbenchmark of decoding audit records, as a compliance export does.
+
+Compares events/second of the compiled decoder table against going through get_init_params and the
+constructors for every record. The timing is opt in:
+
+    RUN_BENCHMARKS=1 pytest tests/test_admin_audit_decode_benchmark.py
+"""
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from bizlogic.arxiv_bizlogic.audit_event import (
+    AdminAuditActionEnum,
+    admin_audit_decoders,
+    admin_audit_flip_flag_instantiator,
+    event_classes,
+    _constructor_decoder,
+    _instantiate_admin_audit_event,
+)
+
+RECORDS = 50_000
+MIN_SPEEDUP = 1.5
+
+# Roughly the mix of the audit log - mostly flag flips
+TEMPLATES = [
+    (AdminAuditActionEnum.FLIP_FLAG.value, "tapir_users.flag_banned=1"),
+    (AdminAuditActionEnum.FLIP_FLAG.value, "tapir_users.flag_email_verified=0"),
+    (AdminAuditActionEnum.FLIP_FLAG.value, "arXiv_demographics.flag_suspect=1"),
+    (AdminAuditActionEnum.CHANGE_PASSWORD.value, ""),
+    (AdminAuditActionEnum.ADD_PAPER_OWNER.value, "1234567"),
+    (AdminAuditActionEnum.CHANGE_EMAIL.value, "someone@example.com"),
+    (AdminAuditActionEnum.MAKE_MODERATOR.value, "cs.AI"),
+]
+
+
+def make_records(count: int) -> list:
+    return [
+        SimpleNamespace(
+            entry_id=n, log_date=1700000000 + n, session_id=12345, ip_addr="192.168.1.1",
+            remote_host="test.example.com", admin_user=100, affected_user=200 + n % 1000,
+            tracking_cookie="cookie", action=TEMPLATES[n % len(TEMPLATES)][0],
+            data=TEMPLATES[n % len(TEMPLATES)][1], comment="comment")
+        for n in range(count)
+    ]
+
+
+def constructor_decode(audit_record):
+    """What every record went through before the decoder table"""
+    if audit_record.action == AdminAuditActionEnum.FLIP_FLAG.value:
+        return admin_audit_flip_flag_instantiator(audit_record)
+    return _constructor_decoder(event_classes[audit_record.action])(audit_record, None, None, False)
+
+
+def events_per_second(decode, records) -> float:
+    started = time.perf_counter()
+    for record in records:
+        decode(record)
+    return len(records) / (time.perf_counter() - started)
+
+
+class TestAdminAuditDecodeBenchmark:
+
+    def test_decoders_agree(self):
+        for record in make_records(len(TEMPLATES)):
+            compiled = _instantiate_admin_audit_event(record)
+            constructed = constructor_decode(record)
+            assert type(compiled) is type(constructed)
+            assert compiled.data == constructed.data
+            assert compiled.comment == constructed.comment
+            assert compiled.timestamp == constructed.timestamp
+            assert compiled.entry_id == record.entry_id
+
+    def test_every_action_has_decoder(self):
+        assert set(admin_audit_decoders) == set(event_classes)
+
+    @pytest.mark.skipif(not os.environ.get("RUN_BENCHMARKS"), reason="Timing benchmark - set RUN_BENCHMARKS=1")
+    def test_decode_throughput(self):
+        records = make_records(RECORDS)
+        baseline = events_per_second(constructor_decode, records)
+        compiled = events_per_second(_instantiate_admin_audit_event, records)
+        # Around 2.5x on a quiet machine. Well below that so a busy CI runner does not fail it.
+        assert compiled / baseline > MIN_SPEEDUP
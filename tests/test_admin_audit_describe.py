@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import Mock
+
+from bizlogic.arxiv_bizlogic.audit_event import (
+    AdminAudit_AddPaperOwner,
+    AdminAudit_ChangePassword,
+)
+from bizlogic.arxiv_bizlogic.audit_describe import AuditDescriptionResolver
+
+
+def query_result(rows):
+    result = Mock()
+    result.all.return_value = rows
+    return result
+
+
+class TestAuditDescriptionResolver(TestCase):
+
+    def test_page_is_two_queries(self):
+        events = [
+            AdminAudit_ChangePassword("100", "200", "12345"),
+            AdminAudit_AddPaperOwner("100", "201", "12345", document_id="555"),
+            AdminAudit_ChangePassword("100", "999", "12345"),
+        ]
+        session = Mock()
+        session.execute.side_effect = [
+            query_result([
+                SimpleNamespace(user_id=100, first_name="Admin".encode("utf-8"), last_name=b"User", nickname="admin"),
+                SimpleNamespace(user_id=200, first_name="めい".encode("utf-8"), last_name=b"<b>", nickname=None),
+                SimpleNamespace(user_id=201, first_name=b"Paper", last_name=b"Owner", nickname="owner"),
+            ]),
+            query_result([SimpleNamespace(document_id=555, paper_id="2101.00001")]),
+        ]
+
+        descriptions = AuditDescriptionResolver().describe_events(session, events)
+
+        assert session.execute.call_count == 2
+        assert descriptions[0] == "Admin User (admin) changed password of めい &lt;b&gt;"
+        assert "Paper Owner (owner) an owner of paper" in descriptions[1]
+        assert ">2101.00001</a>" in descriptions[1]
+        # Unknown user - the placeholder stays
+        assert "{user[999]}" in descriptions[2]
+
+    def test_cached(self):
+        resolver = AuditDescriptionResolver()
+        session = Mock()
+        session.execute.return_value = query_result([
+            SimpleNamespace(user_id=100, first_name=b"Admin", last_name=b"User", nickname=None),
+            SimpleNamespace(user_id=200, first_name=b"Some", last_name=b"One", nickname=None),
+        ])
+        event = AdminAudit_ChangePassword("100", "200", "12345")
+        resolver.describe_events(session, [event])
+        resolver.describe_events(session, [event])
+        assert session.execute.call_count == 1
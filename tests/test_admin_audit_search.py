@@ -0,0 +1,69 @@
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from sqlalchemy.dialects import mysql
+
+from bizlogic.arxiv_bizlogic.audit_event import AdminAudit_ChangePassword
+from bizlogic.arxiv_bizlogic.audit_search import (
+    AdminAuditFilter,
+    admin_audit_select,
+    search_admin_audit,
+    check_admin_audit_indexes,
+    encode_audit_cursor,
+    decode_audit_cursor,
+)
+
+
+def compile_sql(statement) -> str:
+    return str(statement.compile(dialect=mysql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def make_event(log_date: int, entry_id: int) -> AdminAudit_ChangePassword:
+    event = AdminAudit_ChangePassword("100", "200", "12345", timestamp=log_date)
+    event.entry_id = entry_id
+    return event
+
+
+class TestAdminAuditSearch(TestCase):
+
+    def test_filters(self):
+        sql = compile_sql(admin_audit_select(AdminAuditFilter(
+            affected_user=200, admin_user=100, actions=["change-email", "flip-flag"], session_id=12345,
+            since=1000, until=2000)))
+        assert "tapir_admin_audit.affected_user = 200" in sql
+        assert "tapir_admin_audit.admin_user = 100" in sql
+        assert "tapir_admin_audit.action IN ('change-email', 'flip-flag')" in sql
+        assert "tapir_admin_audit.session_id = 12345" in sql
+        assert "tapir_admin_audit.log_date >= 1000" in sql
+        assert "tapir_admin_audit.log_date < 2000" in sql
+        assert "ORDER BY tapir_admin_audit.log_date DESC, tapir_admin_audit.entry_id DESC" in sql
+        assert "OFFSET" not in sql
+
+    def test_keyset_cursor(self):
+        assert decode_audit_cursor(encode_audit_cursor(1700000000, 42)) == (1700000000, 42)
+        sql = compile_sql(admin_audit_select(AdminAuditFilter(), cursor=encode_audit_cursor(1700000000, 42)))
+        assert ("tapir_admin_audit.log_date < 1700000000 OR "
+                "tapir_admin_audit.log_date = 1700000000 AND tapir_admin_audit.entry_id < 42") in sql
+
+    def test_page_and_next_cursor(self):
+        events = [make_event(300, 3), make_event(200, 2), make_event(200, 1)]
+        with patch("bizlogic.arxiv_bizlogic.audit_search.create_admin_audit_events", return_value=iter(events)):
+            page = search_admin_audit(Mock(), AdminAuditFilter(affected_user=200), limit=2)
+        assert [event.entry_id for event in page.events] == [3, 2]
+        assert page.next_cursor == encode_audit_cursor(200, 2)
+
+        with patch("bizlogic.arxiv_bizlogic.audit_search.create_admin_audit_events", return_value=iter(events[2:])):
+            page = search_admin_audit(Mock(), AdminAuditFilter(affected_user=200), cursor=page.next_cursor, limit=2)
+        assert [event.entry_id for event in page.events] == [1]
+        assert page.next_cursor is None
+
+    def test_index_check(self):
+        inspector = Mock()
+        inspector.get_indexes.return_value = [
+            {"name": "affected_user", "column_names": ["affected_user", "log_date"]},
+            {"name": "log_date", "column_names": ["log_date"]},
+            {"name": "admin_user", "column_names": ["admin_user"]},
+        ]
+        with patch("bizlogic.arxiv_bizlogic.audit_search.inspect", return_value=inspector):
+            missing = check_admin_audit_indexes(Mock())
+        assert missing == [("admin_user", "log_date"), ("session_id", "log_date"), ("action", "log_date")]
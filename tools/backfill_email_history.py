@@ -0,0 +1,34 @@
+"""
+Backfill arXiv_email_history, the materialized email change history, from the token tables and the admin audit.
+
+Safe to rerun. An interrupted run resumes with --after-user-id set to the last user id it logged.
+"""
+import argparse
+import logging
+
+from sqlalchemy.orm import Session
+
+from arxiv_bizlogic.email_history import create_email_history_table, backfill_email_history
+from load_test_data import instantiate_db_engine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--after-user-id", type=int, default=0, help="Start after this user id")
+    parser.add_argument("--batch-size", type=int, default=500, help="Users per query and per commit")
+    parser.add_argument("--max-users", type=int, default=None, help="Stop after this many users")
+    args = parser.parse_args()
+
+    db_engine, _tables = instantiate_db_engine()
+    create_email_history_table(db_engine)
+    with Session(db_engine) as session:
+        done, last_user_id = backfill_email_history(session, after_user_id=args.after_user_id,
+                                                    batch_size=args.batch_size, max_users=args.max_users)
+    logger.info("Done: %d users, last user id %d", done, last_user_id)
+
+
+if __name__ == '__main__':
+    main()